@@ -0,0 +1,107 @@
+"""Rows/sec of record -> domain object conversion, before (inspect + __init__ + setattr per column)
+and after (generated per-class hydrator), on synthetic OrientRecords
+
+    python -m examples.hydration_benchmark [rows]
+"""
+import inspect
+import sys
+import time
+
+from pyorient import OrientRecord
+
+from orientus.core.datatypes import RawType, OString, OInteger, ODouble, OBoolean, OLong
+from orientus.core.domain import OVertex
+from orientus.core.utils import to_datatype_obj
+from orientus.tests.data import Token
+
+
+class Measurement(OVertex):
+    ___vertex_name__ = 'Measurement'
+
+    name = OString(name='name')
+    unit = OString(name='unit')
+    sensor = OInteger(name='sensor')
+    value = ODouble(name='value')
+    minimum = ODouble(name='minimum')
+    maximum = ODouble(name='maximum')
+    valid = OBoolean(name='valid')
+    taken_at = OLong(name='taken_at')
+
+
+class SlottedMeasurement(OVertex):
+    ___vertex_name__ = 'SlottedMeasurement'
+    __slots__ = ('name', 'unit', 'sensor', 'value', 'minimum', 'maximum', 'valid', 'taken_at')
+
+    name = OString(name='name')
+    unit = OString(name='unit')
+    sensor = OInteger(name='sensor')
+    value = ODouble(name='value')
+    minimum = ODouble(name='minimum')
+    maximum = ODouble(name='maximum')
+    valid = OBoolean(name='valid')
+    taken_at = OLong(name='taken_at')
+
+
+def legacy_to_datatype_obj(class_type, records):
+    """to_datatype_obj as it was before the generated hydrators"""
+    attributes = inspect.getmembers(class_type, lambda a: not (inspect.isroutine(a)))
+    domain_variables = [(name, v) for (name, v) in attributes
+                        if not (name.startswith('__') and name.endswith('__'))
+                        and v.__class__ != RawType and issubclass(v.__class__, RawType)]
+    column_name_vs_var_name = {datatype.name: name for (name, datatype) in domain_variables}
+
+    obj_list = []
+
+    for record in records:
+        instance = class_type()
+
+        instance._version = record._version
+        instance._rid = record._rid
+
+        for key, value in record.oRecordData.items():
+            if column_name_vs_var_name.get(key) is not None:
+                setattr(instance, column_name_vs_var_name.get(key), value)
+
+        obj_list.append(instance)
+
+    return obj_list
+
+
+def make_records(rows, data):
+    return [OrientRecord(dict(__o_storage=data(i), __o_class='V', __version=1, __rid='#9:%s' % i))
+            for i in range(rows)]
+
+
+def rows_per_sec(convert, class_type, records, repeat=3):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(class_type, records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(records) / best
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    tokens = make_records(rows, lambda i: {'text': 'token%s' % i, 'new_text': 'TOKEN%s' % i})
+    measurements = make_records(rows, lambda i: {'name': 'temperature', 'unit': 'C', 'sensor': i % 64,
+                                                 'value': i * 0.5, 'minimum': -40.0, 'maximum': 125.0,
+                                                 'valid': True, 'taken_at': 1500000000000 + i,
+                                                 'in_Reading': None})
+
+    print('%-20s %14s %14s %8s' % ('class', 'before rows/s', 'after rows/s', 'speedup'))
+
+    for class_type, records in [(Token, tokens), (Measurement, measurements), (SlottedMeasurement, measurements)]:
+        after = rows_per_sec(to_datatype_obj, class_type, records)
+
+        if class_type is SlottedMeasurement:
+            # the old code path can't build __slots__ domain classes at all
+            print('%-20s %14s %14.0f %8s' % (class_type.__name__, '-', after, '-'))
+            continue
+
+        before = rows_per_sec(legacy_to_datatype_obj, class_type, records)
+        print('%-20s %14.0f %14.0f %7.1fx' % (class_type.__name__, before, after, after / before))
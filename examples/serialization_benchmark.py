@@ -0,0 +1,84 @@
+"""Rows/sec of decoding record contents into OrientRecords, CSV (pyorient) against binary serialization
+(BinaryRecordSerializer + new_record), alone and followed by hydration, on synthetic payloads
+
+    python -m examples.serialization_benchmark [rows]
+"""
+import sys
+import time
+
+from pyorient import OrientRecord
+from pyorient.serializations import OrientSerializationCSV
+
+from examples.hydration_benchmark import Measurement
+from orientus.core.messages import encode_csv_value
+from orientus.core.records import new_record
+from orientus.core.serialization import BinaryRecordSerializer, encode_record
+from orientus.core.utils import to_datatype_obj
+from orientus.tests.data import Token
+
+
+def csv_content(class_name, data):
+    return ('%s@%s' % (class_name, ','.join('%s:%s' % (k, encode_csv_value(v)) for k, v in data.items()))).encode()
+
+
+def decode_csv(contents):
+    records = []
+
+    for position, content in enumerate(contents):
+        # as pyorient's CommandMessage._read_record()
+        class_name, data = OrientSerializationCSV().decode(content.rstrip())
+        records.append(OrientRecord(dict(__o_storage=data, __o_class=class_name, __version=1,
+                                         __rid='#9:%s' % position)))
+
+    return records
+
+
+def decode_binary(contents):
+    decode = BinaryRecordSerializer().decode
+
+    records = []
+    for position, content in enumerate(contents):
+        class_name, data = decode(content)
+        records.append(new_record(class_name, data, 1, '#9:%s' % position))
+
+    return records
+
+
+def rows_per_sec(convert, contents, repeat=3):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(contents)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(contents) / best
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    payloads = [
+        (Token, lambda i: {'text': 'token%s' % i, 'new_text': 'TOKEN%s' % i}),
+        (Measurement, lambda i: {'name': 'temperature', 'unit': 'C', 'sensor': i % 64, 'value': i * 0.5,
+                                 'minimum': -40.0, 'maximum': 125.0, 'valid': True,
+                                 'taken_at': 1500000000000 + i, 'tags': ['indoor', 'floor%s' % (i % 8)]}),
+    ]
+
+    print('%-24s %14s %14s %8s' % ('payload', 'csv rows/s', 'binary rows/s', 'speedup'))
+
+    for class_type, data in payloads:
+        name = class_type.__name__
+        csv = [csv_content(name, data(i)) for i in range(rows)]
+        binary = [encode_record(data(i), name) for i in range(rows)]
+
+        assert decode_csv(csv[:1])[0].oRecordData == decode_binary(binary[:1])[0].oRecordData
+
+        for label, csv_convert, binary_convert in [
+            (name, decode_csv, decode_binary),
+            (name + ' + hydration', lambda c: to_datatype_obj(class_type, decode_csv(c)),
+             lambda c: to_datatype_obj(class_type, decode_binary(c)))]:
+            before = rows_per_sec(csv_convert, csv)
+            after = rows_per_sec(binary_convert, binary)
+            print('%-24s %14.0f %14.0f %7.1fx' % (label, before, after, after / before))
@@ -0,0 +1,158 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, Iterable, Set
+
+
+class LRUCache:
+    """Thread-safe, size bounded mapping evicting the least recently used entry"""
+
+    def __init__(self, max_size: int = 512):
+        assert max_size > 0
+
+        self.max_size = max_size
+
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryCache:
+    """Thread-safe query result cache, entries expire after `ttl` seconds or when the least recently used
+
+    Every entry is tagged with the database classes its query reads, `invalidate()` drops the entries of
+    the classes a write touched. A result read before a write but put after it would survive the
+    invalidation, so `put()` takes the `stamp()` of its classes taken before the query and drops stale ones.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        assert max_size > 0
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = Lock()
+        # key -> (expiry, classes, value)
+        self._entries = OrderedDict()
+        self._keys_by_class: Dict[str, Set[Hashable]] = {}
+        # invalidations per class and clears, they only grow
+        self._writes: Dict[str, int] = {}
+        self._clears = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[2]
+
+    def stamp(self, classes: Iterable[str]) -> int:
+        """Returns the invalidation count of `classes`, it changes with every invalidation of any of them"""
+        with self._lock:
+            return self._stamp(classes)
+
+    def put(self, key: Hashable, value, classes: Iterable[str], stamp: int = None):
+        """Caches `value`, unless `classes` were invalidated since `stamp` was taken"""
+        classes = frozenset(classes)
+
+        with self._lock:
+            if stamp is not None and self._stamp(classes) != stamp:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, classes, value)
+
+            for class_name in classes:
+                self._keys_by_class.setdefault(class_name, set()).add(key)
+
+            if len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, classes: Iterable[str]) -> int:
+        """Drops the entries reading any of `classes`, returns their count"""
+        with self._lock:
+            keys = set()
+            for class_name in classes:
+                keys.update(self._keys_by_class.get(class_name, ()))
+                self._writes[class_name] = self._writes.get(class_name, 0) + 1
+
+            for key in keys:
+                self._remove(key)
+
+            self.invalidations += len(keys)
+
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_class.clear()
+            self._clears += 1
+
+    def _stamp(self, classes: Iterable[str]) -> int:
+        return self._clears + sum(self._writes.get(class_name, 0) for class_name in classes)
+
+    def _remove(self, key: Hashable):
+        """Removes `key` and its class tags, lock must be held"""
+        _, classes, _ = self._entries.pop(key)
+
+        for class_name in classes:
+            keys = self._keys_by_class.get(class_name)
+            keys.discard(key)
+
+            if not keys:
+                del self._keys_by_class[class_name]
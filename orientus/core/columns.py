@@ -0,0 +1,148 @@
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+from pyorient import OrientRecord
+
+from orientus.core.datatypes import OBoolean, ODatetime, ODouble, OFloat, OInteger, OLong, OShort, RawType
+from orientus.core.records import record_data
+from orientus.core.schema import FieldDescriptor
+
+# fixed size types are kept in arrays, a value takes 1 to 8 bytes instead of a python object
+TYPECODES = {OBoolean: 'b', OShort: 'h', OInteger: 'i', OLong: 'q', OFloat: 'f', ODouble: 'd', ODatetime: 'q'}
+
+NUMPY_DTYPES = {'b': 'bool', 'h': 'int16', 'i': 'int32', 'q': 'int64', 'f': 'float32', 'd': 'float64'}
+
+
+def to_millis(value) -> int:
+    """Milliseconds since the epoch of a datetime, as the serializers write them"""
+    return int(round(value.timestamp() * 1000))
+
+
+class Column:
+    """Values of one field, in an array for the fixed size types (see TYPECODES) or a list for the others
+
+    Datetimes are stored as milliseconds since the epoch. A null row holds 0 in an array, its position
+    is kept in `nulls`. A value the array can't hold (schemaless data) turns the column into a list.
+    """
+
+    def __init__(self, field: FieldDescriptor):
+        self.field = field
+        self.typecode = TYPECODES.get(type(field.datatype))
+        self.is_datetime = isinstance(field.datatype, ODatetime)
+
+        self.values = array(self.typecode) if self.typecode else []
+        self.nulls = array('q')
+
+    def append(self, value):
+        if value is None:
+            self.nulls.append(len(self.values))
+            self.values.append(0 if self.typecode else None)
+            return
+
+        try:
+            if self.is_datetime and self.typecode:
+                value = to_millis(value)
+
+            self.values.append(value)
+        except (AttributeError, TypeError, OverflowError):
+            self._to_list()
+            self.values.append(value)
+
+    def _to_list(self):
+        values = [datetime.fromtimestamp(v / 1000) for v in self.values] if self.is_datetime else self.values.tolist()
+
+        for row in self.nulls:
+            values[row] = None
+
+        self.typecode = None
+        self.values = values
+
+    def to_numpy(self):
+        """The values as a numpy array, masked when there are null rows
+
+        Typed columns share the memory of the array, datetimes become datetime64[ms].
+        """
+        import numpy
+
+        if self.typecode is None:
+            return numpy.array(self.values, dtype=object)
+
+        values = numpy.frombuffer(self.values, dtype=NUMPY_DTYPES[self.typecode])
+        if self.is_datetime:
+            values = values.view('datetime64[ms]')
+
+        if not self.nulls:
+            return values
+
+        mask = numpy.zeros(len(values), dtype=bool)
+        mask[numpy.frombuffer(self.nulls, dtype='int64')] = True
+
+        return numpy.ma.MaskedArray(values, mask=mask)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.field.attr, self.typecode or 'list')
+
+
+class Columns:
+    """Query results of `record_cls` gathered per field instead of per record, see Session.query_columns
+
+    Only `fields` (class attributes like Token.text, all fields of the class by default) are kept,
+    `columns['text']` returns the values of a field by attribute name.
+    """
+
+    def __init__(self, record_cls, fields: List[RawType] = None):
+        self.record_cls = record_cls
+
+        schema_fields = record_cls.schema().fields
+        if fields:
+            # the class attribute returns the datatype, see SlotField
+            wanted = set(map(id, fields))
+            schema_fields = [field for field in schema_fields if id(field.datatype) in wanted]
+            assert len(schema_fields) == len(fields), 'fields must be fields of %s' % record_cls.__name__
+
+        self.columns: Dict[str, Column] = {field.attr: Column(field) for field in schema_fields}
+        self._by_column = [(column.field.column, column) for column in self.columns.values()]
+        self.rows = 0
+
+    def append(self, record: OrientRecord):
+        data = record_data(record)
+
+        for name, column in self._by_column:
+            column.append(data.get(name))
+
+        self.rows += 1
+
+    def extend(self, records: List[OrientRecord]):
+        for record in records:
+            self.append(record)
+
+    def nulls(self, attr: str) -> array:
+        """Rows of the field `attr` that are null"""
+        return self.columns[attr].nulls
+
+    def to_numpy(self) -> Dict:
+        """Numpy arrays of the fields by attribute name, see Column.to_numpy (numpy has to be installed)"""
+        return {attr: column.to_numpy() for attr, column in self.columns.items()}
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __getitem__(self, attr: str):
+        return self.columns[attr].values
+
+    def __contains__(self, attr: str):
+        return attr in self.columns
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.columns)
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return '%s(%s, %s rows, %s)' % (self.__class__.__name__, self.record_cls.__name__, self.rows,
+                                        list(self.columns.values()))
@@ -1,15 +1,80 @@
+from datetime import date, datetime
+from typing import List, Sequence
+
+
+def to_sql_literal(value) -> str:
+    """Renders a python value as an OrientDB SQL literal, for statements that can't carry bound parameters"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, RawType):
+        return value.name
+    if isinstance(value, str):
+        return "'%s'" % value.replace('\\', '\\\\').replace("'", "\\'")
+    if isinstance(value, datetime):
+        return "'%s'" % value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return "'%s'" % value.strftime('%Y-%m-%d')
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return '[%s]' % ', '.join(to_sql_literal(v) for v in value)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (to_sql_literal(str(k)), to_sql_literal(v)) for k, v in value.items())
+
+    # links and domain objects are rendered as their RID
+    if hasattr(value, 'get_hash'):
+        return value.get_hash()
+    if getattr(value, '_rid', None):
+        return value._rid
+
+    return str(value)
+
+
+def inline_params(statement: str, params: Sequence = None) -> str:
+    """Replaces positional `?` placeholders (outside of quoted strings) with the literal of their parameter"""
+    if not params:
+        return statement
+
+    values = iter(params)
+    parts = []
+    quote = None
+    escaped = False
+
+    for char in statement:
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '?':
+            char = to_sql_literal(next(values))
+
+        parts.append(char)
+
+    return ''.join(parts)
+
+
 class Clause:
-    def __init__(self, expr: str):
+    """SQL condition, values are kept apart from the expression as positional `?` parameters"""
+
+    def __init__(self, expr: str, params: List = None):
         self.expression = expr
+        self.params = params if params is not None else []
 
     def __repr__(self):
-        return self.expression
+        return inline_params(self.expression, self.params)
 
     def __and__(self, other):
-        return Clause("(%s AND %s)" % (self.expression, other.expression))
+        return Clause("(%s AND %s)" % (self.expression, other.expression), self.params + other.params)
 
     def __or__(self, other):
-        return Clause("(%s OR %s)" % (self.expression, other.expression))
+        return Clause("(%s OR %s)" % (self.expression, other.expression), self.params + other.params)
 
 
 class RawType:
@@ -33,37 +98,37 @@ class RawType:
 
     def __eq__(self, other):
         if other is None:
-            return Clause("%s IS %s" % (self.name, self.__get_other_value(other)))
+            return Clause("%s IS NULL" % (self.name))
 
-        return Clause("%s = %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('=', other)
 
     def __ne__(self, other):
         if other is None:
-            return Clause("%s IS NOT %s" % (self.name, self.__get_other_value(other)))
+            return Clause("%s IS NOT NULL" % (self.name))
 
-        return Clause("%s != %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('!=', other)
 
     def __lt__(self, other):
-        return Clause("%s < %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('<', other)
 
     def __le__(self, other):
-        return Clause("%s <= %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('<=', other)
 
     def __gt__(self, other):
-        return Clause("%s > %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('>', other)
 
     def __ge__(self, other):
-        return Clause("%s >= %s" % (self.name, self.__get_other_value(other)))
+        return self.__compare('>=', other)
 
-    def __get_other_value(self, other):
-        if other is None:
-            return 'NULL'
-        if isinstance(other, str):
-            return "'%s'" % (other)
+    def __hash__(self):
+        return id(self)
+
+    def __compare(self, operator: str, other) -> Clause:
+        # comparing two properties needs no parameter
         if isinstance(other, RawType):
-            return other.name
-        else:
-            return other
+            return Clause("%s %s %s" % (self.name, operator, other.name))
+
+        return Clause("%s %s ?" % (self.name, operator), [other])
 
 
 class OPrimaryKey(RawType):
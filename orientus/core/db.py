@@ -1,10 +1,41 @@
+import asyncio
+import re
+import struct
 import time
-from collections import deque
+from importlib import import_module
 from threading import Thread
-from typing import Deque, Mapping
+from typing import Callable, Dict, List, Mapping
 
 import pyorient
-from pyorient import OrientSocket, PyOrientWrongProtocolVersionException, OrientDB, OrientSerialization
+from pyorient import OrientSocket, PyOrientWrongProtocolVersionException, OrientDB, OrientSerialization, \
+    PyOrientConnectionException, PyOrientException
+from pyorient.constants import DB_TYPE_DOCUMENT, QUERY_ASYNC, QUERY_CMD, QUERY_SCRIPT, QUERY_SYNC
+
+from orientus.core.cache import LRUCache, QueryCache
+from orientus.core.messages import Params
+from orientus.core.pool import AsyncConnectionPool, ConnectionPool
+from orientus.core.serialization import global_properties
+
+# record serializations selectable with the `serialization` prop of OrientUsDB
+SERIALIZATIONS = {'csv': OrientSerialization.CSV, 'binary': OrientSerialization.Binary}
+
+# statements adding global properties, which binary serialized records refer to (see update_properties())
+SCHEMA_CHANGE = re.compile(r'\b(create|alter)\s+property\b', re.IGNORECASE)
+
+
+def merge_properties(props: Dict, schema) -> Dict:
+    """Adds the global properties of the schema record (#0:1) to `props`, a new dict when it's None
+
+    The connections of a database share `props`, so a property one of them loads is known to all.
+    Property ids are never reused, entries are only added.
+    """
+    loaded = global_properties(schema.oRecordData['globalProperties'])
+
+    if props is None:
+        return loaded
+
+    props.update(loaded)
+    return props
 
 
 class OrientUsSocket(OrientSocket):
@@ -19,6 +50,7 @@ class OrientUsSocket(OrientSocket):
 
 
 class OrientUs(OrientDB):
+    _Messages = dict(OrientDB._Messages, ParamCommandMessage='orientus.core.messages')
 
     def __init__(self, host='localhost', port=2424, serialization_type=OrientSerialization.CSV):
         super().__init__(host, port, serialization_type)
@@ -37,6 +69,94 @@ class OrientUs(OrientDB):
         else:
             self.db_create(db_name, db_type, storage_type)
 
+    def update_properties(self):
+        """Loads the global properties binary serialized records refer to their schema properties' fields by
+
+        They are reloaded after every statement creating or altering a property (see SCHEMA_CHANGE), call
+        it when another client changed the schema.
+        """
+        if self._connection.serialization_type == OrientSerialization.Binary:
+            schema = self.command('select from #0:1')[0]
+            self._connection._props = merge_properties(self._connection._props, schema)
+
+    def command(self, *args, params: Params = None):
+        return self._param_command(QUERY_CMD, args, params)
+
+    def query(self, *args, params: Params = None):
+        return self._param_command(QUERY_SYNC, args, params)
+
+    def query_async(self, *args, params: Params = None):
+        """Hands the result records to the callback in args (query, limit, fetch plan, callback) as they arrive"""
+        return self._param_command(QUERY_ASYNC, args, params)
+
+    def batch(self, *args, params: Params = None):
+        return self._param_command(QUERY_SCRIPT, args, params)
+
+    def command_many(self, statements, window: int = 100, return_exceptions: bool = False) -> List:
+        """Runs `statements` (texts or (text, params) pairs) pipelined, returns their results in order
+
+        Up to `window` requests are written back-to-back before their responses are read, so a round
+        trip is paid per window instead of per statement. The server answers the requests of a
+        connection in order, each response is checked to belong to the connection's session.
+        A failing statement doesn't stop the others: with `return_exceptions` its error takes its place
+        in the results, otherwise the first error is raised once all responses are read.
+        """
+        assert window > 0
+
+        results = []
+
+        for start in range(0, len(statements), window):
+            messages = []
+
+            for statement in statements[start:start + window]:
+                text, params = (statement, None) if isinstance(statement, str) else statement
+
+                messages.append(self.get_message('ParamCommandMessage')
+                                .set_params(params)
+                                .prepare((QUERY_CMD, text)))
+
+            self._connection.write(b''.join(message._output_buffer for message in messages))
+
+            for message in messages:
+                # the message reads its response without writing its request again
+                message._reset_fields_definition()
+
+                try:
+                    result = message.fetch_response()
+                except PyOrientException as e:
+                    # an error sent by the server is its whole response, the following ones can still be read
+                    if message._header[:1] != [1]:
+                        raise
+                    result = e
+
+                if message._header[1] != self._connection.session_id:
+                    raise PyOrientConnectionException(
+                        "Response of session %s on the connection of session %s" %
+                        (message._header[1], self._connection.session_id), [])
+
+                results.append(result)
+
+        if any(SCHEMA_CHANGE.search(statement if isinstance(statement, str) else statement[0])
+               for statement in statements):
+            self.update_properties()
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def _param_command(self, command_type: str, args, params: Params):
+        result = self.get_message('ParamCommandMessage') \
+            .set_params(params) \
+            .prepare((command_type,) + args).send().fetch_response()
+
+        if SCHEMA_CHANGE.search(args[0]):
+            self.update_properties()
+
+        return result
+
 
 class OrientUsDB(Thread):
 
@@ -49,11 +169,31 @@ class OrientUsDB(Thread):
         self.username = props['username']
         self.password = props['password']
 
+        # binary serialized records are decoded faster than CSV ones, see BinaryRecordSerializer
+        self.serialization_type = SERIALIZATIONS[props.get('serialization', 'csv')]
+
+        # global properties of binary serialized records, shared by the connections (see merge_properties())
+        self.global_properties = {}
+
         self.debug = debug
 
-        self.connection_pool: Deque[OrientUs] = deque(maxlen=10)
+        self.connection_pool = ConnectionPool(self.create_connection,
+                                              min_size=props.get('pool_min_size', 1),
+                                              max_size=props.get('pool_max_size', 10),
+                                              timeout=props.get('pool_timeout', 30.0),
+                                              idle_timeout=props.get('pool_idle_timeout', 300.0))
+
+        try:
+            self.connection_pool.fill()
+        except Exception:
+            # acquire_connection() will retry
+            pass
 
-        self.create_connection()
+        # statement templates compiled per class and operation, see AbstractSession._template()
+        self.statement_cache = LRUCache(props.get('statement_cache_size', 512))
+
+        # results of queries run with cache=True, shared by all sessions so their writes invalidate it
+        self.query_cache = QueryCache(props.get('query_cache_size', 1024), props.get('query_cache_ttl', 60.0))
 
         self.keep_running = True
 
@@ -74,40 +214,366 @@ class OrientUsDB(Thread):
             print()
             print("-- Closing '%s' orientus database --" % self.db_name)
 
-        for conn in self.connection_pool:
-            conn.close()
+        self.connection_pool.close()
 
         self.stop_task()
 
     def run(self):
         while self.keep_running:
             time.sleep(10)
+            self.connection_pool.evict_idle()
+
+    def create_connection(self) -> OrientUs:
+        connection = OrientUs(self.host, self.port, self.serialization_type)
+        connection._connection._props = self.global_properties
 
-    def create_connection(self):
         try:
-            connection = OrientUs(self.host, self.port)
             connection.db_open(self.db_name, self.username, self.password)
-
-            self.connection_pool.append(connection)
         except Exception as e:
-            print('Error occured during creating connection:', e)
-            self.stop_task()
+            if self.debug: print('-- Failed to open connection to %s:%s: %s --' % (self.host, self.port, e))
+            connection.close()
+            raise
 
-    def acquire_connection(self):
-        try:
-            connection = self.connection_pool.popleft()
-        except IndexError:
-            # TODO: give more meaningful error 'IndexError: pop from an empty deque' when database isn't started
-            self.create_connection()
-            connection = self.connection_pool.popleft()
+        if self.debug: print('-- Opened connection to %s:%s --' % (self.host, self.port))
 
         return connection
 
-    def release_connection(self, connection):
-        self.connection_pool.append(connection)
+    def acquire_connection(self, timeout: float = None) -> OrientUs:
+        """Borrows a connection, blocking up to `timeout` seconds (pool default when None) if all are in use"""
+        return self.connection_pool.acquire(timeout)
 
-    def connection_count(self):
+    def release_connection(self, connection: OrientUs, discard: bool = False):
+        self.connection_pool.release(connection, discard)
+
+    def connection_count(self) -> int:
         return len(self.connection_pool)
 
+    def pool_stats(self) -> Dict:
+        """Returns pool size, in-use/idle/waiting counts, connections created/closed and acquire wait times"""
+        return self.connection_pool.stats()
+
     def stop_task(self):
         self.keep_running = False
+
+
+class NeedMoreData(Exception):
+    """Raised by BufferedSocket.read() when the response isn't received up to `size` bytes yet"""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+
+class BufferedSocket:
+    """Stands in for OrientSocket under pyorient's messages, so AsyncOrientUs can reuse their encoding
+
+    Written requests are collected in `output`, responses are decoded from the bytes received so far
+    in `input`. Reading past them raises NeedMoreData, the decoding is repeated once more arrived.
+    """
+
+    def __init__(self, host: str, port: int, serialization_type=OrientSerialization.CSV):
+        self.connected = False
+        self.host = host
+        self.port = port
+        self.protocol = -1
+        self.session_id = -1
+        self.auth_token = b''
+        self.db_opened = None
+        self.serialization_type = serialization_type
+        self.in_transaction = False
+        self._props = None
+
+        self.output = bytearray()
+        self.input = bytearray()
+        self.position = 0
+
+    def get_connection(self):
+        return self
+
+    def write(self, buff: bytes):
+        self.output += buff
+
+    def read(self, size: int) -> bytes:
+        end = self.position + size
+
+        if end > len(self.input):
+            raise NeedMoreData(end)
+
+        data = bytes(self.input[self.position:end])
+        self.position = end
+
+        return data
+
+    def take_output(self) -> bytes:
+        data = bytes(self.output)
+        self.output.clear()
+
+        return data
+
+    def close(self):
+        self.connected = False
+        self.db_opened = None
+
+
+class AsyncOrientUs:
+    """asyncio connection to an OrientDB server, the awaitable counterpart of OrientUs
+
+    Requests are encoded and responses decoded by the same pyorient messages OrientUs sends (see
+    BufferedSocket), only the socket I/O is done by asyncio streams. A response is decoded once the
+    bytes it needs arrived, records handed to a callback (fetch plans) are delivered after that.
+    One request at a time, connections are shared between tasks through AsyncConnectionPool.
+    """
+
+    # bytes read per call while a response arrives
+    READ_SIZE = 65536
+    # how long to wait for more of a response before decoding what arrived (seconds)
+    READ_GAP = 0.002
+
+    def __init__(self, host='localhost', port=2424, serialization_type=OrientSerialization.CSV):
+        self._socket = BufferedSocket(host, port, serialization_type)
+
+        self._reader = None
+        self._writer = None
+
+        # a request that didn't get its whole response leaves the connection unusable
+        self.broken = False
+
+        self.clusters = []
+
+    async def connect(self) -> int:
+        self._reader, self._writer = await asyncio.open_connection(self._socket.host, self._socket.port)
+
+        self._socket.protocol, = struct.unpack('!h', await self._reader.readexactly(2))
+        self._socket.connected = True
+
+        return self._socket.protocol
+
+    async def db_open(self, db_name: str, user: str, password: str, db_type=DB_TYPE_DOCUMENT, client_id=''):
+        if not self._socket.connected:
+            await self.connect()
+
+        _, self.clusters, _ = await self._request(
+            'DbOpenMessage', lambda message: message.prepare((db_name, user, password, db_type, client_id)))
+
+        await self.update_properties()
+
+        return self.clusters
+
+    async def update_properties(self):
+        """See OrientUs.update_properties()"""
+        if self._socket.serialization_type == OrientSerialization.Binary:
+            schema = (await self.command('select from #0:1'))[0]
+            self._socket._props = merge_properties(self._socket._props, schema)
+
+    async def close(self):
+        self._socket.close()
+
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+    async def command(self, *args, params: Params = None):
+        return await self._param_command(QUERY_CMD, args, params)
+
+    async def query(self, *args, params: Params = None):
+        return await self._param_command(QUERY_SYNC, args, params)
+
+    async def batch(self, *args, params: Params = None):
+        return await self._param_command(QUERY_SCRIPT, args, params)
+
+    async def _param_command(self, command_type: str, args, params: Params):
+        # args are (query, limit, fetch plan, callback), the callback gets the records of a completely decoded response
+        callback = args[3] if len(args) > 3 else None
+        received = []
+
+        def prepare(message):
+            received.clear()
+
+            if callback is not None:
+                return message.set_params(params).prepare((command_type,) + args[:3] + (received.append,))
+
+            return message.set_params(params).prepare((command_type,) + args)
+
+        results = await self._request('ParamCommandMessage', prepare)
+
+        for record in received:
+            callback(record)
+
+        if SCHEMA_CHANGE.search(args[0]):
+            await self.update_properties()
+
+        return results
+
+    def _message(self, name: str):
+        message_cls = getattr(import_module(OrientUs._Messages[name]), name)
+
+        return message_cls(self._socket).set_session_token(self._socket.auth_token or None)
+
+    async def _request(self, name: str, prepare: Callable):
+        """Sends the message `name` set up by `prepare`, then decodes its response"""
+        if self.broken:
+            raise PyOrientConnectionException("Connection has an unread response", [])
+
+        self.broken = True
+
+        message = prepare(self._message(name)).send()
+
+        try:
+            self._writer.write(self._socket.take_output())
+            await self._writer.drain()
+
+            result = await self._response(message, lambda: prepare(self._message(name)).send())
+        except OSError as e:
+            raise PyOrientConnectionException(str(e), [])
+
+        self.broken = False
+
+        return result
+
+    async def _response(self, message, remake: Callable):
+        socket = self._socket
+
+        while True:
+            socket.position = 0
+
+            try:
+                result = message.fetch_response()
+            except NeedMoreData as e:
+                needed = e.size
+            except PyOrientException:
+                # an error sent by the server is the whole response (status 1 in its header)
+                if message._header[:1] == [1]:
+                    self._consume()
+                    self.broken = False
+                raise
+            else:
+                self._consume()
+                return result
+
+            # waiting for twice the bytes decoded in vain keeps the decoding linear in the response size
+            await self._receive(needed, max(needed, 2 * len(socket.input)))
+
+            # decoding changes a message's state, each attempt takes a new one
+            message = remake()
+            socket.output.clear()
+
+    async def _receive(self, needed: int, wanted: int):
+        """Reads until `needed` bytes are buffered, then up to `wanted` as long as more keeps arriving"""
+        buffer = self._socket.input
+
+        while len(buffer) < needed:
+            data = await self._reader.read(self.READ_SIZE)
+            if not data:
+                raise PyOrientConnectionException("Server closed the connection", [])
+            buffer += data
+
+        while len(buffer) < wanted:
+            try:
+                data = await asyncio.wait_for(self._reader.read(self.READ_SIZE), self.READ_GAP)
+            except asyncio.TimeoutError:
+                return
+
+            if not data:
+                return
+            buffer += data
+
+    def _consume(self):
+        del self._socket.input[:self._socket.position]
+        self._socket.position = 0
+
+
+class AsyncOrientUsDB:
+    """OrientUsDB for asyncio: the same props, a pool of AsyncOrientUs connections and the shared caches
+
+    async with AsyncOrientUsDB(props) as db:
+        async with AsyncSession(db) as session:
+            ...
+    """
+
+    def __init__(self, props: Mapping, debug=False):
+        self.host = props['host']
+        self.port = props['port']
+        self.db_name = props['db_name']
+        self.username = props['username']
+        self.password = props['password']
+
+        self.serialization_type = SERIALIZATIONS[props.get('serialization', 'csv')]
+        self.global_properties = {}
+
+        self.debug = debug
+
+        self.connection_pool = AsyncConnectionPool(self.create_connection,
+                                                   min_size=props.get('pool_min_size', 1),
+                                                   max_size=props.get('pool_max_size', 10),
+                                                   timeout=props.get('pool_timeout', 30.0),
+                                                   idle_timeout=props.get('pool_idle_timeout', 300.0))
+
+        self.statement_cache = LRUCache(props.get('statement_cache_size', 512))
+        self.query_cache = QueryCache(props.get('query_cache_size', 1024), props.get('query_cache_ttl', 60.0))
+
+        self._evictor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        if self.debug:
+            print("-- Initializing '%s' orientus database --" % (self.db_name))
+            print()
+
+        try:
+            await self.connection_pool.fill()
+        except Exception:
+            # acquire_connection() will retry
+            pass
+
+        self._evictor = asyncio.ensure_future(self._evict_idle())
+
+    async def stop(self):
+        if self.debug:
+            print()
+            print("-- Closing '%s' orientus database --" % self.db_name)
+
+        if self._evictor is not None:
+            self._evictor.cancel()
+            self._evictor = None
+
+        await self.connection_pool.close()
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(10)
+            await self.connection_pool.evict_idle()
+
+    async def create_connection(self) -> AsyncOrientUs:
+        connection = AsyncOrientUs(self.host, self.port, self.serialization_type)
+        connection._socket._props = self.global_properties
+
+        try:
+            await connection.db_open(self.db_name, self.username, self.password)
+        except Exception as e:
+            if self.debug: print('-- Failed to open connection to %s:%s: %s --' % (self.host, self.port, e))
+            await connection.close()
+            raise
+
+        if self.debug: print('-- Opened connection to %s:%s --' % (self.host, self.port))
+
+        return connection
+
+    async def acquire_connection(self, timeout: float = None) -> AsyncOrientUs:
+        """Borrows a connection, waiting up to `timeout` seconds (pool default when None) if all are in use"""
+        return await self.connection_pool.acquire(timeout)
+
+    async def release_connection(self, connection: AsyncOrientUs, discard: bool = False):
+        await self.connection_pool.release(connection, discard)
+
+    def connection_count(self) -> int:
+        return len(self.connection_pool)
+
+    def pool_stats(self) -> Dict:
+        """Returns pool size, in-use/idle/waiting counts, connections created/closed and acquire wait times"""
+        return self.connection_pool.stats()
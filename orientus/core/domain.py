@@ -1,7 +1,9 @@
+import warnings
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional, Type
 
 from orientus.core.datatypes import RawType
+from orientus.core.schema import ClassSchema, SlotField
 
 
 class ORID:
@@ -9,23 +11,116 @@ class ORID:
     SEPARATOR = ':'
 
     def __init__(self, rid):
+        rid = str(rid.get_hash() if hasattr(rid, 'get_hash') else rid)
+        if not rid.startswith(self.PREFIX):
+            rid = self.PREFIX + rid
+
+        cluster, _, position = rid[1:].partition(self.SEPARATOR)
+
+        # raises ValueError for anything but #<cluster>:<position>
+        self.cluster = int(cluster)
+        self.position = int(position)
+
         self.rid = rid
 
     def get_cluster(self) -> int:
-        pass
+        return self.cluster
 
     def get_cluster_position(self) -> int:
-        pass
+        return self.position
+
+    def __str__(self):
+        return self.rid
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.rid)
+
+    def __eq__(self, other):
+        return isinstance(other, ORID) and self.rid == other.rid
+
+    def __hash__(self):
+        return hash(self.rid)
+
+
+def _qualified_name(cls) -> str:
+    return '%s.%s' % (cls.__module__, cls.__qualname__)
+
 
+class ORecordMeta(type):
+    """Metaclass of domain classes
 
-class ORecord:
+    Builds the ClassSchema of every class once, registers it under its database class name (the first class
+    mapping it is kept) and lets `__slots__` classes declare their fields as class attributes like any other domain class.
+    """
+
+    # domain classes by their database class name
+    registry: Dict[str, Type['ORecord']] = {}
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        slots = namespace.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+
+        # a slot can't share its name with a class attribute, the datatype is put back as SlotField
+        slot_fields = {attr: namespace.pop(attr) for attr in slots if isinstance(namespace.get(attr), RawType)}
+
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+
+        for attr, datatype in slot_fields.items():
+            setattr(cls, attr, SlotField(datatype, cls.__dict__[attr]))
+
+        cls.__schema__ = ClassSchema(cls)
+
+        # subclasses inheriting the database class name of their base don't replace it
+        element_name = cls.element_name()
+        if element_name is not None and all(element_name != base.element_name() for base in bases
+                                            if isinstance(base, ORecordMeta)):
+            registered = mcs.registry.get(element_name)
+
+            # the first mapping is kept, only a module executed again (e.g. reloaded) replaces its class
+            if registered is None or _qualified_name(registered) == _qualified_name(cls):
+                mcs.registry[element_name] = cls
+            else:
+                warnings.warn('database class %s is mapped by %s already, %s is used only where it is given '
+                              'explicitly (e.g. load_many(record_cls=...))'
+                              % (element_name, _qualified_name(registered), _qualified_name(cls)), stacklevel=2)
+
+        return cls
+
+
+class ORecord(metaclass=ORecordMeta):
     __record_name__ = None
+    __slots__ = ('_rid', '_version', '_batch_id', '_loaded', '_dirty', '_session', '_related', '__weakref__')
+
+    registry = ORecordMeta.registry
 
     def __init__(self, rid='', version=''):
         self._rid = rid
         self._version = version
         self._batch_id = None
 
+        # column values as last loaded/written (None for new objects) and fields marked changed since
+        self._loaded = None
+        self._dirty = None
+
+        # session that loaded/saved the object (loads its relationships) and relationships loaded so far
+        self._session = None
+        self._related = None
+
+    @classmethod
+    def schema(cls) -> ClassSchema:
+        """Returns the field/column descriptor table of the class"""
+        return cls.__schema__
+
+    @classmethod
+    def _default_state(cls) -> Dict:
+        """Attributes (besides rid and version) __init__ sets, given to objects loaded from the database"""
+        return {'_batch_id': None, '_loaded': None, '_dirty': None, '_session': None, '_related': None}
+
+    def mark_dirty(self, *attrs: str):
+        """Marks fields to be written by the next update, whether or not they compare equal to the loaded values"""
+        self._dirty = set(attrs) if self._dirty is None else self._dirty | set(attrs)
+
     # TODO: think about this method
     def has_valid_rid(self):
         if self._rid is None: return False
@@ -42,11 +137,20 @@ class ORecord:
     def element_name(cls) -> str:
         return cls.__record_name__
 
-    def get_identity(self) -> ORID:
-        pass
+    def get_identity(self) -> Optional[ORID]:
+        return ORID(self._rid) if self._rid else None
+
+    def _attached_session(self):
+        session = self._session
+
+        if session is None or session.closed:
+            raise ValueError(self.__class__.__name__ + " isn't attached to an open session, prefetch its relationships.")
+
+        return session
 
 
 class OElement(ORecord):
+    __slots__ = ()
 
     def get_property_names(self) -> List[str]:
         pass
@@ -65,6 +169,8 @@ class OElement(ORecord):
 
 
 class OBlob(ORecord):
+    __slots__ = ()
+
     def from_input(self, input):
         pass
 
@@ -78,8 +184,15 @@ class ODirection(Enum):
     BOTH = 'BOTH'
 
 
+def navigation(direction: ODirection, edge_cls=None, edges: bool = False) -> str:
+    """Returns the graph function call walking from a vertex in `direction`, e.g. out('PreviousTokenEdge')"""
+    function = direction.value.lower() + ('E' if edges else '')
+    return "%s(%s)" % (function, "'%s'" % edge_cls.element_name() if edge_cls is not None else '')
+
+
 class OVertex(OElement):
     ___vertex_name__ = None
+    __slots__ = ()
 
     depth = RawType(name='$depth')
 
@@ -87,21 +200,34 @@ class OVertex(OElement):
     def element_name(cls) -> str:
         return cls.___vertex_name__
 
-    def get_edges(self, direction: ODirection) -> List['OEdge']:
-        pass
+    def get_edges(self, direction: ODirection, edge_cls: Type['OEdge'] = None) -> List['OEdge']:
+        """Edges of the vertex in `direction` (of `edge_cls` only if given), loaded on first access"""
+        return self._neighbours(navigation(direction, edge_cls, edges=True), direction, edge_cls, True)
 
-    def get_vertices(self, direction: ODirection) -> List['OVertex']:
-        pass
+    def get_vertices(self, direction: ODirection, edge_cls: Type['OEdge'] = None) -> List['OVertex']:
+        """Vertices connected in `direction` (through `edge_cls` edges only if given), loaded on first access"""
+        return self._neighbours(navigation(direction, edge_cls), direction, edge_cls, False)
+
+    def _neighbours(self, key: str, direction: ODirection, edge_cls, edges: bool) -> List[ORecord]:
+        if self._related is None or key not in self._related:
+            self._attached_session().prefetch([self], direction, edge_cls, edges=edges)
+
+        return self._related[key]
 
 
 class OEdge(OElement):
     __edge_name__ = 'E'
+    __slots__ = ('_from_vertex', '_to_vertex')
 
     def __init__(self, frm_vertex, to_vertex):
         super().__init__()
         self._from_vertex: OVertex = frm_vertex
         self._to_vertex: OVertex = to_vertex
 
+    @classmethod
+    def _default_state(cls) -> Dict:
+        return dict(super()._default_state(), _from_vertex=None, _to_vertex=None)
+
     # def connect(self, frm: OVertex, to: OVertex):
     #     self._from_vertex = frm
     #     self._to_vertex = to
@@ -111,10 +237,16 @@ class OEdge(OElement):
         return cls.__edge_name__
 
     def get_from(self) -> OVertex:
-        pass
+        if self._from_vertex is None:
+            self._attached_session().prefetch_endpoints([self])
+
+        return self._from_vertex
 
     def get_to(self) -> OVertex:
-        pass
+        if self._to_vertex is None:
+            self._attached_session().prefetch_endpoints([self])
+
+        return self._to_vertex
 
 
 class OGraph:
@@ -0,0 +1,82 @@
+from typing import List, Type
+from weakref import WeakValueDictionary
+
+from pyorient import OrientRecord
+
+from orientus.core.domain import ORecord
+from orientus.core.utils import to_datatype_obj
+
+
+class IdentityMap:
+    """The domain objects a session loaded or saved, by rid
+
+    A record loaded again resolves to the object already in the map: unchanged records (same version)
+    aren't hydrated again, changed ones are copied onto it. Objects are held weakly, the map doesn't keep
+    the results of a large scan alive.
+    """
+
+    def __init__(self):
+        self._objects = WeakValueDictionary()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, rid: str):
+        return rid in self._objects
+
+    def get(self, rid: str) -> ORecord:
+        return self._objects.get(rid)
+
+    def add(self, record: ORecord):
+        """Makes `record` the object of its rid"""
+        if record._rid:
+            self._objects[record._rid] = record
+
+    def remove(self, record: ORecord):
+        self._objects.pop(record._rid, None)
+
+    def clear(self):
+        self._objects.clear()
+
+    def hydrate(self, record_cls: Type[ORecord], records: List[OrientRecord]) -> List:
+        """to_datatype_obj() resolving every record to its object in the map"""
+        result = []
+        missing = []
+
+        for record in records:
+            obj = self._objects.get(record._rid)
+
+            if obj is None or not isinstance(obj, record_cls):
+                missing.append((len(result), record))
+            elif obj._version != record._version:
+                refresh(obj, to_datatype_obj(record_cls, [record])[0])
+
+            result.append(obj)
+
+        hydrated = to_datatype_obj(record_cls, [record for _, record in missing])
+
+        for (index, _), obj in zip(missing, hydrated):
+            # a record can occur more than once in the same result
+            canonical = self._objects.get(obj._rid)
+            if canonical is None or not isinstance(canonical, record_cls):
+                canonical = obj
+                self.add(obj)
+
+            result[index] = canonical
+
+        return result
+
+
+def refresh(obj: ORecord, loaded: ORecord):
+    """Copies the version and field values of `loaded` onto `obj`, fields it hasn't are unset on `obj`"""
+    obj._version = loaded._version
+    obj._loaded = loaded._loaded
+    obj._dirty = None
+
+    for field in obj.schema().fields:
+        value = getattr(loaded, field.attr, field.datatype)
+
+        if value is not field.datatype:
+            setattr(obj, field.attr, value)
+        elif getattr(obj, field.attr, field.datatype) is not field.datatype:
+            delattr(obj, field.attr)
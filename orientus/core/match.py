@@ -24,9 +24,13 @@ class Graph(GraphFunction):
         self.__vertex_on = False
         self.__vertex_dict = {}
 
+        # database classes the pattern reads
+        self.classes = set()
+
     def vertex(self, vertex: Type[OVertex], alias: str) -> 'Graph':
         self.__vertex_on = True
         self.__vertex_dict = {'class': vertex.___vertex_name__, 'as': alias}
+        self.classes.add(vertex.___vertex_name__)
         return self
 
     def where(self, clause: Clause) -> 'Graph':
@@ -42,16 +46,19 @@ class Graph(GraphFunction):
     def outE(self, edge: Type[OEdge]) -> 'Graph':
         self.__close_vertex()
         self.__sql.append(".%s(%s)" % ("out", edge.__edge_name__))
+        self.classes.add(edge.__edge_name__)
         return self
 
     def inE(self, edge: Type[OEdge]) -> 'Graph':
         self.__close_vertex()
         self.__sql.append(".%s(%s)" % ('in', edge.__edge_name__))
+        self.classes.add(edge.__edge_name__)
         return self
 
     def bothE(self, edge: Type[OEdge]) -> 'Graph':
         self.__close_vertex()
         self.__sql.append(".%s(%s)" % ('both', edge))
+        self.classes.add(getattr(edge, '__edge_name__', edge))
         return self
 
     def not_(self) -> 'Graph':
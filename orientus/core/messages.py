@@ -0,0 +1,203 @@
+import base64
+import struct
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Mapping, Optional, Sequence, Union
+
+from pyorient import OrientRecordLink, OrientSerialization, PyOrientBadMethodCallException, \
+    PyOrientNullRecordException
+from pyorient.constants import FIELD_BOOLEAN, FIELD_BYTE, FIELD_INT, FIELD_RECORD, FIELD_SHORT, FIELD_STRING, \
+    FIELD_TYPE_LINK, QUERY_ASYNC, QUERY_CMD, QUERY_GREMLIN, QUERY_SCRIPT, QUERY_SYNC
+from pyorient.messages.base import BaseMessage
+from pyorient.messages.commands import CommandMessage
+from pyorient.utils import need_db_opened
+
+from orientus.core.records import new_record
+from orientus.core.serialization import BinaryRecordSerializer, encode_record
+
+Params = Union[Sequence, Mapping]
+
+
+def encode_csv_value(value) -> str:
+    """Encodes a python value with OrientDB's CSV record serialization (the one negotiated by OrientUs)"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value) + ('l' if not -2147483648 <= value <= 2147483647 else '')
+    if isinstance(value, float):
+        return repr(value) + 'd'
+    if isinstance(value, Decimal):
+        return '{:f}c'.format(value)
+    if isinstance(value, str):
+        return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    if isinstance(value, datetime):
+        return '%st' % int(time.mktime(value.timetuple()) * 1000 + value.microsecond // 1000)
+    if isinstance(value, date):
+        return '%sa' % int(time.mktime(value.timetuple()) * 1000)
+    if isinstance(value, OrientRecordLink):
+        return value.get_hash()
+    if isinstance(value, (bytes, bytearray)):
+        return '_%s_' % base64.b64encode(value).decode()
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ','.join(encode_csv_value(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return '<%s>' % ','.join(encode_csv_value(v) for v in value)
+    if isinstance(value, Mapping):
+        return '{%s}' % ','.join('%s:%s' % (encode_csv_value(str(k)), encode_csv_value(v)) for k, v in value.items())
+
+    # domain objects are sent as links to their record
+    rid = getattr(value, '_rid', None)
+    if rid:
+        return rid
+
+    raise ValueError("Can't bind value of type %s as statement parameter" % type(value).__name__)
+
+
+def encode_params(field: str, params: Params, binary: bool = False) -> bytes:
+    """Serializes bound parameters the way the server expects them: a document holding a single map field
+
+    Positional parameters (`?`) are keyed by their index, named ones (`:name`) by their name. The
+    document is serialized as the connection's records, CSV or `binary`.
+    """
+    if not isinstance(params, Mapping):
+        params = {str(index): value for index, value in enumerate(params)}
+
+    if binary:
+        return encode_record({field: params})
+
+    return ('%s:%s' % (field, encode_csv_value(params))).encode('utf-8')
+
+
+def decode_ridbag(bag) -> Optional[List[str]]:
+    """Returns the rids of an embedded RidBag (the `out_X`/`in_X` edge sets pyorient leaves base64 encoded)
+
+    Bags grown past the embedded threshold are stored as server side trees holding only a pointer, for
+    those None is returned.
+    """
+    data = bag.getBin() if hasattr(bag, 'getBin') else base64.b64decode(bag)
+
+    config = data[0]
+    offset = 1
+
+    # bit 1: the bag is followed by the uuid of its tree (two longs)
+    if config & 2:
+        offset += 16
+
+    # bit 0: embedded, the links themselves follow
+    if not config & 1:
+        return None
+
+    size, = struct.unpack_from('>i', data, offset)
+    offset += 4
+
+    rids = []
+    for _ in range(size):
+        cluster, position = struct.unpack_from('>hq', data, offset)
+        offset += 10
+        rids.append('#%s:%s' % (cluster, position))
+
+    return rids
+
+
+class ParamCommandMessage(CommandMessage):
+    """CommandMessage sending bound parameters along with the statement text
+
+    pyorient always sends an empty parameter section, so parameterized statements
+    (`select from V where name = ?`) can't be used with it directly.
+    """
+
+    def __init__(self, _orient_socket):
+        super().__init__(_orient_socket)
+        self._params = None
+
+    def set_params(self, params: Params):
+        self._params = params
+        return self
+
+    def get_serializer(self):
+        """Binary records are decoded by one BinaryRecordSerializer for the whole response
+
+        pyorient's CSV serializer keeps the decoded fields, it takes a new one per record.
+        """
+        if not self._binary():
+            return super().get_serializer()
+
+        if self._serializer is None:
+            self._serializer = BinaryRecordSerializer(self._orientSocket._props)
+
+        return self._serializer
+
+    def _binary(self) -> bool:
+        return self._orientSocket.serialization_type == OrientSerialization.Binary
+
+    def _read_record(self):
+        """pyorient's _read_record() creating the OrientRecord from the decoded fields directly, see new_record()"""
+        marker = self._decode_field(FIELD_SHORT)
+
+        if marker == -2:
+            raise PyOrientNullRecordException('NULL Record', [])
+        if marker == -3:
+            return OrientRecordLink(self._decode_field(FIELD_TYPE_LINK))
+
+        record = self._decode_field(FIELD_RECORD)
+        content = record['content']
+
+        class_name, data = self.get_serializer().decode(content if self._binary() else content.rstrip())
+
+        # the raw bytes are only kept for debug dumps
+        self._input_buffer = b''
+
+        return new_record(class_name, data, record['version'], record['rid'])
+
+    @need_db_opened
+    def prepare(self, params=None):
+        if not self._params:
+            return super().prepare(params)
+
+        if isinstance(params, (tuple, list)):
+            self.set_command_type(params[0])
+            self._query = params[1]
+
+            if len(params) > 2:
+                self._limit = params[2]
+            if len(params) > 3:
+                self._fetch_plan = params[3]
+            if len(params) > 4:
+                self.set_callback(params[4])
+
+        if self._command_type in (QUERY_CMD, QUERY_SYNC, QUERY_SCRIPT, QUERY_GREMLIN):
+            self._mod_byte = 's'
+        else:
+            if self._callback is None:
+                raise PyOrientBadMethodCallException("No callback was provided.", [])
+            self._mod_byte = 'a'
+
+        payload_definition = [(FIELD_STRING, self._command_type)]
+
+        if self._command_type == QUERY_SCRIPT:
+            payload_definition.append((FIELD_STRING, 'sql'))
+
+        payload_definition.append((FIELD_STRING, self._query))
+
+        if self._command_type in (QUERY_SYNC, QUERY_ASYNC, QUERY_GREMLIN):
+            # a limit written in the statement overrides the limit parameter
+            limit = self._limit if ' LIMIT ' not in self._query.upper() else -1
+
+            payload_definition.append((FIELD_INT, limit))
+            payload_definition.append((FIELD_STRING, self._fetch_plan))
+            payload_definition.append((FIELD_STRING, encode_params('params', self._params, self._binary())))
+        else:
+            # simple parameters, then (absent) composite key parameters
+            payload_definition.append((FIELD_BOOLEAN, True))
+            payload_definition.append((FIELD_STRING, encode_params('parameters', self._params, self._binary())))
+            payload_definition.append((FIELD_BOOLEAN, False))
+
+        payload = b''.join(self._encode_field(field) for field in payload_definition)
+
+        self._append((FIELD_BYTE, self._mod_byte))
+        self._append((FIELD_STRING, payload))
+
+        return BaseMessage.prepare(self)
@@ -0,0 +1,459 @@
+import asyncio
+import time
+from collections import deque
+from threading import Event, Lock
+from typing import Callable, Deque, Dict, List, Tuple
+
+from pyorient import PyOrientConnectionPoolException
+
+
+class _Waiter:
+
+    def __init__(self):
+        self.event = Event()
+        self.connection = None
+        self.may_create = False
+        self.error = None
+
+
+class _PoolState:
+    """Sizes, idle connections and statistics of ConnectionPool and AsyncConnectionPool
+
+    Only bookkeeping, nothing here opens or closes connections: ConnectionPool calls these methods
+    holding its lock, AsyncConnectionPool from its event loop.
+    """
+
+    def __init__(self, factory: Callable,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30.0,
+                 idle_timeout: float = 300.0):
+        assert 0 <= min_size <= max_size
+        assert max_size > 0
+
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        self._idle: Deque[Tuple[object, float]] = deque()
+        # waiting acquire calls in arrival order, their kind depends on the pool
+        self._waiters: Deque = deque()
+
+        # connections alive or being created, checked out or idle
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._closed_count = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeouts = 0
+
+    def __len__(self):
+        return self._size
+
+    def _stats(self) -> Dict:
+        return {'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': len(self._waiters),
+                'created': self._created,
+                'closed': self._closed_count,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+                'timeouts': self._timeouts}
+
+    def _checkout(self):
+        self._in_use += 1
+        self._acquired += 1
+
+    def _take_idle(self):
+        """Checks out the connection released last, None when there is no idle one"""
+        if not self._idle:
+            return None
+
+        connection, _ = self._idle.pop()
+        self._checkout()
+
+        return connection
+
+    def _put_idle(self, connection):
+        self._idle.append((connection, time.monotonic()))
+
+    def _discarded(self):
+        self._size -= 1
+        self._closed_count += 1
+
+    def _expired(self) -> List:
+        """Takes the connections idle for longer than `idle_timeout` out, keeps at least `min_size` alive"""
+        expired = []
+        deadline = time.monotonic() - self.idle_timeout
+
+        # the left end holds the connections released longest ago
+        while self._idle and self._size > self.min_size and self._idle[0][1] < deadline:
+            connection, _ = self._idle.popleft()
+            self._discarded()
+            expired.append(connection)
+
+        return expired
+
+    def _shut(self) -> List:
+        """Marks the pool closed and takes the idle connections out"""
+        self._closed = True
+
+        idle = [connection for connection, _ in self._idle]
+        self._idle.clear()
+        self._size -= len(idle)
+        self._closed_count += len(idle)
+
+        return idle
+
+    def _waited(self, start: float):
+        waited = time.monotonic() - start
+        self._waits += 1
+        self._wait_time += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+    def _timed_out(self, timeout: float) -> PyOrientConnectionPoolException:
+        self._timeouts += 1
+
+        return PyOrientConnectionPoolException(
+            "Timed out after %ss waiting for a connection (pool size %s)" % (timeout, self.max_size), [])
+
+    @staticmethod
+    def _closed_error() -> PyOrientConnectionPoolException:
+        return PyOrientConnectionPoolException("Connection pool is closed", [])
+
+
+class ConnectionPool(_PoolState):
+    """Thread-safe, bounded connection pool
+
+    Idle connections are reused most-recently-released first so that rarely
+    needed connections age and get evicted after `idle_timeout` seconds
+    (never going below `min_size`). When the pool is exhausted, `acquire`
+    blocks up to `timeout` seconds; blocked threads are served strictly in
+    arrival order by handing released connections directly to the oldest waiter.
+    """
+
+    def __init__(self, factory: Callable,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30.0,
+                 idle_timeout: float = 300.0):
+        super().__init__(factory, min_size, max_size, timeout, idle_timeout)
+
+        self._lock = Lock()
+        self._waiters: Deque[_Waiter] = deque()
+
+    def fill(self):
+        """Opens connections until the pool holds at least `min_size`"""
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+
+            connection = self._create()
+
+            with self._lock:
+                self._put_idle(connection)
+
+    def acquire(self, timeout: float = None):
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._lock:
+            if self._closed:
+                raise self._closed_error()
+
+            # queued threads are served first, otherwise a busy caller could barge ahead of them
+            if not self._waiters:
+                if self._idle:
+                    return self._take_idle()
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._checkout()
+                    may_create = True
+                else:
+                    may_create = False
+            else:
+                may_create = False
+
+            if not may_create:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+
+        if may_create:
+            return self._create_checked_out()
+
+        return self._wait(waiter, timeout)
+
+    def release(self, connection, discard: bool = False):
+        """Returns `connection` to the pool, `discard` closes it instead (e.g. broken socket)"""
+        with self._lock:
+            self._in_use -= 1
+
+            if discard or self._closed:
+                self._discarded()
+                self._grant_creation()
+            elif self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.connection = connection
+                self._in_use += 1
+                waiter.event.set()
+                return
+            else:
+                self._put_idle(connection)
+                return
+
+        self._close(connection)
+
+    def evict_idle(self) -> int:
+        """Closes connections idle for longer than `idle_timeout`, keeps at least `min_size` alive"""
+        with self._lock:
+            evicted = self._expired()
+
+        for connection in evicted:
+            self._close(connection)
+
+        return len(evicted)
+
+    def close(self):
+        with self._lock:
+            idle = self._shut()
+
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.error = self._closed_error()
+                waiter.event.set()
+
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return self._stats()
+
+    def _wait(self, waiter: _Waiter, timeout: float):
+        start = time.monotonic()
+
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if not waiter.event.is_set():
+                self._waiters.remove(waiter)
+                raise self._timed_out(timeout)
+
+            self._waited(start)
+
+            if waiter.error is not None:
+                raise waiter.error
+
+            self._acquired += 1
+
+            if not waiter.may_create:
+                return waiter.connection
+
+        return self._create_checked_out()
+
+    def _grant_creation(self):
+        """Lets the oldest waiter open a new connection in a slot freed by a closed one, lock must be held"""
+        if self._waiters and not self._closed:
+            waiter = self._waiters.popleft()
+            waiter.may_create = True
+            self._size += 1
+            self._in_use += 1
+            waiter.event.set()
+
+    def _create_checked_out(self):
+        try:
+            return self._create()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._grant_creation()
+            raise
+
+    def _create(self):
+        try:
+            connection = self.factory()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+
+        with self._lock:
+            self._created += 1
+
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class AsyncConnectionPool(_PoolState):
+    """Bounded connection pool for asyncio, the counterpart of ConnectionPool for AsyncOrientUs connections
+
+    Same policies: idle connections are reused most-recently-released first and evicted after
+    `idle_timeout` seconds, exhausted `acquire` calls wait up to `timeout` seconds and are served in
+    arrival order. Waiting takes no thread, any number of tasks can wait on a few connections.
+    `factory` is a coroutine function opening a connection. Not thread-safe, use it from one event loop.
+    """
+
+    def __init__(self, factory: Callable,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30.0,
+                 idle_timeout: float = 300.0):
+        super().__init__(factory, min_size, max_size, timeout, idle_timeout)
+
+        # futures resolved with a connection, or with None when the waiter may open one
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def fill(self):
+        """Opens connections until the pool holds at least `min_size`"""
+        while not self._closed and self._size < self.min_size:
+            self._size += 1
+            self._put_idle(await self._create())
+
+    async def acquire(self, timeout: float = None):
+        timeout = self.timeout if timeout is None else timeout
+
+        if self._closed:
+            raise self._closed_error()
+
+        if not self._waiters:
+            if self._idle:
+                return self._take_idle()
+
+            if self._size < self.max_size:
+                self._size += 1
+                self._checkout()
+                return await self._create_checked_out()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        start = time.monotonic()
+
+        try:
+            await asyncio.wait([waiter], timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            raise self._timed_out(timeout)
+
+        self._waited(start)
+
+        # raises when the pool was closed meanwhile
+        connection = waiter.result()
+        self._acquired += 1
+
+        if connection is None:
+            return await self._create_checked_out()
+
+        return connection
+
+    async def release(self, connection, discard: bool = False):
+        """Returns `connection` to the pool, `discard` closes it instead (e.g. broken socket)"""
+        self._in_use -= 1
+
+        if discard or self._closed:
+            self._discarded()
+            self._grant_creation()
+            await self._close(connection)
+        elif self._waiters:
+            self._in_use += 1
+            self._waiters.popleft().set_result(connection)
+        else:
+            self._put_idle(connection)
+
+    async def evict_idle(self) -> int:
+        """Closes connections idle for longer than `idle_timeout`, keeps at least `min_size` alive"""
+        evicted = self._expired()
+
+        for connection in evicted:
+            await self._close(connection)
+
+        return len(evicted)
+
+    async def close(self):
+        idle = self._shut()
+
+        while self._waiters:
+            self._waiters.popleft().set_exception(self._closed_error())
+
+        for connection in idle:
+            await self._close(connection)
+
+    def stats(self) -> Dict:
+        return self._stats()
+
+    def _abandon(self, waiter: asyncio.Future):
+        """Withdraws a waiter that timed out or got cancelled, what it was handed goes to the next one"""
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.cancel()
+            return
+
+        if waiter.exception() is not None:
+            return
+
+        connection = waiter.result()
+        self._in_use -= 1
+
+        if connection is None:
+            self._size -= 1
+            self._grant_creation()
+        elif self._waiters:
+            self._in_use += 1
+            self._waiters.popleft().set_result(connection)
+        else:
+            self._put_idle(connection)
+
+    def _grant_creation(self):
+        """Lets the oldest waiter open a new connection in a slot freed by a closed one"""
+        if self._waiters and not self._closed:
+            self._size += 1
+            self._in_use += 1
+            self._waiters.popleft().set_result(None)
+
+    async def _create_checked_out(self):
+        try:
+            return await self._create()
+        except Exception:
+            self._in_use -= 1
+            self._grant_creation()
+            raise
+
+    async def _create(self):
+        try:
+            connection = await self.factory()
+        except Exception:
+            self._size -= 1
+            raise
+
+        self._created += 1
+
+        return connection
+
+    @staticmethod
+    async def _close(connection):
+        try:
+            await connection.close()
+        except Exception:
+            pass
@@ -1,7 +1,9 @@
 from enum import Enum
-from typing import Type
+from typing import List, Optional, Tuple, Type
 
-from orientus.core.datatypes import OString
+from pyorient import OrientRecordLink
+
+from orientus.core.datatypes import Clause, OString
 from orientus.core.domain import OVertex
 
 
@@ -27,6 +29,9 @@ class Query:
     def __init__(self, record_cls: Type[OVertex]):
         "Constructor for query"
         self.sql = []
+        # positional parameters of the `?` placeholders in self.sql, in order
+        self.params = []
+        self.fetch_plan = None
 
         self.record_cls = record_cls
         if record_cls is not None:
@@ -55,6 +60,9 @@ class Query:
 
         if isinstance(clause, OString):
             search_term = clause.name
+        elif isinstance(clause, Clause):
+            search_term = clause.expression
+            self.params.extend(clause.params)
         else:
             search_term = str(clause)
 
@@ -65,9 +73,10 @@ class Query:
         return self
 
     def like(self, match: str):
-        _sql = "LIKE '%s'" % (match)
+        _sql = "LIKE ?"
 
         self.sql.append(_sql)
+        self.params.append(match)
 
         return self
 
@@ -113,8 +122,14 @@ class Query:
 
         return self
 
-    def fetchplan(self):
-        # Know nothing yet
+    def fetchplan(self, plan: Optional[str] = None):
+        """Fetch plan of the linked records the server sends along with the results, e.g. `*:1` or `out_*:2`
+
+        It's sent with the query request (not in its text), Session.query links the fetched records
+        into the objects it returns. Without a plan no linked records are sent.
+        """
+        self.fetch_plan = plan
+
         return self
 
     def timeout(self, millis: int, strategy: Timeout = Timeout.EXCEPTION):
@@ -147,6 +162,140 @@ class Query:
 
         return self
 
+    def _page(self, after_rid: str, size: int, first: bool = False) -> Tuple[str, List]:
+        """Returns the statement of the `size` records following `after_rid`, for keyset pagination
+
+        Pages are cut with `@rid > last` instead of a growing SKIP, so the server seeks to the
+        start of each page instead of scanning all the records before it.
+        """
+        head, tail = [], []
+        condition = []
+        skip = None
+
+        for part in self.sql:
+            keyword = part.split(None, 1)[0].upper()
+
+            if keyword == 'SELECT' and part.strip().upper() != 'SELECT':
+                raise ValueError("paging needs whole records, can't page over a projection: %s" % part)
+            if keyword in ('ORDER', 'GROUP', 'UNWIND'):
+                raise ValueError("paging follows record id order, can't page over: %s" % part)
+
+            if keyword == 'WHERE':
+                condition.append(part[len('WHERE'):].strip())
+            elif keyword == 'LIKE':
+                condition.append(part)
+            elif keyword == 'SKIP':
+                skip = part
+            elif keyword == 'LIMIT':
+                continue
+            elif keyword in ('SELECT', 'FROM'):
+                head.append(part)
+            else:
+                tail.append(part)
+
+        if condition:
+            head.append("WHERE @rid > ? AND (%s)" % " ".join(condition))
+        else:
+            head.append("WHERE @rid > ?")
+
+        if first and skip is not None:
+            head.append(skip)
+
+        head.append("LIMIT %s" % size)
+
+        return "\n".join(head + tail), [OrientRecordLink(after_rid.lstrip('#'))] + self.params
+
+    def _partition(self, cluster: int, start: int = None, end: int = None) -> Tuple[str, List]:
+        """Returns the statement of the records in `cluster` from position `start` up to `end` (excluded),
+        for scans split into partitions; None leaves a side open
+        """
+        head, tail = [], []
+        condition = []
+
+        for part in self.sql:
+            keyword = part.split(None, 1)[0].upper()
+
+            if keyword == 'SELECT' and part.strip().upper() != 'SELECT':
+                raise ValueError("partitions are hydrated, can't split a projection: %s" % part)
+            if keyword in ('ORDER', 'GROUP', 'UNWIND', 'SKIP', 'LIMIT'):
+                raise ValueError("partitions are merged as they arrive, can't split: %s" % part)
+
+            if keyword == 'WHERE':
+                condition.append(part[len('WHERE'):].strip())
+            elif keyword == 'LIKE':
+                condition.append(part)
+            elif keyword == 'FROM':
+                head.append("FROM cluster:%d" % cluster)
+            elif keyword == 'SELECT':
+                head.append(part)
+            else:
+                tail.append(part)
+
+        bounds, params = [], []
+        if start is not None:
+            bounds.append("@rid >= ?")
+            params.append(OrientRecordLink('%d:%d' % (cluster, start)))
+        if end is not None:
+            bounds.append("@rid < ?")
+            params.append(OrientRecordLink('%d:%d' % (cluster, end)))
+
+        if condition:
+            bounds.append("(%s)" % " ".join(condition))
+        if bounds:
+            head.append("WHERE %s" % " AND ".join(bounds))
+
+        return "\n".join(head + tail), params + self.params
+
+    def _limit(self) -> int:
+        """Returns the LIMIT of the query, None when unlimited"""
+        for part in self.sql:
+            if part.upper().startswith('LIMIT'):
+                limit = int(part.split()[1])
+                return limit if limit >= 0 else None
+
+        return None
+
     def _done(self):
         # print("\n".join(self.sql))
         return "\n".join(self.sql)
+
+
+class KeysetPages:
+    """Statements of the pages of `qry` for keyset pagination (see Query._page), following the records read
+
+    pages = KeysetPages(qry, 1000)
+    page = pages.next()
+    while page is not None:
+        records = run(*page)
+        page = pages.next(records)
+    """
+
+    def __init__(self, qry: Query, page_size: int):
+        assert page_size > 0
+
+        self.qry = qry
+        self.page_size = page_size
+
+        # a LIMIT on the query caps the total count
+        self.remaining = qry._limit()
+        self.size = None
+        self.last_rid = '#-1:-1'
+
+    def next(self, records: List = None) -> Optional[Tuple[str, List]]:
+        """Returns the (statement, params) of the page after `records` (of the previous page), None at the end"""
+        if records is not None:
+            if len(records) < self.size:
+                return None
+
+            self.last_rid = records[-1]._rid
+
+            if self.remaining is not None:
+                self.remaining -= len(records)
+
+        if self.remaining is not None and self.remaining <= 0:
+            return None
+
+        first = self.size is None
+        self.size = self.page_size if self.remaining is None else min(self.page_size, self.remaining)
+
+        return self.qry._page(self.last_rid, self.size, first)
@@ -0,0 +1,44 @@
+from typing import Dict
+
+from pyorient import OrientRecord
+
+# OrientRecord keeps its state in name mangled attributes behind properties (a call per access),
+# the hot paths (hydrators, columns, decoded records) use them directly when they are there
+_ATTRS = {'o_storage': '_OrientRecord__o_storage', 'o_class': '_OrientRecord__o_class',
+          'rid': '_OrientRecord__rid', 'version': '_OrientRecord__version'}
+
+
+def _has_mangled_attrs() -> bool:
+    record = OrientRecord({'__o_storage': {}, '__o_class': 'V', '__rid': '#9:0', '__version': 1})
+    return all(name in vars(record) for name in _ATTRS.values())
+
+
+MANGLED = _has_mangled_attrs()
+
+# expressions reading the fields, rid and version of `record`, for generated code (see schema.compile_hydrator)
+if MANGLED:
+    DATA_EXPR, RID_EXPR, VERSION_EXPR = ('record.%s' % _ATTRS[name] for name in ('o_storage', 'rid', 'version'))
+else:
+    DATA_EXPR, RID_EXPR, VERSION_EXPR = 'record.oRecordData', 'record._rid', 'record._version'
+
+
+def record_data(record: OrientRecord) -> Dict:
+    """Field values of a record, the storage itself (not a copy)"""
+    return getattr(record, _ATTRS['o_storage']) if MANGLED else record.oRecordData
+
+
+_new_record = object.__new__
+
+
+def new_record(class_name: str, data: Dict, version: int, rid: str) -> OrientRecord:
+    """OrientRecord of decoded fields, without the OrientRecord constructor copying them key by key"""
+    if not MANGLED:
+        return OrientRecord({'__o_storage': data, '__o_class': class_name, '__version': version, '__rid': rid})
+
+    record = _new_record(OrientRecord)
+    record._OrientRecord__o_class = class_name
+    record._OrientRecord__o_storage = data
+    record._OrientRecord__version = version
+    record._OrientRecord__rid = rid
+
+    return record
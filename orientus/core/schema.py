@@ -0,0 +1,237 @@
+from copy import deepcopy
+from enum import Enum
+from typing import Callable, Dict, List, Union
+
+from orientus.core.datatypes import RawType
+from orientus.core.records import DATA_EXPR, RID_EXPR, VERSION_EXPR
+
+
+class SlotField:
+    """Field of a `__slots__` domain class
+
+    Returns the datatype when accessed on the class (so `Token.text == 'to'` keeps building clauses)
+    and the slot value when accessed on an instance.
+    """
+
+    def __init__(self, datatype: RawType, slot):
+        self.datatype = datatype
+        self.slot = slot
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.datatype
+
+        return self.slot.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+    def __delete__(self, instance):
+        self.slot.__delete__(instance)
+
+
+class FieldDescriptor:
+    """Mapping of one domain class attribute to its database property"""
+
+    def __init__(self, attr: str, datatype: RawType):
+        self.attr = attr
+        self.column = datatype.name
+        self.datatype = datatype
+
+        # OString -> STRING, OEmbeddedList -> EMBEDDEDLIST, ...
+        self.type_name = datatype.__class__.__name__[1:].upper()
+
+    def __repr__(self):
+        return '%s(%s -> %s %s)' % (self.__class__.__name__, self.attr, self.column, self.type_name)
+
+
+class IndexType(Enum):
+    UNIQUE = 'UNIQUE'
+    NOTUNIQUE = 'NOTUNIQUE'
+    UNIQUE_HASH_INDEX = 'UNIQUE_HASH_INDEX'
+    NOTUNIQUE_HASH_INDEX = 'NOTUNIQUE_HASH_INDEX'
+    DICTIONARY = 'DICTIONARY'
+    DICTIONARY_HASH_INDEX = 'DICTIONARY_HASH_INDEX'
+    FULLTEXT = 'FULLTEXT'
+    FULLTEXT_LUCENE = 'FULLTEXT ENGINE LUCENE'
+
+    @property
+    def unique(self) -> bool:
+        return self in (IndexType.UNIQUE, IndexType.UNIQUE_HASH_INDEX)
+
+
+class Index:
+    """Index declared in the `__indexes__` of a domain class, created by create_class()
+
+    class Token(OVertex):
+        text = OString(name='text')
+        lang = OString(name='lang')
+
+        __indexes__ = (Index(text, lang, type=IndexType.UNIQUE_HASH_INDEX),)
+
+    Hash indexes only serve equality lookups but are faster than the default SB-tree ones for them.
+    """
+
+    def __init__(self, *fields: Union[RawType, str], type: IndexType = IndexType.NOTUNIQUE, name: str = None):
+        assert len(fields) > 0
+
+        self.columns = [field.name if isinstance(field, RawType) else field for field in fields]
+        self.type = type
+        self.name = name
+
+    def index_name(self, class_name: str) -> str:
+        return self.name or '%s_%s' % (class_name, '_'.join(self.columns))
+
+    def statement(self, class_name: str) -> str:
+        return "CREATE INDEX %s ON %s (%s) %s" % (self.index_name(class_name), class_name,
+                                                  ', '.join(self.columns), self.type.value)
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, ', '.join(self.columns), self.type.name)
+
+
+class ClassSchema:
+    """Field/column metadata of an ORecord subclass, collected once when the class is defined"""
+
+    def __init__(self, record_cls):
+        self.record_cls = record_cls
+
+        self.fields: List[FieldDescriptor] = collect_fields(record_cls)
+
+        self.field_names: List[str] = [field.attr for field in self.fields]
+        self.by_attr: Dict[str, FieldDescriptor] = {field.attr: field for field in self.fields}
+        self.column_to_attr: Dict[str, str] = {field.column: field.attr for field in self.fields}
+
+        # indexes create_class() creates besides the unique ones of RawType(unique=True) fields
+        self.indexes: List[Index] = list(getattr(record_cls, '__indexes__', ()))
+
+        # fields with a unique index, the natural key of upserts
+        self.unique_fields: List[FieldDescriptor] = [field for field in self.fields if field.datatype.unique]
+
+        if not self.unique_fields:
+            by_column = {field.column: field for field in self.fields}
+
+            for index in self.indexes:
+                if index.type.unique and all(column in by_column for column in index.columns):
+                    self.unique_fields = [by_column[column] for column in index.columns]
+                    break
+
+        self._hydrator = None
+
+    @property
+    def hydrator(self) -> Callable:
+        """Function turning a list of OrientRecord into domain objects, compiled on first use"""
+        if self._hydrator is None:
+            self._hydrator = compile_hydrator(self.record_cls, self.fields)
+
+        return self._hydrator
+
+    def field(self, key: Union[str, RawType]) -> FieldDescriptor:
+        """The field of an attribute name or a class level field (e.g. Token.text), matched by identity"""
+        if isinstance(key, str):
+            field = self.by_attr.get(key)
+        else:
+            field = next((field for field in self.fields if field.datatype is key), None)
+
+        if field is None:
+            raise ValueError('%s is not a field of %s' % (getattr(key, 'name', None) or key, self.record_cls.__name__))
+
+        return field
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.record_cls.__name__, self.fields)
+
+
+def collect_fields(record_cls) -> List[FieldDescriptor]:
+    """Returns the RawType subclass attributes of `record_cls` and its bases, base class fields first
+
+    Plain RawType attributes (e.g. OVertex.depth) describe query variables, not properties, so they are skipped.
+    """
+    fields = {}
+
+    for clz in reversed(record_cls.__mro__):
+        for attr, value in vars(clz).items():
+            if attr.startswith('__') and attr.endswith('__'):
+                continue
+
+            if isinstance(value, SlotField):
+                value = value.datatype
+
+            if isinstance(value, RawType) and value.__class__ != RawType:
+                fields[attr] = FieldDescriptor(attr, value)
+            else:
+                # overridden by something that isn't a property anymore
+                fields.pop(attr, None)
+
+    return list(fields.values())
+
+
+def _slot_field_setter(record_cls, attr: str):
+    """Returns the slot `__set__` of a SlotField, so the generated code skips the python level descriptor"""
+    for clz in record_cls.__mro__:
+        descriptor = vars(clz).get(attr)
+
+        if descriptor is not None:
+            return descriptor.slot.__set__ if isinstance(descriptor, SlotField) else None
+
+    return None
+
+
+# values changed in place, hydrated objects get their own copies
+MUTABLE_TYPES = frozenset([list, dict, set, bytearray])
+
+
+def snapshot(items) -> Dict:
+    """(column, value) pairs as a dict not sharing the mutable values, see ORecord._loaded"""
+    return {column: deepcopy(value) if value.__class__ in MUTABLE_TYPES else value for column, value in items}
+
+
+def compile_hydrator(record_cls, fields: List[FieldDescriptor]) -> Callable:
+    """Generates the record -> domain object conversion of `record_cls`
+
+    The generated function creates instances without calling __init__, sets the state __init__
+    would set (ORecord._default_state()) and copies the columns of every record in a single
+    pass, with the column/attribute mapping resolved at compile time. Lists, dicts and sets are
+    copied, so objects never share them with the record (which may be cached, see Session._cached)
+    and changing them in place is noticed by Session.update.
+    """
+    namespace = {'_new': object.__new__, '_cls': record_cls, '_copy': deepcopy, '_mutable': MUTABLE_TYPES}
+
+    def assign(attr: str, value_expr: str, indent: str) -> str:
+        setter = _slot_field_setter(record_cls, attr)
+
+        if setter is None:
+            return '%sobj.%s = %s' % (indent, attr, value_expr)
+
+        name = '_set_%s' % attr
+        namespace[name] = setter
+        return '%s%s(obj, %s)' % (indent, name, value_expr)
+
+    lines = ['def hydrate(records):',
+             '    result = []',
+             '    append = result.append',
+             '    for record in records:',
+             '        data = %s' % DATA_EXPR,
+             '        obj = _new(_cls)',
+             assign('_rid', RID_EXPR, '        '),
+             assign('_version', VERSION_EXPR, '        ')]
+
+    for attr, value in record_cls._default_state().items():
+        namespace['_default_%s' % attr] = value
+        lines.append(assign(attr, '_default_%s' % attr, '        '))
+
+    # the storage itself is the snapshot Session.update compares with, see ORecord._loaded
+    lines.append(assign('_loaded', 'data', '        '))
+
+    for field in fields:
+        lines.append('        if %r in data:' % field.column)
+        lines.append('            value = data[%r]' % field.column)
+        lines.append(assign(field.attr, '_copy(value) if value.__class__ in _mutable else value', '            '))
+
+    lines.append('        append(obj)')
+    lines.append('    return result')
+
+    source = '\n'.join(lines)
+    exec(compile(source, '<hydrator %s>' % record_cls.__name__, 'exec'), namespace)
+
+    return namespace['hydrate']
@@ -0,0 +1,492 @@
+import base64
+import struct
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Mapping, Tuple
+
+from pyorient import OrientBinaryObject, OrientRecordLink, PyOrientSerializationException
+
+# OType ids, the type bytes of the binary serialization
+BOOLEAN, INTEGER, SHORT, LONG, FLOAT, DOUBLE, DATETIME, STRING, BINARY, EMBEDDED, EMBEDDEDLIST, EMBEDDEDSET, \
+    EMBEDDEDMAP, LINK, LINKLIST, LINKSET, LINKMAP, BYTE, TRANSIENT, DATE, CUSTOM, DECIMAL, LINKBAG, ANY = range(24)
+
+TYPE_IDS = {name: type_id for type_id, name in enumerate(
+    ('BOOLEAN', 'INTEGER', 'SHORT', 'LONG', 'FLOAT', 'DOUBLE', 'DATETIME', 'STRING', 'BINARY', 'EMBEDDED',
+     'EMBEDDEDLIST', 'EMBEDDEDSET', 'EMBEDDEDMAP', 'LINK', 'LINKLIST', 'LINKSET', 'LINKMAP', 'BYTE', 'TRANSIENT',
+     'DATE', 'CUSTOM', 'DECIMAL', 'LINKBAG', 'ANY'))}
+
+# the type byte of a null item in embedded collections (-1)
+NULL = 0xff
+
+_EPOCH = date(1970, 1, 1)
+
+_int = struct.Struct('>i')
+_float = struct.Struct('>f')
+_double = struct.Struct('>d')
+
+_int_from = _int.unpack_from
+_double_from = _double.unpack_from
+
+
+class RidBag(OrientBinaryObject):
+    """A LINKBAG value as the bytes of its serialized bag, see messages.decode_ridbag()"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @property
+    def b64(self):
+        return base64.b64encode(self.data).decode()
+
+    def getBin(self):
+        return self.data
+
+
+class BinaryRecordSerializer:
+    """Decoder of OrientDB's binary record serialization (ORecordSerializerBinary, version 0) in plain python
+
+    Stands in for pyorient's serializer of that format, which needs the pyorient_native extension.
+    `props` are the database's global properties, {id: (name, OType id)}: fields of schema properties
+    are serialized with their property id instead of their name (see global_properties()).
+
+    Values are decoded as pyorient's CSV serializer decodes them: links as OrientRecordLink, embedded
+    documents as dicts (with an `o_class` key when they have a class), sets as lists, ridbags as
+    OrientBinaryObject. Binary values are bytes, dates are `date` objects.
+    """
+
+    def __init__(self, props: Mapping = None):
+        self.props = props or {}
+
+    def decode(self, content: bytes) -> List:
+        """Returns [class name, field values] of a serialized record"""
+        if content[0] != 0:
+            raise PyOrientSerializationException("Unsupported binary serialization version %s" % content[0], [])
+
+        class_name, data, _ = _read_document(content, 1, self.props)
+
+        return [class_name, data]
+
+
+def global_properties(entries) -> Dict[int, Tuple[str, int]]:
+    """{id: (name, OType id)} of the `globalProperties` of the schema record (#0:1)"""
+    return {entry['id']: (entry['name'], TYPE_IDS[entry['type']]) for entry in entries}
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """Zigzag encoded variable length integer (7 bits per byte, least significant group first)"""
+    byte = data[offset]
+
+    if byte < 0x80:
+        return (byte >> 1) ^ -(byte & 1), offset + 1
+
+    value = byte & 0x7f
+    shift = 7
+    offset += 1
+
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+
+        if byte < 0x80:
+            return (value >> 1) ^ -(value & 1), offset
+
+        shift += 7
+
+
+def _read_document(data: bytes, offset: int, props: Mapping) -> Tuple[str, Dict, int]:
+    """Reads the class name, the header and the values of a document, returns them with the offset after it
+
+    Header entries give a field's name (or global property id), the absolute position of its value (0
+    for null) and its type. Values are read as their entry is, in one pass. Most common types are read
+    inline, this is where bulk results spend their time.
+    """
+    length, offset = _read_varint(data, offset)
+    class_name = data[offset:offset + length].decode('utf-8') if length > 0 else None
+    offset += max(length, 0)
+
+    result = {}
+    end = 0
+
+    while True:
+        length = data[offset]
+
+        if length < 0x80:
+            length = (length >> 1) ^ -(length & 1)
+            offset += 1
+        else:
+            length, offset = _read_varint(data, offset)
+
+        if length == 0:
+            break
+
+        if length > 0:
+            name = data[offset:offset + length].decode('utf-8')
+            pointer, = _int_from(data, offset + length)
+            type_id = data[offset + length + 4]
+            offset += length + 5
+        else:
+            try:
+                name, type_id = props[-length - 1]
+            except KeyError:
+                raise PyOrientSerializationException(
+                    "Unknown global property %s, reload them with update_properties()" % (-length - 1), [])
+
+            pointer, = _int_from(data, offset)
+            offset += 4
+
+            if type_id == ANY:
+                type_id = data[offset]
+                offset += 1
+
+        if pointer == 0:
+            result[name] = None
+            continue
+
+        if type_id == STRING:
+            length = data[pointer]
+            if length < 0x80:
+                pointer += 1
+                length = (length >> 1) ^ -(length & 1)
+            else:
+                length, pointer = _read_varint(data, pointer)
+            pointer += length
+            result[name] = data[pointer - length:pointer].decode('utf-8')
+        elif type_id == INTEGER or type_id == LONG or type_id == SHORT:
+            result[name], pointer = _read_varint(data, pointer)
+        elif type_id == DOUBLE:
+            result[name], = _double_from(data, pointer)
+            pointer += 8
+        elif type_id == BOOLEAN:
+            result[name] = data[pointer] == 1
+            pointer += 1
+        else:
+            result[name], pointer = _READERS[type_id](data, pointer, props)
+
+        if pointer > end:
+            end = pointer
+
+    return class_name, result, max(offset, end)
+
+
+def _read_int(data, offset, props):
+    return _read_varint(data, offset)
+
+
+def _read_boolean(data, offset, props):
+    return data[offset] == 1, offset + 1
+
+
+def _read_float(data, offset, props):
+    return _float.unpack_from(data, offset)[0], offset + 4
+
+
+def _read_double(data, offset, props):
+    return _double.unpack_from(data, offset)[0], offset + 8
+
+
+def _read_datetime(data, offset, props):
+    millis, offset = _read_varint(data, offset)
+    return datetime.fromtimestamp(millis / 1000), offset
+
+
+def _read_date(data, offset, props):
+    days, offset = _read_varint(data, offset)
+    return _EPOCH + timedelta(days=days), offset
+
+
+def _read_string(data, offset, props):
+    length, offset = _read_varint(data, offset)
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _read_binary(data, offset, props):
+    length, offset = _read_varint(data, offset)
+    return data[offset:offset + length], offset + length
+
+
+def _read_byte(data, offset, props):
+    value = data[offset]
+    return value - 256 if value > 127 else value, offset + 1
+
+
+def _read_decimal(data, offset, props):
+    scale, length = struct.unpack_from('>ii', data, offset)
+    offset += 8
+    unscaled = int.from_bytes(data[offset:offset + length], 'big', signed=True)
+    return Decimal(unscaled).scaleb(-scale), offset + length
+
+
+def _read_embedded(data, offset, props):
+    class_name, document, offset = _read_document(data, offset, props)
+
+    if class_name:
+        document['o_class'] = class_name
+
+    return document, offset
+
+
+def _read_embedded_collection(data, offset, props):
+    size, offset = _read_varint(data, offset)
+    # the type of the collection is ANY, each item is preceded by its own type
+    offset += 1
+
+    items = []
+    for _ in range(size):
+        type_id = data[offset]
+        offset += 1
+
+        if type_id == NULL:
+            items.append(None)
+        else:
+            value, offset = _READERS[type_id](data, offset, props)
+            items.append(value)
+
+    return items, offset
+
+
+def _read_embedded_map(data, offset, props):
+    size, offset = _read_varint(data, offset)
+
+    entries = []
+    for _ in range(size):
+        key, offset = _READERS[data[offset]](data, offset + 1, props)
+        pointer, = _int.unpack_from(data, offset)
+        entries.append((key, pointer, data[offset + 4]))
+        offset += 5
+
+    result = {}
+    end = offset
+
+    for key, pointer, type_id in entries:
+        if pointer == 0:
+            result[key] = None
+            continue
+
+        result[key], value_end = _READERS[type_id](data, pointer, props)
+        end = max(end, value_end)
+
+    return result, end
+
+
+def _read_link(data, offset, props):
+    cluster, offset = _read_varint(data, offset)
+    position, offset = _read_varint(data, offset)
+
+    # #-2:-1 is a null link
+    if cluster == -2 and position == -1:
+        return None, offset
+
+    return OrientRecordLink('%s:%s' % (cluster, position)), offset
+
+
+def _read_link_collection(data, offset, props):
+    size, offset = _read_varint(data, offset)
+
+    links = []
+    for _ in range(size):
+        link, offset = _read_link(data, offset, props)
+        links.append(link)
+
+    return links, offset
+
+
+def _read_link_map(data, offset, props):
+    size, offset = _read_varint(data, offset)
+
+    result = {}
+    for _ in range(size):
+        key, offset = _READERS[data[offset]](data, offset + 1, props)
+        result[key], offset = _read_link(data, offset, props)
+
+    return result, offset
+
+
+def _read_ridbag(data, offset, props):
+    start = offset
+    config = data[offset]
+    offset += 1
+
+    # bit 1: the uuid of the bag's tree (two longs) follows
+    if config & 2:
+        offset += 16
+
+    if config & 1:
+        # embedded: the (cluster:short, position:long) links follow their count
+        size, = _int.unpack_from(data, offset)
+        offset += 4 + 10 * size
+    else:
+        # tree pointer (file id, page index, page offset), size and the changes not in the tree yet
+        offset += 24
+        changes, = _int.unpack_from(data, offset)
+        offset += 4 + 15 * changes
+
+    return RidBag(bytes(data[start:offset])), offset
+
+
+def _read_null(data, offset, props):
+    return None, offset
+
+
+_READERS = {
+    BOOLEAN: _read_boolean,
+    INTEGER: _read_int,
+    SHORT: _read_int,
+    LONG: _read_int,
+    FLOAT: _read_float,
+    DOUBLE: _read_double,
+    DATETIME: _read_datetime,
+    STRING: _read_string,
+    BINARY: _read_binary,
+    EMBEDDED: _read_embedded,
+    EMBEDDEDLIST: _read_embedded_collection,
+    EMBEDDEDSET: _read_embedded_collection,
+    EMBEDDEDMAP: _read_embedded_map,
+    LINK: _read_link,
+    LINKLIST: _read_link_collection,
+    LINKSET: _read_link_collection,
+    LINKMAP: _read_link_map,
+    BYTE: _read_byte,
+    TRANSIENT: _read_null,
+    DATE: _read_date,
+    CUSTOM: _read_binary,
+    DECIMAL: _read_decimal,
+    LINKBAG: _read_ridbag,
+    ANY: _read_null,
+}
+
+
+def encode_record(data: Mapping, class_name: str = '') -> bytes:
+    """Serializes a document with the binary serialization (version 0), fields are stored by name
+
+    Used for the bound parameters of statements on binary serialized connections (see encode_params()).
+    """
+    buffer = bytearray(b'\x00')
+    _write_document(buffer, data, class_name)
+
+    return bytes(buffer)
+
+
+def _write_varint(buffer: bytearray, value: int):
+    value = (value << 1) ^ (value >> 63)
+
+    while value & ~0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    buffer.append(value)
+
+
+def _write_string(buffer: bytearray, value: str):
+    encoded = value.encode('utf-8')
+    _write_varint(buffer, len(encoded))
+    buffer += encoded
+
+
+def _write_document(buffer: bytearray, data: Mapping, class_name: str):
+    _write_string(buffer, class_name or '')
+
+    pointers = []
+    for name, value in data.items():
+        _write_string(buffer, name)
+        pointers.append((len(buffer), value))
+        buffer += b'\x00\x00\x00\x00'
+        buffer.append(_type_of(value))
+
+    buffer.append(0)
+
+    # values are addressed by their absolute position, null values keep pointer 0
+    for position, value in pointers:
+        if value is not None:
+            _int.pack_into(buffer, position, len(buffer))
+            _write_value(buffer, value)
+
+
+def _type_of(value) -> int:
+    if value is None:
+        return ANY
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, int):
+        return INTEGER if -2147483648 <= value <= 2147483647 else LONG
+    if isinstance(value, float):
+        return DOUBLE
+    if isinstance(value, Decimal):
+        return DECIMAL
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, datetime):
+        return DATETIME
+    if isinstance(value, date):
+        return DATE
+    if isinstance(value, OrientRecordLink):
+        return LINK
+    if isinstance(value, (bytes, bytearray)):
+        return BINARY
+    if isinstance(value, (list, tuple)):
+        return EMBEDDEDLIST
+    if isinstance(value, (set, frozenset)):
+        return EMBEDDEDSET
+    if isinstance(value, Mapping):
+        return EMBEDDEDMAP
+
+    # domain objects are sent as links to their record
+    if getattr(value, '_rid', None):
+        return LINK
+
+    raise ValueError("Can't bind value of type %s as statement parameter" % type(value).__name__)
+
+
+def _write_value(buffer: bytearray, value):
+    type_id = _type_of(value)
+
+    if type_id == BOOLEAN:
+        buffer.append(1 if value else 0)
+    elif type_id in (INTEGER, LONG):
+        _write_varint(buffer, value)
+    elif type_id == DOUBLE:
+        buffer += _double.pack(value)
+    elif type_id == DECIMAL:
+        sign, digits, exponent = value.as_tuple()
+        unscaled = int(''.join(map(str, digits)) or '0') * (-1 if sign else 1)
+        encoded = unscaled.to_bytes(max(1, (unscaled.bit_length() + 8) // 8), 'big', signed=True)
+        buffer += struct.pack('>ii', -exponent, len(encoded)) + encoded
+    elif type_id == STRING:
+        _write_string(buffer, value)
+    elif type_id == DATETIME:
+        _write_varint(buffer, int(round(value.timestamp() * 1000)))
+    elif type_id == DATE:
+        _write_varint(buffer, (value - _EPOCH).days)
+    elif type_id == LINK:
+        cluster, position = str(value).lstrip('#').split(':') if isinstance(value, OrientRecordLink) \
+            else value._rid.lstrip('#').split(':')
+        _write_varint(buffer, int(cluster))
+        _write_varint(buffer, int(position))
+    elif type_id == BINARY:
+        _write_varint(buffer, len(value))
+        buffer += value
+    elif type_id in (EMBEDDEDLIST, EMBEDDEDSET):
+        _write_varint(buffer, len(value))
+        buffer.append(ANY)
+
+        for item in value:
+            if item is None:
+                buffer.append(NULL)
+            else:
+                buffer.append(_type_of(item))
+                _write_value(buffer, item)
+    elif type_id == EMBEDDEDMAP:
+        _write_varint(buffer, len(value))
+
+        pointers = []
+        for key, item in value.items():
+            buffer.append(STRING)
+            _write_string(buffer, str(key))
+            pointers.append((len(buffer), item))
+            buffer += b'\x00\x00\x00\x00'
+            buffer.append(_type_of(item))
+
+        for position, item in pointers:
+            if item is not None:
+                _int.pack_into(buffer, position, len(buffer))
+                _write_value(buffer, item)
@@ -1,16 +1,26 @@
-import inspect
+import time
 from abc import ABC, abstractmethod
+from queue import Full, Queue
+from threading import Event, Thread
 from collections import OrderedDict
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
-from pyorient import OrientRecord, PyOrientCommandException, PyOrientORecordDuplicatedException
+from pyorient import OrientRecord, OrientRecordLink, PyOrientCommandException, PyOrientORecordDuplicatedException, \
+    PyOrientConnectionException
 
-from orientus.core.datatypes import RawType
-from orientus.core.db import OrientUsDB
-from orientus.core.domain import ORecord, OVertex, OEdge
+from orientus.core.columns import Columns
+from orientus.core.datatypes import RawType, inline_params, to_sql_literal
+from orientus.core.db import AsyncOrientUsDB, OrientUsDB
+from orientus.core.domain import ORID, ODirection, ORecord, OVertex, OEdge, navigation
+from orientus.core.identity import IdentityMap
 from orientus.core.match import Graph
-from orientus.core.query import Query
-from orientus.core.utils import to_datatype_obj, get_field_names
+from orientus.core.messages import decode_ridbag
+from orientus.core.query import KeysetPages, Query
+from orientus.core.traverse import Traverse
+from orientus.core.schema import FieldDescriptor, snapshot
+from orientus.core.unit_of_work import UnitOfWork
+from orientus.core.utils import to_datatype_obj
 
 
 class AbstractSession(ABC):
@@ -21,28 +31,53 @@ class AbstractSession(ABC):
 
         self.command_history = []
 
+        # objects attached to a closed session can't load their relationships anymore
+        self.closed = True
+
     def __enter__(self):
         self.connection = self.db.acquire_connection()
+        self.closed = False
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.db.release_connection(self.connection)
+        self.closed = True
+
+        # a connection that failed at socket level can't be handed to the next session
+        self.db.release_connection(self.connection, discard=isinstance(exc_val, PyOrientConnectionException))
 
     @abstractmethod
-    def command(self, statement: str, record: ORecord = None):
-        # TODO: VERY VERY IMPORTANT: implement prepared statement feature (parameterized query)
-        # links: http://orientdb.com/docs/3.0.x/tuning/Performance-Tuning.html#use-parameters-instead-of-hard-wired-values,
-        #        https://orientdb.com/docs/3.0.x/java/Java-Query-API.html
+    def command(self, statement: str, record: ORecord = None, params: List = None):
+        """Executes `statement`, values are bound to its positional `?` placeholders from `params`
+
+        Keeping values out of the statement text lets the server reuse the parsed statement
+        (http://orientdb.com/docs/3.0.x/tuning/Performance-Tuning.html#use-parameters-instead-of-hard-wired-values)
+        """
         pass
 
     @abstractmethod
-    def raw_query(self, query: str, limit: int = -1) -> str:
+    def raw_query(self, query: str, limit: int = -1, params: List = None) -> str:
         if limit > -1 and ' limit ' not in query:
             query = '%s limit %s' % (query, limit)
 
         return query
 
     def create_class(self, clz) -> bool:
+        for command in self._class_statements(clz):
+            if self.debug: print(command)
+
+            self.command(command)
+
+        if self.debug:
+            print()
+
+        return True
+
+    def _class_statements(self, clz, server_properties=None, server_indexes=()) -> List[str]:
+        """Returns the commands creating `clz`, its properties and indexes
+
+        With the property names the class has on the server (None when the class doesn't exist) and the
+        index names of the server, only the missing parts are created.
+        """
 
         # TODO: clasees now only extends V, E not custom vertex classes (e.g. CREATE CLASS Car EXTENDS Vehicle)
         # for help https://orientdb.com/docs/2.1.x/SQL-Create-Class.html
@@ -57,64 +92,57 @@ class AbstractSession(ABC):
             assert clz.__record_name__ is not None
             clz_create_cmd = 'CREATE CLASS %s IF NOT EXISTS' % clz.element_name()
 
-        if self.debug: print(clz_create_cmd)
-
-        self.command(clz_create_cmd)
+        commands = []
 
-        attributes = inspect.getmembers(clz, lambda a: not (inspect.isroutine(a)))
-        clz_attrs = [a for a in attributes if not (a[0].startswith('__') and a[0].endswith('__'))]
+        if server_properties is None:
+            commands.append(clz_create_cmd)
+            server_properties = ()
 
         unique_indices = []
 
-        for (name, datatype) in clz_attrs:
-            if datatype.__class__ == RawType:
-                continue
-
-            if isinstance(datatype, RawType):
+        for field in clz.schema().fields:
+            datatype = field.datatype
 
-                prop_cmd = "CREATE PROPERTY %s.%s %s" % (
-                    clz.element_name(),
-                    datatype.name,
-                    datatype.__class__.__name__[1:].upper()
-                )
+            if datatype.unique:
+                unique_indices.append("%s.%s" % (clz.element_name(), datatype.name))
 
-                constraints = []
+            if field.column in server_properties:
+                continue
 
-                # TODO: add all types of constraints schema for ORecord, OVertex, OEdge
-                # for help https://orientdb.com/docs/2.2.x/SQL-Create-Property.html, https://orientdb.com/docs/3.0.x/gettingstarted/Tutorial-Classes.html
+            prop_cmd = "CREATE PROPERTY %s.%s %s" % (
+                clz.element_name(),
+                field.column,
+                field.type_name
+            )
 
-                if datatype.min is not None:
-                    constraints.append("MIN %s" % (datatype.min))
+            constraints = []
 
-                if datatype.max is not None:
-                    constraints.append("MAX %s" % (datatype.max))
+            # TODO: add all types of constraints schema for ORecord, OVertex, OEdge
+            # for help https://orientdb.com/docs/2.2.x/SQL-Create-Property.html, https://orientdb.com/docs/3.0.x/gettingstarted/Tutorial-Classes.html
 
-                if datatype.mandatory:
-                    constraints.append("MANDATORY TRUE")
+            if datatype.min is not None:
+                constraints.append("MIN %s" % (datatype.min))
 
-                if datatype.unique:
-                    unique_indices.append("%s.%s" % (clz.element_name(), datatype.name))
+            if datatype.max is not None:
+                constraints.append("MAX %s" % (datatype.max))
 
-                if len(constraints) > 0:
-                    prop_cmd = "%s (%s)" % (prop_cmd, ",".join(constraints))
+            if datatype.mandatory:
+                constraints.append("MANDATORY TRUE")
 
-                if self.debug:
-                    print(prop_cmd)
+            if len(constraints) > 0:
+                prop_cmd = "%s (%s)" % (prop_cmd, ",".join(constraints))
 
-                self.command(prop_cmd)
+            commands.append(prop_cmd)
 
         for index in unique_indices:
-            index_cmd = "CREATE INDEX %s UNIQUE" % (index)
-
-            if self.debug:
-                print(index_cmd)
+            if index not in server_indexes:
+                commands.append("CREATE INDEX %s UNIQUE" % (index))
 
-            self.command(index_cmd)
+        for index in clz.schema().indexes:
+            if index.index_name(clz.element_name()) not in server_indexes:
+                commands.append(index.statement(clz.element_name()))
 
-        if self.debug:
-            print()
-
-        return True
+        return commands
 
     def __save_edge(self, frm: OVertex, to: OVertex, edge: OEdge) -> OEdge:
         frm_id = self._get_id(frm)
@@ -123,61 +151,388 @@ class AbstractSession(ABC):
         assert bool(frm_id)
         assert bool(to_id)
 
-        create_cmd = "create edge %s from %s to %s" % (edge.element_name(), frm_id, to_id)
-        value_str = self._fields_to_str(edge)
-        if value_str:
-            create_cmd += ' set ' + value_str
+        create_cmd, params = self._edge_statement(frm_id, to_id, edge)
 
-        self.command(create_cmd, edge)
+        self.command(create_cmd, edge, params=params)
 
         return edge
 
     def save(self, record: ORecord) -> ORecord:
-        clz_name = record.element_name()
-
         if isinstance(record, OEdge):
-            return self.__save_edge(record._from_vertex, record._to_vertex, record)
+            self.__save_edge(record._from_vertex, record._to_vertex, record)
+        else:
+            insert_cmd, params = self._insert_statement(record)
+
+            self.command(insert_cmd, record, params=params)
+
+        self._written(record)
+
+        return record
+
+    @abstractmethod
+    def _written(self, *records: ORecord):
+        """Called once `records` are written, so cached query results reading their classes get dropped"""
+        pass
+
+    @staticmethod
+    def _written_classes(records) -> Set[str]:
+        """Database classes whose query results change with `records`, edges change their endpoints too"""
+        classes = set()
+
+        for record in records:
+            related = [record]
+            if isinstance(record, OEdge):
+                related += [record._from_vertex, record._to_vertex]
 
-        insert_cmd = "insert into %s set " % (clz_name) + self._fields_to_str(record)
+            for clz in {type(r) for r in related if r is not None}:
+                classes.update(base.element_name() for base in clz.__mro__
+                               if issubclass(base, ORecord) and base.element_name())
 
-        self.command(insert_cmd, record)
+        return classes
+
+    def upsert(self, record: ORecord, key_fields=None) -> ORecord:
+        """Updates the record whose `key_fields` equal those of `record`, inserts `record` if there is none
+
+        One `update ... upsert return after where ...` statement, the written record's rid/version is set
+        on `record`. `key_fields` (attribute names or class level fields, e.g. Token.text) default to the
+        unique fields of the class, which have an index the lookup uses.
+        """
+        keys = self._key_fields(record, key_fields)
+        upsert_cmd, params = self._upsert_statement(record, keys)
+
+        self.command(upsert_cmd, record, params=params)
+        self._written(record)
 
         return record
 
+    def save_edges(self, edges: List[OEdge]) -> List[OEdge]:
+        """Saves `edges` one by one, their endpoints must be saved already"""
+        for edge in edges:
+            self.save(edge)
+
+        return edges
+
     @abstractmethod
     def _get_id(self, record: ORecord) -> str:
         pass
 
-    def _fields_to_str(self, record, delimiter=',') -> str:
-        values = []
+    @abstractmethod
+    def _id_value(self, record: ORecord):
+        """Returns the value bound to `@rid = ?` to address `record`"""
+        pass
+
+    def _template(self, key: Tuple, build: Callable[[], str]) -> str:
+        """Returns the statement text cached under `key`, compiling it with `build` on a miss
+
+        Statements of a class with the same properties share one text (only their parameters
+        differ), so the server can reuse their parsed form as well.
+        """
+        template = self.db.statement_cache.get(key)
+
+        if template is None:
+            template = build()
+            self.db.statement_cache.put(key, template)
+
+        return template
+
+    def _insert_statement(self, record: ORecord) -> Tuple[str, List]:
+        items = self._field_values(record)
+        columns = tuple(field for field, _ in items)
+
+        template = self._template(('insert', record.element_name(), columns),
+                                  lambda: "insert into %s set %s" % (record.element_name(), self._assignments(columns)))
+
+        return template, [value for _, value in items]
+
+    def _insert_many_statement(self, records: List[ORecord]) -> str:
+        """Returns one `insert into X content [...]` statement inserting `records` (all of class X)"""
+        contents = ', '.join(to_sql_literal(dict(self._field_values(record))) for record in records)
+
+        return "insert into %s content [%s]" % (records[0].element_name(), contents)
+
+    def _edge_statement(self, frm_id: str, to_id: str, edge: OEdge) -> Tuple[str, List]:
+        items = self._field_values(edge, allow_empty=True)
+        columns = tuple(field for field, _ in items)
+
+        def build():
+            create_cmd = "create edge %s from %%s to %%s" % (edge.element_name())
+            if columns:
+                create_cmd += ' set ' + self._assignments(columns).replace('%', '%%')
+            return create_cmd
+
+        template = self._template(('edge', edge.element_name(), columns), build)
+
+        return template % (frm_id, to_id), [value for _, value in items]
+
+    def _update_statement(self, record: ORecord, items: List[Tuple[str, object]]) -> Tuple[str, List]:
+        columns = tuple(field for field, _ in items)
+
+        template = self._template(('update', record.element_name(), columns),
+                                  lambda: "update %s set %s where @rid = ?" % (record.element_name(),
+                                                                               self._assignments(columns)))
+
+        return template, [value for _, value in items] + [self._id_value(record)]
+
+    def _upsert_statement(self, record: ORecord, keys: List[FieldDescriptor]) -> Tuple[str, List]:
+        items = self._field_values(record)
+        columns = tuple(field for field, _ in items)
+        key_columns = tuple(key.column for key in keys)
 
-        items = [
-            (field, value) for field, value in record.__dict__.items()
-            if field in get_field_names(record.__class__)
-        ]
+        template = self._template(('upsert', record.element_name(), columns, key_columns),
+                                  lambda: "update %s set %s upsert return after where %s" % (
+                                      record.element_name(), self._assignments(columns),
+                                      self._assignments(key_columns, delimiter='and')))
 
-        if len(items) == 0:
+        return template, [value for _, value in items] + [self._key_value(record, key) for key in keys]
+
+    @staticmethod
+    def _key_fields(record: ORecord, key_fields=None) -> List[FieldDescriptor]:
+        schema = record.schema()
+
+        if key_fields is None:
+            if not schema.unique_fields:
+                raise ValueError(record.__class__.__name__ + " has no unique fields, pass key_fields.")
+
+            return schema.unique_fields
+
+        return [schema.field(key) for key in key_fields]
+
+    @staticmethod
+    def _key_value(record: ORecord, key: FieldDescriptor):
+        value = getattr(record, key.attr, key.datatype)
+
+        if value is key.datatype:
+            raise ValueError("%s has no value for key field %s." % (record.__class__.__name__, key.attr))
+
+        return value
+
+    def _delete_statement(self, record: ORecord) -> Tuple[str, List]:
+        if isinstance(record, OVertex):
+            kind = 'delete vertex %s'
+        elif isinstance(record, OEdge):
+            kind = 'delete edge %s'
+        else:
+            kind = 'delete from %s'
+
+        template = self._template(('delete', record.element_name()),
+                                  lambda: (kind + ' where @rid = ?') % record.element_name())
+
+        return template, [self._id_value(record)]
+
+    @staticmethod
+    def _assignments(columns, delimiter=',') -> str:
+        return (' %s ' % delimiter).join("%s = ?" % column for column in columns)
+
+    def _field_values(self, record, allow_empty=False) -> List[Tuple[str, object]]:
+        """Returns (column, value) of the declared fields `record` has a value for"""
+        items = []
+
+        for field in record.schema().fields:
+            value = getattr(record, field.attr, field.datatype)
+
+            # unset attributes resolve to the class level datatype
+            if value is not field.datatype:
+                items.append((field.column, value))
+
+        if len(items) == 0 and not allow_empty:
             raise ValueError(record.__class__.__name__ + " has no properties.")
 
-        for field, value in items:
-            if field in ['_batch_id', '_rid', '_version', '_from_vertex',
-                         '_to_vertex']:  # TODO: business domain object can have these field name?
+        return items
+
+    def _changed_values(self, record) -> List[Tuple[str, object]]:
+        """Returns (column, value) of the fields changed since `record` was loaded or written
+
+        Values are compared with the loaded or written ones, which are kept as copies (see schema.snapshot),
+        so fields changed in place are noticed too.
+        Every field counts as changed for objects that weren't loaded.
+        """
+        if record._loaded is None:
+            return self._field_values(record)
+
+        loaded = record._loaded
+        dirty = record._dirty or ()
+        column_to_attr = record.schema().column_to_attr
+
+        return [(column, value) for column, value in self._field_values(record, allow_empty=True)
+                if column_to_attr[column] in dirty or column not in loaded
+                or (value is not loaded[column] and value != loaded[column])]
+
+    def _fields_to_str(self, record, delimiter=',') -> str:
+        return (' %s ' % delimiter).join(
+            "%s = %s" % (field, to_sql_literal(value)) for field, value in self._field_values(record)
+        )
+
+
+class DirectSession(AbstractSession):
+    """Base of the sessions writing over their own connection right away (Session, AsyncSession)
+
+    Holds what doesn't touch the connection: the identity map, hydration, linking of fetched records and
+    the bookkeeping of written objects.
+    """
+
+    # loaded and written objects get the session, they load their relationships through it
+    attach_objects = True
+
+    def __init__(self, db, identity_map: bool = True):
+        super().__init__(db)
+
+        # loaded/saved objects by rid, so loading a record twice gives the same object (see IdentityMap)
+        self.identity_map = IdentityMap() if identity_map else None
+
+    def _get_id(self, record: ORecord) -> str:
+        return record._rid
+
+    def _id_value(self, record: ORecord) -> OrientRecordLink:
+        if not record._rid:
+            raise ValueError(record.__class__.__name__ + " has no rid, save it first.")
+
+        return OrientRecordLink(record._rid.lstrip('#'))
+
+    def _cache_lookup(self, statement: str, params: List, classes) -> Tuple[str, Optional[List], int]:
+        """Returns the cache key, the cached records (None when not cached) and the stamp to put them with
+
+        The records are cached, not domain objects: hydrated objects copy their mutable values.
+        """
+        key = inline_params(statement, params)
+        stamp = self.db.query_cache.stamp(classes)
+        results = self.db.query_cache.get(key)
+
+        if results is not None and self.debug:
+            print('Cached:', key)
+
+        return key, results, stamp
+
+    def _fetched(self, record_cls, results: List[OrientRecord], fetched: List[OrientRecord]) -> List:
+        """Hydrates the `results` of a query with a fetch plan, linked with the `fetched` records"""
+        objects = self._hydrate(record_cls, results)
+        linked = [obj for obj in self._hydrate_records(fetched) if isinstance(obj, ORecord)]
+
+        self._link(objects + linked)
+
+        return objects
+
+    @staticmethod
+    def _link(objects: List[ORecord]):
+        """Connects loaded objects through the edge links of their records, see OVertex._related"""
+        by_rid = {obj._rid: obj for obj in objects}
+
+        for obj in objects:
+            data = obj._loaded or {}
+
+            if isinstance(obj, OEdge):
+                if obj._from_vertex is None:
+                    obj._from_vertex = by_rid.get(str(data.get('out')))
+                if obj._to_vertex is None:
+                    obj._to_vertex = by_rid.get(str(data.get('in')))
                 continue
 
-            # used repr(str) to escape strings (for more: https://stackoverflow.com/a/13676745)
-            modified_val = repr(value) if type(value) == str else value
+            if not isinstance(obj, OVertex):
+                continue
 
-            values.append("%s = %s" % (field, modified_val))
+            for column, value in data.items():
+                direction, _, edge_name = column.partition('_')
+                edge_cls = ORecord.registry.get(edge_name)
 
-        return (' %s ' % delimiter).join(values)
+                # out_<edge class>/in_<edge class> hold the rids of the vertex' edges
+                if direction not in ('out', 'in') or edge_cls is None or not issubclass(edge_cls, OEdge):
+                    continue
 
+                if hasattr(value, 'getBin'):
+                    rids = decode_ridbag(value)
+                else:
+                    rids = [str(rid) for rid in (value if isinstance(value, list) else [value])]
 
-class Session(AbstractSession):
+                related = [by_rid.get(rid) for rid in rids or ()]
 
-    def command(self, statement, record: ORecord = None, is_update=False) -> List[OrientRecord]:
-        if self.debug: print('Command:', statement)
+                # only relationships fetched completely are kept, the others are loaded on access
+                if rids is None or any(r is None for r in related):
+                    continue
+
+                direction = ODirection.OUT if direction == 'out' else ODirection.IN
+                other_end = 'in' if direction == ODirection.OUT else 'out'
+
+                if obj._related is None:
+                    obj._related = {}
+
+                if all(isinstance(r, OEdge) for r in related):
+                    obj._related[navigation(direction, edge_cls, edges=True)] = related
+                    related = [by_rid.get(str(edge._loaded.get(other_end))) for edge in related]
+
+                    if any(r is None for r in related):
+                        continue
+
+                # lightweight edges link the vertices directly
+                obj._related[navigation(direction, edge_cls)] = related
+
+    def _hydrate_records(self, records: List[OrientRecord], record_cls=None) -> List:
+        """Hydrates `records` of any class, as `record_cls` or as the domain class of their database class"""
+        if record_cls is not None:
+            return self._hydrate(record_cls, records)
+
+        by_class = OrderedDict()
+        for index, record in enumerate(records):
+            by_class.setdefault(ORecord.registry.get(record._class), []).append(index)
+
+        result = list(records)
+
+        for clz, indexes in by_class.items():
+            if clz is not None:
+                for index, obj in zip(indexes, self._hydrate(clz, [records[i] for i in indexes])):
+                    result[index] = obj
+
+        return result
+
+    def _hydrate(self, record_cls, records: List[OrientRecord]) -> List:
+        if self.identity_map is None:
+            objects = to_datatype_obj(record_cls, records)
+        else:
+            objects = self.identity_map.hydrate(record_cls, records)
+
+        # loaded objects load their relationships through the session
+        if self.attach_objects:
+            for obj in objects:
+                obj._session = self
+
+        return objects
+
+    def _written(self, *records: ORecord):
+        self.db.query_cache.invalidate(self._written_classes(records))
+
+        for record in records:
+            # written values are what later updates are compared with
+            record._loaded = snapshot(self._field_values(record, allow_empty=True))
+            record._dirty = None
+
+            if self.attach_objects:
+                record._session = self
+
+            # written objects are the ones later loads resolve to
+            if self.identity_map is not None:
+                self.identity_map.add(record)
+
+
+class Session(DirectSession):
+
+    def __init__(self, db: OrientUsDB, identity_map: bool = True, unit_of_work: bool = False):
+        super().__init__(db, identity_map)
+
+        # with a unit of work writes are queued and sent as one transaction by flush() (or on exit),
+        # queries don't see them before
+        self.unit_of_work = UnitOfWork() if unit_of_work else None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.flush()
+            elif self.unit_of_work is not None:
+                self.unit_of_work.clear()
+        finally:
+            super().__exit__(exc_type, exc_val, exc_tb)
+
+    def command(self, statement, record: ORecord = None, is_update=False, params: List = None) -> List[OrientRecord]:
+        if self.debug: print('Command:', statement, params if params else '')
         try:
-            results = self.connection.command(statement)
+            results = self.connection.command(statement, params=params)
 
             if self.debug:
                 print('Result Count:', len(results))
@@ -197,114 +552,896 @@ class Session(AbstractSession):
 
         return results
 
-    def raw_query(self, query: str, limit: int = -1) -> List[OrientRecord]:
+    def raw_query(self, query: str, limit: int = -1, params: List = None) -> List[OrientRecord]:
         query = super().raw_query(query, limit)
 
-        results = self.command(query)
+        results = self.command(query, params=params)
+
+        return results
+
+    def command_many(self, statements, window: int = 100) -> List[List[OrientRecord]]:
+        """Runs `statements` (texts or (text, params) pairs) pipelined, see OrientUs.command_many()
+
+        Returns the results of each statement in order, [] for a statement that failed (as command()).
+        """
+        if self.debug:
+            for statement in statements:
+                print('Command:', statement)
+
+        results = self.connection.command_many(statements, window, return_exceptions=True)
+
+        for index, result in enumerate(results):
+            if isinstance(result, PyOrientCommandException):
+                print('error occured during executing command', result)
+                results[index] = []
+            elif isinstance(result, Exception):
+                raise result
 
         return results
 
-    def query(self, qry: Query) -> List:
-        results = self.raw_query(qry._done())
-        return to_datatype_obj(qry.record_cls, results)
+    def query(self, qry: Query, cache: bool = False) -> List:
+        """Runs `qry`, with `cache` the records are kept in the db's query cache (see OrientUsDB.query_cache)
+
+        The records fetched along by the fetch plan of `qry` are hydrated too and linked into the returned
+        objects: OVertex.get_edges/get_vertices and OEdge.get_from/get_to return them without querying.
+        """
+        statement = qry._done()
+
+        if qry.fetch_plan:
+            return self._fetch(qry.record_cls, statement, qry.params, qry.fetch_plan)
+
+        if cache:
+            results = self._cached(statement, qry.params, [qry.record_cls.element_name()])
+        else:
+            results = self.raw_query(statement, params=qry.params)
+
+        return self._hydrate(qry.record_cls, results)
+
+    def iter_query(self, qry: Query, page_size: int = 1000) -> Iterator:
+        """Yields the results of `qry` hydrated page by page, at most `page_size` records are held at a time
+
+        Pages are fetched with RID keyset pagination (`@rid > last`, see KeysetPages), so the query can't
+        have ORDER BY, GROUP BY, UNWIND or a projection. A LIMIT on the query caps the total count.
+        """
+        pages = KeysetPages(qry, page_size)
+        page = pages.next()
+
+        while page is not None:
+            statement, params = page
+            records = self.command(statement, params=params)
+
+            yield from self._hydrate(qry.record_cls, records)
+
+            page = pages.next(records)
+
+    def traverse(self, traverse: Traverse) -> List:
+        """Runs `traverse`, the visited records are hydrated as the domain classes of their database classes"""
+        return self._hydrate_records(self.command(traverse._done(), params=traverse.params))
+
+    def iter_traverse(self, traverse: Traverse, page_size: int = 1000, pages: int = 2) -> Iterator:
+        """Yields the records visited by `traverse` while the server still sends them
+
+        The records are read by a thread through an async query, on a connection borrowed from the pool,
+        and handed over in pages of `page_size` records, at most `pages` of them wait to be consumed
+        (reading blocks when the consumer lags behind). The session can be used while iterating.
+        """
+        statement = traverse._done()
+
+        if self.debug: print('Traverse:', statement, traverse.params if traverse.params else '')
+
+        stream = self._stream([(statement, traverse.params)], list, page_size, pages)
+        try:
+            for page in stream:
+                yield from self._hydrate_records(page)
+        finally:
+            stream.close()
+
+    def query_columns(self, qry: Query, *fields: RawType) -> Columns:
+        """Runs `qry` and returns the values of `fields` (all fields of the class by default) per field
+
+        The records are handed from the connection straight into the columns, no list of records or
+        domain objects is built: numeric, boolean and datetime fields take the size of their values
+        (see Columns, Columns.to_numpy converts them to numpy arrays).
+        """
+        statement = qry._done()
+        columns = Columns(qry.record_cls, fields)
+
+        if self.debug: print('Query columns:', statement, qry.params if qry.params else '')
+
+        try:
+            self.connection.query_async(statement, -1, '*:0', columns.append, params=qry.params)
+        except PyOrientCommandException as e:
+            print('error occured during executing query', e)
+
+        return columns
+
+    def iter_query_columns(self, qry: Query, *fields: RawType, page_size: int = 10000,
+                           pages: int = 2) -> Iterator[Columns]:
+        """Yields the results of `qry` as Columns (see query_columns) of up to `page_size` rows each,
+        read while the server still sends them, as iter_traverse does
+        """
+        statement = qry._done()
+
+        if self.debug: print('Query columns:', statement, qry.params if qry.params else '')
+
+        yield from self._stream([(statement, qry.params)], lambda: Columns(qry.record_cls, fields), page_size, pages)
+
+    def parallel_scan(self, record_cls, qry: Query = None, workers: int = 4, page_size: int = 1000) -> Iterator:
+        """Yields the results of `qry` (all records of `record_cls` by default) read on `workers` pooled
+        connections at once, hydrated as `record_cls`
+
+        The scan is split into a partition per cluster of the class and its subclasses, the clusters are
+        split further into RID ranges when there are fewer of them than workers. The records are yielded
+        as the partitions send them, in no particular order, so the query can't have ORDER BY, GROUP BY,
+        UNWIND, SKIP, LIMIT or a projection. The pool should allow `workers` connections besides the
+        session's own. Closing the generator early or a failing partition stops the other partitions.
+        """
+        assert workers > 0
+
+        if qry is None:
+            qry = Query(record_cls)
+
+        queries = [qry._partition(cluster, start, end) for cluster, start, end in self._partitions(record_cls, workers)]
+
+        if self.debug: print('Parallel scan:', len(queries), 'partitions of', record_cls.element_name())
+
+        stream = self._stream(queries, list, page_size, 2 * workers, workers)
+        try:
+            for page in stream:
+                yield from self._hydrate(record_cls, page)
+        finally:
+            stream.close()
+
+    def _partitions(self, record_cls, workers: int) -> List[Tuple[int, Optional[int], Optional[int]]]:
+        """Returns (cluster, start, end) position ranges covering the clusters of `record_cls`, at least
+        `workers` of them when the clusters have records enough; None is an open end
+        """
+        clusters = self._clusters(record_cls)
+
+        if len(clusters) >= workers:
+            return [(cluster, None, None) for cluster in clusters]
+
+        splits = -(-workers // len(clusters)) if clusters else 1
+        partitions = []
+
+        for cluster in clusters:
+            # the server iterates the cluster backwards for a descending @rid, it doesn't sort it
+            last = self.command('SELECT FROM cluster:%d ORDER BY @rid DESC LIMIT 1' % cluster)
+            if not last:
+                continue
+
+            size = ORID(last[0]._rid).get_cluster_position() + 1
+            step = -(-size // splits)
+
+            # the last range stays open, records inserted meanwhile are read too
+            for start in range(0, size, step):
+                partitions.append((cluster, start or None, start + step if start + step < size else None))
+
+        return partitions
+
+    def _clusters(self, record_cls) -> List[int]:
+        """Returns the cluster ids of the database class of `record_cls` and of its subclasses"""
+        classes = self.command('SELECT name, superClass, superClasses, clusterIds '
+                               'FROM (SELECT expand(classes) FROM metadata:schema)')
+
+        # class names are case insensitive
+        cluster_ids, subclasses = {}, {}
+        for record in classes:
+            data = record.oRecordData
+            name = data['name'].lower()
+
+            cluster_ids[name] = data.get('clusterIds') or []
+
+            supers = data.get('superClasses') or ([data['superClass']] if data.get('superClass') else [])
+            for parent in supers:
+                subclasses.setdefault(parent.lower(), []).append(name)
+
+        pending, seen, clusters = [record_cls.element_name().lower()], set(), set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+
+            seen.add(name)
+            clusters.update(cluster_ids.get(name, ()))
+            pending.extend(subclasses.get(name, ()))
+
+        # abstract classes have the cluster -1
+        return sorted(cluster for cluster in clusters if cluster >= 0)
+
+    def _stream(self, queries: List[Tuple[str, List]], new_page: Callable, page_size: int, pages: int,
+                workers: int = 1) -> Iterator:
+        """Runs `queries` ((statement, params) pairs) as async queries on reader threads and yields their
+        records in pages
+
+        `workers` threads read them at once on connections borrowed from the pool, their pages interleaved;
+        the session's own connection stays free for the consumer. A page is created by `new_page` (a list,
+        Columns, ...) and filled with its append(), a full page waits in a queue of at most `pages` pages
+        until it is consumed. When the consumer stops (or a query fails), the readers stop at their next
+        record and discard their connections, the rest of the responses is never read.
+        """
+        assert page_size > 0 and workers > 0
+
+        queue = Queue(maxsize=pages)
+        stopped = Event()
+        end = object()
+
+        def offer(item):
+            # a consumer that stopped reading doesn't take anything anymore
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def read(connection, statement: str, params: List):
+            page = new_page()
+
+            def collect(record: OrientRecord):
+                nonlocal page
+
+                if stopped.is_set():
+                    raise StreamStopped()
+
+                page.append(record)
+
+                if len(page) >= page_size:
+                    offer(page)
+                    page = new_page()
+
+            connection.query_async(statement, -1, '*:0', collect, params=params)
+
+            if len(page):
+                offer(page)
+
+        def run(statement: str, params: List):
+            if stopped.is_set():
+                return
+
+            connection = self.db.acquire_connection()
+            # a connection left in the middle of a response can't be used anymore
+            discard = True
+            try:
+                read(connection, statement, params)
+                discard = False
+            except StreamStopped:
+                pass
+            except PyOrientCommandException as e:
+                discard = False
+                offer(e)
+            except Exception as e:
+                offer(e)
+            finally:
+                self.db.release_connection(connection, discard=discard)
+                offer(end)
+
+        executor = ThreadPoolExecutor(workers)
+        for query in queries:
+            executor.submit(run, *query)
+
+        running = len(queries)
+
+        try:
+            while running:
+                item = queue.get()
+
+                if item is end:
+                    running -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+
+                yield item
+        finally:
+            stopped.set()
+            executor.shutdown(cancel_futures=True)
+
+    def load(self, rid, record_cls=None) -> Optional[ORecord]:
+        """Returns the object of the record `rid` (str, ORID or OrientRecordLink), None if there is none"""
+        return self.load_many([rid], record_cls)[0]
+
+    def load_many(self, rids, record_cls=None, chunk_size: int = 500) -> List[Optional[ORecord]]:
+        """Loads the records of `rids` with one `select from [#a, #b, ...]` per `chunk_size` rids
+
+        Returns their objects in the order of `rids`, None for rids without a record. Records are
+        hydrated as `record_cls`, or as the domain class registered for their database class (left
+        as OrientRecord when there is none).
+        """
+        assert chunk_size > 0
+
+        rids = [str(ORID(rid)) for rid in rids]
+        loaded = {}
+
+        for start in range(0, len(rids), chunk_size):
+            chunk = list(OrderedDict.fromkeys(rids[start:start + chunk_size]))
+
+            records = self.command("select from [%s]" % ', '.join(chunk))
+
+            for record, obj in zip(records, self._hydrate_records(records, record_cls)):
+                loaded[record._rid] = obj
+
+        return [loaded.get(rid) for rid in rids]
+
+    def get_many(self, record_cls, field, keys, chunk_size: int = 500) -> List[Optional[ORecord]]:
+        """Looks `keys` up in `field` (attribute name or class level field) with chunked `in` queries
+
+        Meant for unique, indexed fields: returns one object per key in the order of `keys`, None
+        for keys without a record.
+        """
+        assert chunk_size > 0
+
+        keys = list(keys)
+        descriptor = record_cls.schema().field(field)
+
+        found = {}
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = list(OrderedDict.fromkeys(keys[start:start + chunk_size]))
+
+            records = self.command("select from %s where %s in ?" % (record_cls.element_name(), descriptor.column),
+                                   params=[chunk])
+
+            for obj in self._hydrate(record_cls, records):
+                found.setdefault(getattr(obj, descriptor.attr), obj)
+
+        return [found.get(key) for key in keys]
+
+    def prefetch(self, vertices: List[OVertex], direction: ODirection = ODirection.OUT, edge_cls=None,
+                 edges: bool = False, chunk_size: int = 500) -> List[OVertex]:
+        """Loads the neighbour vertices (or with `edges` the edges) of all `vertices` in two queries per chunk
+
+        `select @rid as source, out('X') as targets from [#a, #b, ...]` collects the neighbours' rids,
+        load_many() loads them. Afterwards get_vertices()/get_edges() of `vertices` don't query anymore.
+        """
+        assert chunk_size > 0
+
+        key = navigation(direction, edge_cls, edges)
+        vertices = [vertex for vertex in vertices if vertex._rid]
+
+        for start in range(0, len(vertices), chunk_size):
+            chunk = vertices[start:start + chunk_size]
+            rids = list(OrderedDict.fromkeys(vertex._rid for vertex in chunk))
+
+            rows = self.command("select @rid as source, %s as targets from [%s]" % (key, ', '.join(rids)))
+
+            targets = {}
+            for row in rows:
+                targets[str(row.oRecordData.get('source'))] = [str(rid) for rid in row.oRecordData.get('targets') or ()]
+
+            neighbours = self._load_distinct([rid for rids in targets.values() for rid in rids],
+                                             edge_cls if edges else None)
+
+            for vertex in chunk:
+                if vertex._related is None:
+                    vertex._related = {}
+
+                vertex._related[key] = [neighbours[rid] for rid in targets.get(vertex._rid, ())
+                                        if neighbours.get(rid) is not None]
+
+        return vertices
+
+    def prefetch_endpoints(self, edges: List[OEdge], chunk_size: int = 500) -> List[OEdge]:
+        """Loads the missing from/to vertices of `edges` loaded from the database with load_many()"""
+        # the endpoints of a loaded edge are the links in its out/in properties
+        edges = [edge for edge in edges if edge._loaded is not None and 'out' in edge._loaded]
+
+        rids = []
+        for edge in edges:
+            rids += [str(edge._loaded['out']), str(edge._loaded['in'])]
+
+        vertices = self._load_distinct(rids, chunk_size=chunk_size)
+
+        for edge in edges:
+            if edge._from_vertex is None:
+                edge._from_vertex = vertices.get(str(edge._loaded['out']))
+            if edge._to_vertex is None:
+                edge._to_vertex = vertices.get(str(edge._loaded['in']))
+
+        return edges
+
+    def _load_distinct(self, rids: List[str], record_cls=None, chunk_size: int = 500) -> Dict[str, ORecord]:
+        """Returns the objects of `rids` by rid, each rid loaded once"""
+        rids = list(OrderedDict.fromkeys(rids))
+        return dict(zip(rids, self.load_many(rids, record_cls, chunk_size))) if rids else {}
+
+    def save(self, record: ORecord) -> ORecord:
+        if self.unit_of_work is not None:
+            self.unit_of_work.insert(record)
+            return record
+
+        return super().save(record)
+
+    def save_many(self, records: List[ORecord], chunk_size: int = 500) -> List[ORecord]:
+        """Saves `records` with one multi-record insert per class and `chunk_size` records
+
+        The records returned by each insert are in content order, their rid/version is set on the saved objects.
+        Edges need their endpoints' rids, they are saved one by one after the other records.
+        """
+        assert chunk_size > 0
+
+        if self.unit_of_work is not None:
+            for record in records:
+                self.unit_of_work.insert(record)
+            return records
+
+        by_class = OrderedDict()
+        edges = []
+
+        for record in records:
+            if isinstance(record, OEdge):
+                edges.append(record)
+            else:
+                by_class.setdefault(record.element_name(), []).append(record)
+
+        for class_records in by_class.values():
+            for start in range(0, len(class_records), chunk_size):
+                chunk = class_records[start:start + chunk_size]
+
+                results = self.command(self._insert_many_statement(chunk))
+
+                for record, result in zip(chunk, results):
+                    record._rid = result._rid
+                    record._version = result._version
+
+        for edge in edges:
+            self.save(edge)
+
+        self._written(*records)
+
+        return records
+
+    def save_edges(self, edges: List[OEdge], chunk_size: int = 500) -> List[OEdge]:
+        """Creates `edges` with one statement per class, properties and shared endpoint, see _edge_groups()
+
+        The endpoints must be saved already, the created edges' rid/version is set on `edges`.
+        """
+        if self.unit_of_work is not None:
+            for edge in edges:
+                self.unit_of_work.insert(edge)
+            return edges
+
+        for statement, params, group in self._edge_groups(edges, chunk_size):
+            results = self.command(statement, params=params)
+
+            # created edges are matched to the objects by their endpoints
+            created = {}
+            for result in results:
+                endpoints = (str(result.oRecordData.get('out')), str(result.oRecordData.get('in')))
+                created.setdefault(endpoints, []).append(result)
+
+            for edge in group:
+                matches = created.get((edge._from_vertex._rid, edge._to_vertex._rid))
+
+                if matches:
+                    result = matches.pop(0)
+                    edge._rid = result._rid
+                    edge._version = result._version
+
+        self._written(*edges)
+
+        return edges
+
+    def upsert(self, record: ORecord, key_fields=None) -> ORecord:
+        if self.unit_of_work is not None:
+            self.unit_of_work.upsert(record, self._key_fields(record, key_fields))
+            return record
+
+        return super().upsert(record, key_fields)
+
+    def _edge_groups(self, edges: List[OEdge], chunk_size: int) -> Iterator[Tuple[str, List, List[OEdge]]]:
+        """Yields (statement, params, edges) creating `edges` with as few `create edge` statements as possible
+
+        `create edge X from [#a, #b] to #c` creates an edge from every source to every target, so only edges
+        of the same class and properties sharing one endpoint can go in one statement. Edges are grouped by
+        their target or by their source, whichever gives fewer statements.
+        """
+        assert chunk_size > 0
+
+        by_target = OrderedDict()
+        by_source = OrderedDict()
+
+        for edge in edges:
+            frm_id = self._get_id(edge._from_vertex)
+            to_id = self._get_id(edge._to_vertex)
+
+            assert bool(frm_id)
+            assert bool(to_id)
+
+            properties = tuple((column, to_sql_literal(value))
+                               for column, value in self._field_values(edge, allow_empty=True))
+            kind = (edge.element_name(), properties)
+
+            by_target.setdefault((kind, to_id), []).append((frm_id, edge))
+            by_source.setdefault((kind, frm_id), []).append((to_id, edge))
+
+        if len(by_target) <= len(by_source):
+            groups, shared_source = by_target, False
+        else:
+            groups, shared_source = by_source, True
+
+        for (_, shared_id), group in groups.items():
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+
+                ids = '[%s]' % ', '.join(rid for rid, _ in chunk)
+                frm_id, to_id = (shared_id, ids) if shared_source else (ids, shared_id)
+
+                statement, params = self._edge_statement(frm_id, to_id, chunk[0][1])
+
+                yield statement, params, [edge for _, edge in chunk]
 
     def save_if_not_exists(self, record: ORecord) -> ORecord:
+        """Saves `record`, returns the record already stored with the same unique fields if there is one"""
+        if self.unit_of_work is not None:
+            # the duplicate is known once the insert fails, a queued insert can't return it
+            raise ValueError("save_if_not_exists() can't be queued by the unit of work, use upsert()")
+
         try:
             self.save(record)
             return record
         except PyOrientORecordDuplicatedException:
+            # the duplicate is looked up by the unique (indexed) fields when the class declares them
+            if record.schema().unique_fields:
+                items = [(key.column, self._key_value(record, key)) for key in record.schema().unique_fields]
+            else:
+                items = self._field_values(record)
+
             result = self.command(
                 "SELECT FROM %s WHERE %s" %
-                (record.element_name(), self._fields_to_str(record, delimiter='AND'))
+                (record.element_name(), self._assignments([field for field, _ in items], delimiter='AND')),
+                params=[value for _, value in items]
             )
-            cast_result = to_datatype_obj(record.__class__, result)
+            cast_result = self._hydrate(record.__class__, result)
             return cast_result[0]
 
     def update(self, record: ORecord) -> bool:
-        update_cmd = "update %s set %s where @rid = %s" % (
-            record.element_name(),
-            self._fields_to_str(record),
-            record._rid
-            # self._fields_to_str(record, delimiter='AND')
-        )
+        if self.unit_of_work is not None:
+            self.unit_of_work.update(record)
+            return True
 
-        self.command(update_cmd, record, is_update=True)
+        items = self._changed_values(record)
+        if not items:
+            return True
+
+        update_cmd, params = self._update_statement(record, items)
+
+        self.command(update_cmd, record, is_update=True, params=params)
+        self._written(record)
 
         return True
 
     # TODO: implement upsert or not?
 
     def update_by_id(self, record: ORecord) -> bool:
-        update_cmd = "update %s set %s where @rid = '%s'" % (
-            record.element_name(),
-            self._fields_to_str(record),
-            self._get_id(record)
-        )
+        if self.unit_of_work is not None:
+            self.unit_of_work.update(record)
+            return True
+
+        items = self._changed_values(record)
+        if not items:
+            return True
 
-        self.command(update_cmd, record)
+        update_cmd, params = self._update_statement(record, items)
+
+        self.command(update_cmd, record, is_update=True, params=params)
+        self._written(record)
 
         return True
 
     def delete(self, record: ORecord) -> bool:
-        id = self._get_id(record)
+        if self.unit_of_work is not None:
+            self.unit_of_work.delete(record)
+            return True
 
-        if isinstance(record, OVertex):
-            delete_cmd = "delete vertex %s" % id
-        elif isinstance(record, OEdge):
-            delete_cmd = "delete edge %s" % id
-        else:
-            delete_cmd = "delete from %s where @rid = %s" % (record.element_name(), id)
+        delete_cmd, params = self._delete_statement(record)
 
-        self.command(delete_cmd, record)
+        # the result is the deleted count, not a record to take the rid from
+        self.command(delete_cmd, params=params)
+        self._written(record)
+
+        if self.identity_map is not None:
+            self.identity_map.remove(record)
 
         return True
 
-    def _get_id(self, record: ORecord) -> str:
+    def flush(self):
+        """Sends the writes queued in the unit of work as one transaction script
+
+        Upserts go first, then inserts (edges after the records they connect, referencing new ones by their
+        script variable), then updates of the changed fields, then deletes. The saved and upserted objects
+        get the rids the script returns.
+        """
+        if not self.unit_of_work:
+            return
+
+        upserts = self.unit_of_work.upserts()
+        inserts = self.unit_of_work.inserts()
+        updates = self.unit_of_work.updates()
+        deletes = self.unit_of_work.deletes()
+
+        builder = BatchQueryBuilder()
+
+        try:
+            for record, keys in upserts:
+                builder.add(inline_params(*self._upsert_statement(record, keys)), record)
+
+            for record in inserts:
+                if isinstance(record, OEdge):
+                    frm_id = self._pending_id(record._from_vertex)
+                    to_id = self._pending_id(record._to_vertex)
+
+                    if not frm_id or not to_id:
+                        raise ValueError('%s edge from %s to %s: its %s vertex is neither saved nor queued' % (
+                            record.element_name(), frm_id or type(record._from_vertex).__name__,
+                            to_id or type(record._to_vertex).__name__, 'from' if not frm_id else 'to'))
+
+                    statement, params = self._edge_statement(frm_id, to_id, record)
+                else:
+                    statement, params = self._insert_statement(record)
+
+                builder.add(inline_params(statement, params), record)
+
+            for record in updates:
+                items = self._changed_values(record)
+                if items:
+                    builder.add(inline_params(*self._update_statement(record, items)))
+
+            for record in deletes:
+                builder.add(inline_params(*self._delete_statement(record)))
+
+            if len(builder) == 0:
+                self.unit_of_work.clear()
+                return
+
+            chunk = BatchChunk(builder)
+            if self.debug: print(chunk.script)
+
+            # the queue is kept when the script fails, flush() can be retried
+            chunk.bind(self.connection.batch(chunk.script))
+            self.unit_of_work.clear()
+            chunk.apply()
+        finally:
+            for record in builder.record_list:
+                record._batch_id = None
+
+        self._written(*(record for record, _ in upserts), *inserts, *updates, *deletes)
+
+        if self.identity_map is not None:
+            for record in deletes:
+                self.identity_map.remove(record)
+
+    @staticmethod
+    def _pending_id(record: ORecord) -> str:
+        # records inserted by the same script are referenced by its variable
+        if record._batch_id is not None:
+            return "$" + record._batch_id
+
         return record._rid
 
-    def match(self, graph: Graph) -> List[OrientRecord]:
+    def match(self, graph: Graph, cache: bool = False) -> List[OrientRecord]:
+        if cache:
+            return self._cached(graph.done(), None, graph.classes)
+
         return self.command(graph.done())
 
+    def _cached(self, statement: str, params: List, classes) -> List[OrientRecord]:
+        key, results, stamp = self._cache_lookup(statement, params, classes)
+
+        if results is None:
+            results = self.command(statement, params=params)
+            self.db.query_cache.put(key, results, classes, stamp)
+
+        return results
+
+    def sync_schema(self, classes) -> List[str]:
+        """Creates the classes, properties and indexes of `classes` missing on the server
+
+        Reads the server classes and indexes with one query, then sends all missing parts as one script
+        (schema changes can't be part of a transaction, so it has no begin/commit): two round-trips at
+        most. Returns the commands sent.
+        """
+        schema = self.command("select classes, $indexes.name as indexes from metadata:schema "
+                              "let $indexes = (select expand(indexes) from metadata:indexmanager)")
+        data = schema[0].oRecordData if schema else {}
+
+        server_classes = {}
+        for server_class in data.get('classes') or []:
+            server_class = getattr(server_class, 'oRecordData', server_class)
+            properties = server_class.get('properties') or []
+
+            # class names are case insensitive
+            server_classes[server_class['name'].lower()] = {getattr(prop, 'oRecordData', prop).get('name')
+                                                            for prop in properties}
+
+        server_indexes = set(data.get('indexes') or [])
+
+        commands = []
+        for clz in classes:
+            commands += self._class_statements(clz, server_classes.get(clz.element_name().lower()), server_indexes)
+
+        if commands:
+            script = ";\n".join(commands)
+
+            if self.debug: print(script)
+            self.connection.batch(script)
+
+        return commands
+
+    def _fetch(self, record_cls, statement: str, params: List, fetch_plan: str) -> List:
+        if self.debug: print('Query:', statement, params if params else '', 'fetch plan:', fetch_plan)
+
+        # the linked records come after the results, handed to the callback one by one
+        fetched = []
+
+        try:
+            results = self.connection.query(statement, -1, fetch_plan, fetched.append, params=params)
+        except PyOrientCommandException as e:
+            print('error occured during executing query', e)
+            return []
+
+        return self._fetched(record_cls, results, fetched)
 
 #     TODO: all operations are returning TRUE...need to return false when opration became unsuccessful
 
 
+class StreamStopped(Exception):
+    """Raised by the records callback of a stream's reader once the consumer stopped, see Session._stream"""
+
+
 class BatchQueryBuilder:
 
-    def __init__(self):
-        self.index = 0
+    def __init__(self, index: int = 0):
+        # variable numbering continues across the chunks of a batch
+        self.index = index
         self.record_list: List[ORecord] = []
         self.query_dict = OrderedDict()
+        self.size = 0
+
+        # classes written by the statements, their cached query results are dropped once the chunk is sent
+        self.classes = set()
+
+    def __len__(self):
+        return len(self.query_dict)
 
     def add(self, statement: str, record: ORecord = None):
         self.index += 1
         idx_str = str(self.index)
 
         if record is None:
-            self.query_dict['qry' + idx_str] = statement
+            variable = 'qry' + idx_str
+        elif record._batch_id is None:
+            variable = record._batch_id = record.element_name() + idx_str
+            self.record_list.append(record)
         else:
-            if record._batch_id is None:
-                record._batch_id = record.element_name() + idx_str
-                self.query_dict[record._batch_id] = statement
+            return
 
-                self.record_list.append(record)
+        self.query_dict[variable] = statement
+        self.size += len(variable) + len(statement) + len('let  = ;\n')
 
-    # TODO: think about batch return data
     def finalize(self) -> str:
-        for r in self.record_list:
-            r._batch_id = None
-
         result = ["let %s = %s" % (variable, query) for variable, query in self.query_dict.items()]
+        script = ";\n".join(["begin", ";\n".join(result), "commit retry 10;"])
 
-        return ";\n".join(["begin", ";\n".join(result), "commit retry 10;"])
+        # the saved records come back in variable order, see BatchChunk.bind() and apply()
+        if self.record_list:
+            script += "\nreturn [%s]" % ", ".join("$" + r._batch_id for r in self.record_list)
+
+        return script
+
+
+class BatchChunk:
+    """Part of a batch sent as one transaction script"""
+
+    def __init__(self, builder: BatchQueryBuilder):
+        self.records = builder.record_list
+        self.classes = builder.classes
+        self.statements = len(builder)
+        self.script = builder.finalize()
+
+        self.results = {}
+        self.retries = 0
+        self.future: Future = None
+
+    def bind(self, results: List):
+        for record, result in zip(self.records, results or []):
+            self.results[record._batch_id] = result
+
+    def rid(self, variable: str) -> str:
+        if self.future is not None:
+            # raises the chunk's error, if any
+            self.future.result()
+
+        rid, _ = result_identity(self.results.get(variable))
+        if rid is None:
+            raise ValueError("batch result has no rid for $%s" % variable)
+
+        return rid
+
+    def apply(self):
+        """Sets the generated rid/version on the records saved by this chunk"""
+        for record in self.records:
+            rid, version = result_identity(self.results.get(record._batch_id))
+
+            if rid is not None:
+                record._rid = rid
+                record._version = version
+
+
+class BatchSummary:
+
+    def __init__(self):
+        self.chunks = 0
+        self.statements = 0
+        self.retries = 0
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return '%s(chunks=%s, statements=%s, retries=%s, elapsed=%.3fs)' % (
+            self.__class__.__name__, self.chunks, self.statements, self.retries, self.elapsed)
+
+
+def result_identity(result) -> Tuple[str, int]:
+    """Returns rid and version of a batch result, `let` variables hold a record or a list of records (edges)"""
+    if isinstance(result, list):
+        result = result[0] if result else None
+
+    if isinstance(result, OrientRecordLink):
+        return result.get_hash(), None
+
+    if isinstance(result, OrientRecord):
+        if result._rid and not result._rid.startswith('#-'):
+            return result._rid, result._version
+
+        # non record values come back wrapped in a temporary record
+        for value in result.oRecordData.values():
+            return result_identity(value)
+
+    return None, None
+
+
+def is_retryable(error: Exception) -> bool:
+    return 'ConcurrentModification' in str(error) or 'NeedRetry' in str(error)
 
 
 class BatchSession(AbstractSession):
+    """Collects statements into transaction scripts, sent by end_batch()
 
-    def __init__(self, db: OrientUsDB):
+    Saved records (vertices and edges) get the rid/version the server generated once end_batch() returns.
+
+    With `max_statements` and/or `max_script_bytes` a batch is split into chunks sent as soon as they
+    fill up, so a huge load doesn't build one giant script and a conflict only retries its chunk (up
+    to `max_retries` times). With `workers` > 1 chunks are sent concurrently, each over its own pooled
+    connection; a chunk referencing records of an earlier chunk is built once their rids are known.
+    """
+
+    def __init__(self, db: OrientUsDB,
+                 max_statements: int = None,
+                 max_script_bytes: int = None,
+                 workers: int = 1,
+                 max_retries: int = 3):
         super().__init__(db)
 
+        assert workers > 0
+
+        self.max_statements = max_statements
+        self.max_script_bytes = max_script_bytes
+        self.workers = workers
+        self.max_retries = max_retries
+
+        self.query_builder: BatchQueryBuilder = None
+
+        self._chunks: List[BatchChunk] = []
+        self._chunk_of = {}
+        self._classes: Set[str] = set()
+        self._executor: ThreadPoolExecutor = None
+        self._summary: BatchSummary = None
+        self._started = 0.0
+
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._executor is not None:
+            self._executor.shutdown()
+
         super().__exit__(exc_type, exc_val, exc_tb)
 
         if self.query_builder is not None:
@@ -313,36 +1450,311 @@ class BatchSession(AbstractSession):
     def start_batch(self):
         self.query_builder = BatchQueryBuilder()
 
-    def end_batch(self):
-        # if self.debug: print(self.query_builder.finalize())
+        self._chunks = []
+        self._chunk_of = {}
+        self._classes = set()
+        self._summary = BatchSummary()
+        self._started = time.monotonic()
 
-        record_classes = {}
-        for record in self.query_builder.record_list:
-            if not isinstance(record, OEdge) and record.element_name() not in record_classes.keys():
-                record_classes[record.element_name()] = record
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(self.workers)
+
+    def end_batch(self) -> BatchSummary:
+        if len(self.query_builder) > 0:
+            self._flush()
+
+        summary = self._summary
+
+        try:
+            for chunk in self._chunks:
+                if chunk.future is not None:
+                    chunk.future.result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
 
-        # print(record_classes)
-        batch_query = self.query_builder.finalize()
-        if self.debug: print(batch_query)
-        result = self.connection.batch(batch_query)
-        # print('Batch result:', result)
+            for chunk in self._chunks:
+                summary.retries += chunk.retries
+                chunk.apply()
 
-        self.query_builder = None
+                for record in chunk.records:
+                    record._batch_id = None
+
+            # a write that filled its chunk is noted on the next one, which may never be sent
+            self.db.query_cache.invalidate(self._classes)
+            self._classes = set()
+
+            summary.elapsed = time.monotonic() - self._started
+
+            self.query_builder = None
+            self._chunks = []
+            self._chunk_of = {}
+
+        if self.debug: print(summary)
+
+        return summary
+
+    def command(self, statement: str, record: ORecord = None, params: List = None):
+        # a batch script is sent as one piece of text, so values get inlined
+        statement = inline_params(statement, params)
 
-    def command(self, statement: str, record: ORecord = None):
         if self.debug: print('Command:', statement)
-        self.query_builder.add(statement, record)
+        self._add(statement, record)
 
-    def raw_query(self, query: str, limit: int = -1) -> bool:
-        query = super().raw_query(query, limit)
+    def raw_query(self, query: str, limit: int = -1, params: List = None) -> bool:
+        query = inline_params(super().raw_query(query, limit), params)
 
         if self.debug: print(query)
-        self.query_builder.add(query)
+        self._add(query)
 
         return True
 
     def save(self, record: ORecord) -> bool:
         return super().save(record)
 
+    def _add(self, statement: str, record: ORecord = None):
+        builder = self.query_builder
+        builder.add(statement, record)
+
+        if (self.max_statements is not None and len(builder) >= self.max_statements) or \
+                (self.max_script_bytes is not None and builder.size >= self.max_script_bytes):
+            self._flush()
+
+    def _flush(self):
+        chunk = BatchChunk(self.query_builder)
+        self.query_builder = BatchQueryBuilder(self.query_builder.index)
+
+        for record in chunk.records:
+            self._chunk_of[record._batch_id] = chunk
+
+        self._chunks.append(chunk)
+        self._summary.chunks += 1
+        self._summary.statements += chunk.statements
+
+        if self.debug: print(chunk.script)
+
+        if self._executor is None:
+            self._send(chunk, self.connection)
+        else:
+            chunk.future = self._executor.submit(self._send_pooled, chunk)
+
+    def _send_pooled(self, chunk: BatchChunk):
+        connection = self.db.acquire_connection()
+        try:
+            self._send(chunk, connection)
+        except PyOrientConnectionException:
+            self.db.release_connection(connection, discard=True)
+            raise
+        else:
+            self.db.release_connection(connection)
+
+    def _send(self, chunk: BatchChunk, connection):
+        while True:
+            try:
+                chunk.bind(connection.batch(chunk.script))
+                self.db.query_cache.invalidate(chunk.classes)
+                return
+            except PyOrientCommandException as e:
+                if chunk.retries >= self.max_retries or not is_retryable(e):
+                    raise
+
+                chunk.retries += 1
+                if self.debug: print('Retrying batch chunk after:', e)
+
+    def _written(self, *records: ORecord):
+        classes = self._written_classes(records)
+
+        self.query_builder.classes.update(classes)
+        self._classes.update(classes)
+
     def _get_id(self, record: ORecord) -> str:
+        # records saved before the batch started are referenced by their rid
+        if record._batch_id is None:
+            return record._rid
+
+        # records of an already sent chunk are referenced by the rid it returned
+        chunk = self._chunk_of.get(record._batch_id)
+        if chunk is not None:
+            return chunk.rid(record._batch_id)
+
         return "$" + record._batch_id
+
+    def _id_value(self, record: ORecord) -> RawType:
+        # batch variables are referenced, not bound
+        return RawType(name=self._get_id(record))
+
+
+class AsyncSession(DirectSession):
+    """Session for asyncio services: awaitable commands over a connection borrowed from AsyncOrientUsDB
+
+    async with AsyncSession(db) as session:
+        token = await session.save(Token('to'))
+        async for token in session.iter_query(Query(Token).where(Token.text == 'to')):
+            ...
+
+    Loaded objects aren't attached to the session (navigating relationships would block), their
+    relationships are fetched along with a fetch plan (Query.fetchplan()).
+    """
+
+    # navigating relationships of an attached object would block the event loop
+    attach_objects = False
+
+    def __init__(self, db: AsyncOrientUsDB, identity_map: bool = True):
+        super().__init__(db, identity_map)
+
+    def __enter__(self):
+        raise TypeError("AsyncSession is entered with 'async with'")
+
+    async def __aenter__(self):
+        self.connection = await self.db.acquire_connection()
+        self.closed = False
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.closed = True
+
+        # a connection left with an unread response (failed or cancelled request) can't be reused
+        await self.db.release_connection(self.connection, discard=self.connection.broken)
+
+    async def command(self, statement, record: ORecord = None, is_update=False,
+                      params: List = None) -> List[OrientRecord]:
+        if self.debug: print('Command:', statement, params if params else '')
+        try:
+            results = await self.connection.command(statement, params=params)
+
+            if self.debug:
+                print('Result Count:', len(results))
+                print()
+
+            if record is not None and len(results) > 0 and not is_update:
+                record._rid = results[0]._rid
+                record._version = results[0]._version
+
+        except PyOrientCommandException as e:
+            print('error occured during executing command', e)
+            return []
+
+        return results
+
+    async def raw_query(self, query: str, limit: int = -1, params: List = None) -> List[OrientRecord]:
+        query = super().raw_query(query, limit)
+
+        return await self.command(query, params=params)
+
+    async def create_class(self, clz) -> bool:
+        for command in self._class_statements(clz):
+            if self.debug: print(command)
+
+            await self.command(command)
+
+        return True
+
+    async def query(self, qry: Query, cache: bool = False) -> List:
+        """Session.query(), the records fetched along by the fetch plan are linked into the results"""
+        statement = qry._done()
+
+        if qry.fetch_plan:
+            return await self._fetch(qry.record_cls, statement, qry.params, qry.fetch_plan)
+
+        if cache:
+            results = await self._cached(statement, qry.params, [qry.record_cls.element_name()])
+        else:
+            results = await self.raw_query(statement, params=qry.params)
+
+        return self._hydrate(qry.record_cls, results)
+
+    async def iter_query(self, qry: Query, page_size: int = 1000) -> AsyncIterator:
+        """Yields the results of `qry` page by page as Session.iter_query(), the connection is free between pages"""
+        pages = KeysetPages(qry, page_size)
+        page = pages.next()
+
+        while page is not None:
+            statement, params = page
+            records = await self.command(statement, params=params)
+
+            for obj in self._hydrate(qry.record_cls, records):
+                yield obj
+
+            page = pages.next(records)
+
+    async def match(self, graph: Graph, cache: bool = False) -> List[OrientRecord]:
+        if cache:
+            return await self._cached(graph.done(), None, graph.classes)
+
+        return await self.command(graph.done())
+
+    async def save(self, record: ORecord) -> ORecord:
+        if isinstance(record, OEdge):
+            frm_id, to_id = self._get_id(record._from_vertex), self._get_id(record._to_vertex)
+
+            assert bool(frm_id)
+            assert bool(to_id)
+
+            statement, params = self._edge_statement(frm_id, to_id, record)
+        else:
+            statement, params = self._insert_statement(record)
+
+        await self.command(statement, record, params=params)
+        self._written(record)
+
+        return record
+
+    async def save_edges(self, edges: List[OEdge]) -> List[OEdge]:
+        for edge in edges:
+            await self.save(edge)
+
+        return edges
+
+    async def upsert(self, record: ORecord, key_fields=None) -> ORecord:
+        upsert_cmd, params = self._upsert_statement(record, self._key_fields(record, key_fields))
+
+        await self.command(upsert_cmd, record, params=params)
+        self._written(record)
+
+        return record
+
+    async def update(self, record: ORecord) -> bool:
+        items = self._changed_values(record)
+        if not items:
+            return True
+
+        update_cmd, params = self._update_statement(record, items)
+
+        await self.command(update_cmd, record, is_update=True, params=params)
+        self._written(record)
+
+        return True
+
+    async def delete(self, record: ORecord) -> bool:
+        delete_cmd, params = self._delete_statement(record)
+
+        await self.command(delete_cmd, params=params)
+        self._written(record)
+
+        if self.identity_map is not None:
+            self.identity_map.remove(record)
+
+        return True
+
+    async def _fetch(self, record_cls, statement: str, params: List, fetch_plan: str) -> List:
+        if self.debug: print('Query:', statement, params if params else '', 'fetch plan:', fetch_plan)
+
+        fetched = []
+
+        try:
+            results = await self.connection.query(statement, -1, fetch_plan, fetched.append, params=params)
+        except PyOrientCommandException as e:
+            print('error occured during executing query', e)
+            return []
+
+        return self._fetched(record_cls, results, fetched)
+
+    async def _cached(self, statement: str, params: List, classes) -> List[OrientRecord]:
+        key, results, stamp = self._cache_lookup(statement, params, classes)
+
+        if results is None:
+            results = await self.command(statement, params=params)
+            self.db.query_cache.put(key, results, classes, stamp)
+
+        return results
@@ -0,0 +1,119 @@
+from enum import Enum
+from typing import List, Type, Union
+
+from orientus.core.datatypes import Clause
+from orientus.core.domain import ODirection, ORecord, OEdge
+
+
+class Strategy(Enum):
+    DEPTH_FIRST = "DEPTH_FIRST"
+    BREADTH_FIRST = "BREADTH_FIRST"
+
+
+class Traverse:
+    """Builder of TRAVERSE statements, reachability without the pattern matching cost of MATCH
+
+    Traverse(token).out(PreviousTokenEdge).max_depth(3)
+    Traverse(Token).both().while_(OVertex.depth < 5).strategy(Strategy.BREADTH_FIRST)
+
+    The start is a domain class, a saved object (or a list of them) or rids.
+    """
+
+    def __init__(self, target: Union[Type[ORecord], ORecord, str, List]):
+        self.target = target
+
+        self.functions = []
+        self.params = []
+
+        self._max_depth = None
+        self._while = None
+        self._limit = None
+        self._strategy = None
+
+    def out(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.OUT, edge_classes, False)
+
+    def in_(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.IN, edge_classes, False)
+
+    def both(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.BOTH, edge_classes, False)
+
+    def outE(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.OUT, edge_classes, True)
+
+    def inE(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.IN, edge_classes, True)
+
+    def bothE(self, *edge_classes: Type[OEdge]) -> 'Traverse':
+        return self._walk(ODirection.BOTH, edge_classes, True)
+
+    def fields(self, *fields: str) -> 'Traverse':
+        """Traverses link fields by name, e.g. `*`, `any()`, `in_PreviousTokenEdge`"""
+        self.functions.extend(fields)
+        return self
+
+    def max_depth(self, depth: int) -> 'Traverse':
+        assert depth >= 0
+
+        self._max_depth = depth
+        return self
+
+    def while_(self, clause: Clause) -> 'Traverse':
+        """Keeps traversing while `clause` holds, e.g. `OVertex.depth < 3`"""
+        self._while = clause
+        return self
+
+    def limit(self, number: int) -> 'Traverse':
+        self._limit = number
+        return self
+
+    def strategy(self, strategy: Strategy) -> 'Traverse':
+        self._strategy = strategy
+        return self
+
+    def _walk(self, direction: ODirection, edge_classes, edges: bool) -> 'Traverse':
+        function = direction.value.lower() + ('E' if edges else '')
+        names = ", ".join("'%s'" % edge_cls.element_name() for edge_cls in edge_classes)
+
+        self.functions.append("%s(%s)" % (function, names))
+        return self
+
+    def _target(self) -> str:
+        target = self.target
+
+        if isinstance(target, type):
+            return target.element_name()
+
+        if not isinstance(target, (list, tuple)):
+            target = [target]
+
+        rids = [item._rid if isinstance(item, ORecord) else str(item) for item in target]
+        if not all(rids):
+            raise ValueError("traverse can only start from saved records")
+
+        return "[%s]" % ", ".join(rids)
+
+    def _done(self) -> str:
+        if self._max_depth is not None and self._while is not None:
+            raise ValueError("TRAVERSE takes either MAXDEPTH or WHILE")
+
+        self.params = []
+
+        sql = ["TRAVERSE %s" % (", ".join(self.functions) or "*"),
+               "FROM %s" % self._target()]
+
+        if self._max_depth is not None:
+            sql.append("MAXDEPTH %s" % self._max_depth)
+
+        if self._while is not None:
+            sql.append("WHILE %s" % self._while.expression)
+            self.params.extend(self._while.params)
+
+        if self._limit is not None:
+            sql.append("LIMIT %s" % self._limit)
+
+        if self._strategy is not None:
+            sql.append("STRATEGY %s" % self._strategy.value)
+
+        return "\n".join(sql)
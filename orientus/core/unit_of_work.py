@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import List, Tuple
+
+from orientus.core.domain import ORecord, OEdge
+
+
+class UnitOfWork:
+    """Writes queued by a Session until its flush()
+
+    Operations are kept per object, so repeated writes of an object coalesce: an object is inserted
+    or upserted once, updated once (not at all if it's inserted or upserted in the same flush, which
+    takes its current values) and deleting an object that was never flushed drops its pending writes.
+    Deleting a vertex also drops the pending inserts of edges connecting it, as the database deletes
+    the edges of a deleted vertex.
+    """
+
+    def __init__(self):
+        # id(record) -> record, in queueing order
+        self._inserts = OrderedDict()
+        # id(record) -> (record, key fields)
+        self._upserts = OrderedDict()
+        self._updates = OrderedDict()
+        self._deletes = OrderedDict()
+
+    def __len__(self):
+        return len(self._inserts) + len(self._upserts) + len(self._updates) + len(self._deletes)
+
+    def insert(self, record: ORecord):
+        if id(record) not in self._upserts:
+            self._inserts.setdefault(id(record), record)
+
+    def upsert(self, record: ORecord, key_fields: List):
+        key = id(record)
+
+        self._updates.pop(key, None)
+
+        if key not in self._inserts:
+            self._upserts[key] = (record, key_fields)
+
+    def update(self, record: ORecord):
+        key = id(record)
+
+        if key not in self._inserts and key not in self._upserts and key not in self._deletes:
+            self._updates.setdefault(key, record)
+
+    def delete(self, record: ORecord):
+        key = id(record)
+
+        self._updates.pop(key, None)
+
+        if self._inserts.pop(key, None) is None and self._upserts.pop(key, None) is None:
+            self._deletes.setdefault(key, record)
+
+        for edge_key, edge in list(self._inserts.items()):
+            if isinstance(edge, OEdge) and (edge._from_vertex is record or edge._to_vertex is record):
+                del self._inserts[edge_key]
+
+    def inserts(self) -> List[ORecord]:
+        """Pending inserts, edges after the other records so their endpoints are created first"""
+        records = list(self._inserts.values())
+        return [r for r in records if not isinstance(r, OEdge)] + [r for r in records if isinstance(r, OEdge)]
+
+    def upserts(self) -> List[Tuple[ORecord, List]]:
+        """Pending upserts with their key fields"""
+        return list(self._upserts.values())
+
+    def updates(self) -> List[ORecord]:
+        return list(self._updates.values())
+
+    def deletes(self) -> List[ORecord]:
+        """Pending deletes, edges first: deleting a vertex deletes its edges as well"""
+        records = list(self._deletes.values())
+        return [r for r in records if isinstance(r, OEdge)] + [r for r in records if not isinstance(r, OEdge)]
+
+    def clear(self):
+        self._inserts.clear()
+        self._upserts.clear()
+        self._updates.clear()
+        self._deletes.clear()
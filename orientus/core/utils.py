@@ -3,7 +3,6 @@ from typing import List, Type
 
 from pyorient import OrientRecord
 
-from orientus.core.datatypes import RawType
 from orientus.core.domain import ORecord
 from orientus.tests.data import Token
 
@@ -15,49 +14,31 @@ def get_class_datatypes(class_type: Type[ORecord], exclude_rawtypes=True):
     :param exclude_rawtypes:
     :return: class variables of domain class
     """
-    attributes = inspect.getmembers(class_type, lambda a: not (inspect.isroutine(a)))
-
-    class_datatypes = [a for a in attributes if not (a[0].startswith('__') and a[0].endswith('__'))]
     if exclude_rawtypes:
-        class_datatypes = [(name, v) for (name, v) in class_datatypes if
-                           v.__class__ != RawType and issubclass(v.__class__, RawType)]
+        # computed once per class, see ORecord.schema()
+        return [(field.attr, field.datatype) for field in class_type.schema().fields]
+
+    attributes = inspect.getmembers(class_type, lambda a: not (inspect.isroutine(a)))
 
-    return class_datatypes
+    return [a for a in attributes if not (a[0].startswith('__') and a[0].endswith('__'))]
 
 
 def get_field_names(class_type: Type[ORecord]):
     """Returns Domain class field names those class types are Rawtype or its subclasses"""
-    return [field for field, value in get_class_datatypes(class_type)]
+    return class_type.schema().field_names
 
 
 def to_datatype_obj(class_type: Type[ORecord], records: List[OrientRecord]) -> List:
     """Converts OrientRecord list to Datatype object list
 
+    Objects are built by the hydrator generated for the class (see schema.compile_hydrator),
+    __init__ isn't called so domain classes don't need default constructor params.
+
     :param class_type: subclass type of ORecord
     :param records: OrientRecord list
     :return: converted list
     """
-    obj_list = []
-
-    domain_variables = get_class_datatypes(class_type)
-    column_name_vs_var_name = {datatype.name: name for (name, datatype) in domain_variables}
-
-    # print(column_name_vs_var_name)
-
-    for record in records:
-        """for this __init__(), Domain classes have to provide default/optional params in constructor method"""
-        instance = class_type()
-
-        instance._version = record._version
-        instance._rid = record._rid
-
-        for key, value in record.oRecordData.items():
-            if column_name_vs_var_name.get(key) is not None:
-                setattr(instance, column_name_vs_var_name.get(key), value)
-
-        obj_list.append(instance)
-
-    return obj_list
+    return class_type.schema().hydrator(records)
 
 
 if __name__ == '__main__':
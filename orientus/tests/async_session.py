@@ -0,0 +1,237 @@
+import asyncio
+import struct
+from itertools import count
+
+from pyorient import OrientRecord, PyOrientConnectionPoolException, PyOrientSQLParsingException
+
+from orientus.core.cache import LRUCache, QueryCache
+from orientus.core.db import AsyncOrientUs
+from orientus.core.pool import AsyncConnectionPool
+from orientus.core.query import Query
+from orientus.core.session import AsyncSession
+from orientus.tests.batch_session import tokens
+from orientus.tests.data import Token
+
+SESSION_ID = 7
+
+
+def string(value: bytes) -> bytes:
+    return struct.pack('!i', len(value)) + value
+
+
+def list_response(contents) -> bytes:
+    """Binary protocol response of a sync query returning CSV serialized Token records"""
+    body = b''.join(struct.pack('!hchqi', 0, b'd', 12, position, 1) + string(content)
+                    for position, content in enumerate(contents))
+
+    return b'\x00' + struct.pack('!i', SESSION_ID) + b'l' + struct.pack('!i', len(contents)) + body + b'\x00'
+
+
+def error_response(exception: bytes, message: bytes) -> bytes:
+    return b'\x01' + struct.pack('!i', SESSION_ID) + b'\x01' + string(exception) + string(message) + \
+        b'\x00' + string(b'')
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.written = b''
+
+    def write(self, data):
+        self.written += data
+
+    async def drain(self):
+        pass
+
+
+def open_connection(response_chunks):
+    """AsyncOrientUs on an opened database, the server sends `response_chunks` one by one"""
+    connection = AsyncOrientUs()
+    connection._socket.protocol = 26
+    connection._socket.connected = True
+    connection._socket.db_opened = 'test'
+
+    connection._reader = asyncio.StreamReader()
+    connection._writer = FakeWriter()
+
+    async def send():
+        for chunk in response_chunks:
+            await asyncio.sleep(0)
+            connection._reader.feed_data(chunk)
+
+    return connection, asyncio.ensure_future(send())
+
+
+def chunks(data: bytes, size: int):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class FakeAsyncConnection:
+    """Pages through 5 Token records (#12:0 to #12:4), answers other statements with one written record"""
+
+    rids = count(5)
+
+    def __init__(self):
+        self.statements = []
+        self.broken = False
+
+    async def command(self, statement, params=None):
+        self.statements.append((statement, params))
+        await asyncio.sleep(0)
+
+        if statement.startswith('SELECT'):
+            after = int(params[0].get_hash().split(':')[1])
+            size = int(statement.rsplit('LIMIT', 1)[1])
+
+            return [OrientRecord({'__o_storage': {'text': 't%s' % position}, '__o_class': 'Token',
+                                  '__version': 1, '__rid': '#12:%s' % position})
+                    for position in range(after + 1, min(after + 1 + size, 5))]
+
+        return [OrientRecord({'__o_storage': {}, '__o_class': 'Token', '__version': 1,
+                              '__rid': '#12:%s' % next(self.rids)})]
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncDB:
+    debug = False
+
+    def __init__(self):
+        self.statement_cache = LRUCache()
+        self.query_cache = QueryCache()
+        self.connection_pool = AsyncConnectionPool(self._connect, min_size=0, max_size=2)
+
+    @staticmethod
+    async def _connect():
+        return FakeAsyncConnection()
+
+    async def acquire_connection(self, timeout=None):
+        return await self.connection_pool.acquire(timeout)
+
+    async def release_connection(self, connection, discard=False):
+        await self.connection_pool.release(connection, discard)
+
+
+def async_connection_test():
+    async def run():
+        response = list_response([b'Token@text:"t0"', b'Token@text:"t1"', b'Token@text:"t2"'])
+        connection, sender = open_connection(chunks(response, 5))
+
+        # the response is decoded as it trickles in
+        records = await connection.query('select from Token where text = ?', params=['t0'])
+        await sender
+
+        assert [(r._rid, r.text) for r in records] == [('#12:0', 't0'), ('#12:1', 't1'), ('#12:2', 't2')]
+        assert b'select from Token where text = ?' in connection._writer.written
+        assert not connection.broken
+
+        # a server error is a whole response, the connection stays usable
+        connection, sender = open_connection([error_response(b'OCommandSQLParsingException', b'bad'),
+                                              list_response([b'Token@text:"t3"'])])
+        try:
+            await connection.command('selec from Token')
+            assert False, 'server errors are raised'
+        except PyOrientSQLParsingException:
+            pass
+
+        assert not connection.broken
+        assert (await connection.command('select from Token'))[0].text == 't3'
+
+    asyncio.run(run())
+
+
+def async_pool_test():
+    async def run():
+        pool = AsyncConnectionPool(FakeAsyncDB._connect, min_size=0, max_size=2, timeout=5)
+        served = []
+        active = []
+
+        async def worker(name):
+            connection = await pool.acquire()
+            active.append(connection)
+            assert len(active) <= 2
+
+            await asyncio.sleep(0.001)
+            served.append(name)
+
+            active.remove(connection)
+            await pool.release(connection)
+
+        await asyncio.gather(*(worker(name) for name in range(100)))
+
+        assert len(served) == 100
+        assert pool.stats()['created'] == 2 and pool.stats()['in_use'] == 0
+
+        first, second = await pool.acquire(), await pool.acquire()
+        try:
+            await pool.acquire(timeout=0.01)
+            assert False, 'pool should not grow beyond max_size'
+        except PyOrientConnectionPoolException:
+            pass
+
+        # a cancelled waiter doesn't swallow the connection released to it
+        waiting = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await pool.release(first)
+
+        assert await pool.acquire() is first
+
+        await pool.release(first)
+        await pool.release(second)
+        await pool.close()
+
+        assert pool.stats()['size'] == 0
+
+    asyncio.run(run())
+
+
+def async_session_test():
+    try:
+        with AsyncSession(FakeAsyncDB()):
+            pass
+        assert False, "an AsyncSession is entered with 'async with'"
+    except TypeError:
+        pass
+
+    async def run():
+        db = FakeAsyncDB()
+
+        async with AsyncSession(db) as session:
+            token = await session.save(tokens(1)[0])
+            assert token._rid and token._loaded == {'text': 't0', 'new_text': 't0'}
+
+            token.new_text = 'TO'
+            await session.update(token)
+            assert session.connection.statements[-1][1][0] == 'TO'
+
+            # unchanged, nothing to send
+            sent = len(session.connection.statements)
+            await session.update(token)
+            assert len(session.connection.statements) == sent
+
+            streamed = [t async for t in session.iter_query(Query(Token), page_size=2)]
+            assert [t.text for t in streamed] == ['t0', 't1', 't2', 't3', 't4']
+            assert all(isinstance(t, Token) and t._session is None for t in streamed)
+
+            await session.delete(token)
+            assert session.connection.statements[-1][0].startswith('delete vertex Token')
+
+        # sessions on separate tasks share the two pooled connections
+        async def task():
+            async with AsyncSession(db) as session:
+                return await session.save(tokens(1)[0])
+
+        saved = await asyncio.gather(*(task() for _ in range(20)))
+
+        assert len({t._rid for t in saved}) == 20
+        assert db.connection_pool.stats()['created'] <= 2
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    async_connection_test()
+    async_pool_test()
+    async_session_test()
@@ -0,0 +1,495 @@
+import base64
+import re
+import struct
+from itertools import count
+
+from pyorient import OrientBinaryObject, OrientRecord, OrientRecordLink, PyOrientCommandException
+
+from orientus.core.cache import LRUCache, QueryCache
+from orientus.core.domain import ODirection, ORID
+from orientus.core.pool import ConnectionPool
+from orientus.core.query import Query
+from orientus.core.session import BatchSession, Session
+from orientus.core.utils import to_datatype_obj
+from orientus.tests.data import PreviousTokenEdge, Reading, Token
+
+
+class FakeConnection:
+    """Answers batch scripts with one record per returned variable, failing the first `conflicts` ones"""
+
+    rids = count(1)
+
+    def __init__(self, conflicts=0):
+        self.conflicts = conflicts
+        self.scripts = []
+
+    def batch(self, script):
+        self.scripts.append(script)
+
+        if self.conflicts:
+            self.conflicts -= 1
+            raise PyOrientCommandException('OConcurrentModificationException', [])
+
+        returned = re.search(r'return \[(.*)\]', script)
+        variables = returned.group(1).split(',') if returned else []
+
+        return [OrientRecord({'__o_storage': {}, '__o_class': 'Token', '__version': 1,
+                              '__rid': '#12:%s' % next(self.rids)}) for _ in variables]
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+
+        # one record per inserted content document
+        return [OrientRecord({'__o_storage': {}, '__o_class': 'Token', '__version': 1,
+                              '__rid': '#12:%s' % next(self.rids)}) for _ in range(max(statement.count('{'), 1))]
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    debug = False
+
+    def __init__(self, conflicts=0):
+        self.statement_cache = LRUCache()
+        self.query_cache = QueryCache()
+        self.connection_pool = ConnectionPool(lambda: FakeConnection(conflicts), min_size=0, max_size=4)
+
+    def acquire_connection(self, timeout=None):
+        return self.connection_pool.acquire(timeout)
+
+    def release_connection(self, connection, discard=False):
+        self.connection_pool.release(connection, discard)
+
+
+def tokens(n):
+    result = []
+    for i in range(n):
+        token = Token()
+        token.text = token.new_text = 't%s' % i
+        result.append(token)
+    return result
+
+
+def chunked_batch_test():
+    with BatchSession(FakeDB(conflicts=1), max_statements=3) as session:
+        session.start_batch()
+
+        saved = tokens(7)
+        for token in saved:
+            session.save(token)
+        edge = session.save(PreviousTokenEdge(saved[0], saved[6]))
+
+        summary = session.end_batch()
+
+    scripts = session.connection.scripts
+
+    assert (summary.chunks, summary.statements, summary.retries) == (3, 8, 1)
+    assert len(scripts) == 4
+    assert scripts[0] == scripts[1]
+    assert scripts[1].endswith('commit retry 10;\nreturn [$Token1, $Token2, $Token3]')
+
+    # the edge of the last chunk references the first chunk's record by its returned rid
+    first_rid = scripts[-1].split('from ')[1].split(' ')[0]
+    assert re.match(r'#12:\d+$', first_rid)
+    assert 'to $Token7' in scripts[-1]
+    assert all(token._batch_id is None for token in saved)
+
+    # generated rids are bound to the saved records, edges included
+    assert saved[0]._rid == first_rid
+    assert len({record._rid for record in saved + [edge]}) == 8
+    assert all(record._version == 1 for record in saved + [edge])
+
+
+def parallel_batch_test():
+    db = FakeDB()
+
+    with BatchSession(db, max_script_bytes=200, workers=3) as session:
+        session.start_batch()
+
+        for token in tokens(20):
+            session.save(token)
+
+        summary = session.end_batch()
+
+    assert summary.chunks > 1
+    assert summary.statements == 20
+    assert db.connection_pool.stats()['in_use'] == 0
+
+
+def save_many_test():
+    saved = tokens(5)
+    saved[0].new_text = "it's"
+
+    with Session(FakeDB()) as session:
+        session.save_many(saved + [PreviousTokenEdge(saved[0], saved[4])], chunk_size=2)
+
+    statements = session.connection.scripts
+
+    assert len(statements) == 4
+    assert statements[0] == "insert into Token content [{'text': 't0', 'new_text': 'it\\'s'}, " \
+                            "{'text': 't1', 'new_text': 't1'}]"
+    assert statements[-1] == 'create edge PreviousTokenEdge from %s to %s' % (saved[0]._rid, saved[4]._rid)
+    assert len({token._rid for token in saved}) == 5
+
+
+class EdgeConnection(FakeConnection):
+    """Answers `create edge X from [...] to #t` with the created edges, in reverse order"""
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+
+        sources, target = re.match(r'.* from \[(.*)\] to (\S+)', statement).groups()
+
+        return [OrientRecord({'__o_storage': {'out': OrientRecordLink(source.lstrip('#')),
+                                              'in': OrientRecordLink(target.lstrip('#'))},
+                              '__o_class': 'PreviousTokenEdge', '__version': 1,
+                              '__rid': '#13:%s' % source.split(':')[1]})
+                for source in reversed(sources.split(', '))]
+
+
+def save_edges_test():
+    saved = tokens(4)
+    for i, token in enumerate(saved):
+        token._rid = '#12:%s' % i
+
+    # a fan-in to one target
+    edges = [PreviousTokenEdge(token, saved[3]) for token in saved[:3]]
+
+    with Session(FakeDB()) as session:
+        session.connection = EdgeConnection()
+        session.save_edges(edges, chunk_size=2)
+
+    assert session.connection.scripts == ['create edge PreviousTokenEdge from [#12:0, #12:1] to #12:3',
+                                          'create edge PreviousTokenEdge from [#12:2] to #12:3']
+
+    # bound by endpoints, not by result order
+    assert [edge._rid for edge in edges] == ['#13:0', '#13:1', '#13:2']
+
+def dirty_update_test():
+    token, = to_datatype_obj(Token, [OrientRecord({
+        '__o_storage': {'text': 'to', 'new_text': ['t', 'o']}, '__o_class': 'Token', '__version': 1, '__rid': '#12:0'})])
+
+    with Session(FakeDB()) as session:
+        assert session.update(token)
+        assert session.connection.scripts == []
+
+        token.text = 'TO'
+        session.update(token)
+        token.new_text.append('!')
+        token.mark_dirty('new_text')
+        session.update(token)
+
+        # nothing changed since the last update
+        session.update(token)
+
+        # the count record the update returns doesn't replace the rid
+        token.text = 'To'
+        session.update_by_id(token)
+
+        assert token._rid == '#12:0' and session.identity_map.get('#12:0') is token
+
+    assert session.connection.scripts == ['update Token set text = ? where @rid = ?',
+                                          'update Token set new_text = ? where @rid = ?',
+                                          'update Token set text = ? where @rid = ?']
+
+
+def unit_of_work_test():
+    stored = to_datatype_obj(Token, [OrientRecord({
+        '__o_storage': {'text': 'to'}, '__o_class': 'Token', '__version': 1, '__rid': '#12:%s' % i}) for i in (0, 1)])
+
+    with Session(FakeDB(), unit_of_work=True) as session:
+        saved = tokens(2)
+        edge = PreviousTokenEdge(saved[1], stored[0])
+
+        session.save(edge)
+        session.save_many(saved)
+        session.update(saved[0])
+
+        stored[0].text = 'TO'
+        session.update(stored[0])
+        session.update(stored[0])
+        session.delete(stored[1])
+
+        # deleting the vertex drops the queued edge as well
+        session.delete(saved[1])
+        session.save(saved[1])
+        session.save(edge)
+
+        assert session.connection.scripts == []
+
+    script, = session.connection.scripts
+
+    assert script == "begin;\n" \
+                     "let Token1 = insert into Token set text = 't0' , new_text = 't0';\n" \
+                     "let Token2 = insert into Token set text = 't1' , new_text = 't1';\n" \
+                     "let PreviousTokenEdge3 = create edge PreviousTokenEdge from $Token2 to #12:0;\n" \
+                     "let qry4 = update Token set text = 'TO' where @rid = #12:0;\n" \
+                     "let qry5 = delete vertex Token where @rid = #12:1;\n" \
+                     "commit retry 10;\n" \
+                     "return [$Token1, $Token2, $PreviousTokenEdge3]"
+    assert all(record._rid and record._batch_id is None for record in saved + [edge])
+
+
+def unit_of_work_failure_test():
+    first, second = tokens(2)
+
+    with Session(FakeDB(conflicts=1), unit_of_work=True) as session:
+        session.save_many([first, second])
+        session.save(PreviousTokenEdge(first, second))
+        session.delete(second)
+
+        assert len(session.unit_of_work) == 1
+
+        # a failed script keeps the queue for the next flush
+        try:
+            session.flush()
+            assert False, 'the first script fails'
+        except PyOrientCommandException:
+            pass
+
+        assert len(session.unit_of_work) == 1 and not first._rid
+
+        session.flush()
+
+        assert first._rid and not session.unit_of_work
+        assert 'create edge' not in session.connection.scripts[-1]
+
+        # the from vertex is neither saved nor queued
+        session.save(PreviousTokenEdge(second, first))
+
+        try:
+            session.flush()
+            assert False, 'the edge has no from vertex'
+        except ValueError as e:
+            assert str(e) == 'PreviousTokenEdge edge from Token to %s: its from vertex is neither saved nor queued' \
+                % first._rid
+
+        assert len(session.unit_of_work) == 1
+
+        session.save(second)
+
+
+def upsert_test():
+    token = tokens(1)[0]
+
+    with Session(FakeDB()) as session:
+        session.upsert(token, key_fields=[Token.text])
+
+    assert session.connection.scripts == \
+        ['update Token set text = ? , new_text = ? upsert return after where text = ?']
+    assert token._rid
+
+    with BatchSession(FakeDB()) as session:
+        session.start_batch()
+        session.upsert(token, key_fields=['text', 'new_text'])
+        session.end_batch()
+
+    assert "let Token1 = update Token set text = 't0' , new_text = 't0' upsert return after " \
+           "where text = 't0' and new_text = 't0'" in session.connection.scripts[0]
+
+    try:
+        Session(FakeDB()).upsert(token)
+        assert False, 'Token has no unique fields'
+    except ValueError:
+        pass
+
+    for key in ('txt', Reading.unit):
+        try:
+            Session(FakeDB()).upsert(token, key_fields=[key])
+            assert False, '%s is not a field of Token' % key
+        except ValueError as e:
+            assert str(e) in ('txt is not a field of Token', 'unit is not a field of Token')
+
+
+def unit_of_work_upsert_test():
+    token, dropped = tokens(2)
+
+    with Session(FakeDB(), unit_of_work=True) as session:
+        session.upsert(token, key_fields=[Token.text])
+        token.new_text = 'T0'
+        session.update(token)
+
+        session.upsert(dropped, key_fields=[Token.text])
+        session.delete(dropped)
+
+        try:
+            session.save_if_not_exists(tokens(1)[0])
+            assert False, "save_if_not_exists needs the server's answer"
+        except ValueError:
+            pass
+
+        assert session.connection.scripts == []
+
+    script, = session.connection.scripts
+
+    assert "let Token1 = update Token set text = 't0' , new_text = 'T0' upsert return after " \
+           "where text = 't0';\n" in script
+    assert 't1' not in script
+    assert token._rid and token._batch_id is None
+
+
+class SchemaConnection(FakeConnection):
+    """Server having the Token class with its text property and an index of another class"""
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+
+        if 'metadata:schema' in statement and 'metadata:indexmanager' in statement:
+            classes = [{'name': 'token', 'properties': [{'name': 'text'}]}, {'name': 'V', 'properties': []}]
+            return [OrientRecord({'__o_storage': {'classes': classes, 'indexes': ['OUser.name']}})]
+
+        return super().command(statement, params)
+
+
+def sync_schema_test():
+    with Session(FakeDB()) as session:
+        session.connection = SchemaConnection()
+        commands = session.sync_schema([Token, PreviousTokenEdge])
+
+    assert commands == ['CREATE PROPERTY Token.new_text STRING (MANDATORY TRUE)',
+                        'CREATE CLASS PreviousTokenEdge IF NOT EXISTS EXTENDS E']
+    # one query reading the classes and indexes, one script
+    assert len(session.connection.scripts) == 2 and session.connection.scripts[1] == ';\n'.join(commands)
+
+
+class LookupConnection(FakeConnection):
+    """Has the Token records #12:0 to #12:9, their text is 't<position>'"""
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+
+        if params:
+            positions = [int(key[1:]) for key in params[0] if key.startswith('t')]
+        else:
+            positions = [int(rid.split(':')[1]) for rid in re.findall(r'#12:\d+', statement)]
+
+        return [OrientRecord({'__o_storage': {'text': 't%s' % position}, '__o_class': 'Token', '__version': 1,
+                              '__rid': '#12:%s' % position}) for position in positions if position < 10]
+
+
+def load_many_test():
+    with Session(FakeDB()) as session:
+        session.connection = LookupConnection()
+
+        loaded = session.load_many(['#12:3', ORID('12:1'), '#12:42', '#12:3'], chunk_size=3)
+        found = session.get_many(Token, Token.text, ['t9', 't10', 't2'])
+
+        assert session.load('#12:42') is None
+
+        try:
+            session.get_many(Token, Reading.sensor, ['t1'])
+            assert False, 'sensor is not a field of Token'
+        except ValueError:
+            pass
+
+    assert session.connection.scripts[:2] == ['select from [#12:3, #12:1, #12:42]', 'select from [#12:3]']
+
+    assert [token and token.text for token in loaded] == ['t3', 't1', None, 't3']
+    assert isinstance(loaded[0], Token) and loaded[0] is loaded[3]
+    assert [token and token._rid for token in found] == ['#12:9', None, '#12:2']
+
+
+class GraphConnection(FakeConnection):
+    """Token chain #12:0 -> #12:1 -> ... -> #12:4, edge #13:i connects #12:i to #12:i+1"""
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+        rids = re.findall(r'#1[23]:\d+', statement)
+
+        if statement.startswith("select @rid as source, out('PreviousTokenEdge')"):
+            return [OrientRecord({'__o_storage': {
+                'source': OrientRecordLink(rid[1:]),
+                'targets': [OrientRecordLink('12:%s' % (int(rid[4:]) + 1))] if rid != '#12:4' else []}})
+                for rid in rids]
+
+        records = []
+        for rid in rids:
+            position = int(rid[4:])
+
+            if rid.startswith('#12'):
+                records.append(OrientRecord({'__o_storage': {'text': 't%s' % position}, '__o_class': 'Token',
+                                             '__version': 1, '__rid': rid}))
+            else:
+                records.append(OrientRecord({'__o_storage': {'out': OrientRecordLink('12:%s' % position),
+                                                             'in': OrientRecordLink('12:%s' % (position + 1))},
+                                             '__o_class': 'PreviousTokenEdge', '__version': 1, '__rid': rid}))
+        return records
+
+
+def navigation_test():
+    with Session(FakeDB()) as session:
+        session.connection = GraphConnection()
+
+        chain = session.load_many(['#12:%s' % i for i in range(5)])
+        session.prefetch(chain, ODirection.OUT, PreviousTokenEdge)
+        queries = len(session.connection.scripts)
+
+        following = [token.get_vertices(ODirection.OUT, PreviousTokenEdge) for token in chain]
+        assert len(session.connection.scripts) == queries
+
+        edge = session.load('#13:2')
+        assert edge.get_from() is chain[2] and edge.get_to() is chain[3]
+
+    assert queries == 3
+    assert [[token.text for token in tokens] for tokens in following] == [['t1'], ['t2'], ['t3'], ['t4'], []]
+    assert following[0][0] is chain[1]
+
+    try:
+        chain[0].get_vertices(ODirection.IN)
+        assert False, 'the session is closed'
+    except ValueError:
+        pass
+
+
+def ridbag(*rids):
+    data = bytes([1]) + struct.pack('>i', len(rids))
+    for rid in rids:
+        cluster, position = rid[1:].split(':')
+        data += struct.pack('>hq', int(cluster), int(position))
+    return OrientBinaryObject(base64.b64encode(data).decode())
+
+
+class FetchConnection(FakeConnection):
+    """Answers any query with #12:0 -> #13:0 -> #12:1, the edge and #12:1 as fetched records"""
+
+    def query(self, statement, limit, fetch_plan, callback, params=None):
+        self.scripts.append((statement, fetch_plan))
+
+        callback(OrientRecord({'__o_storage': {'out': OrientRecordLink('12:0'), 'in': OrientRecordLink('12:1')},
+                               '__o_class': 'PreviousTokenEdge', '__version': 1, '__rid': '#13:0'}))
+        callback(OrientRecord({'__o_storage': {'text': 't1', 'in_PreviousTokenEdge': ridbag('#13:0')},
+                               '__o_class': 'Token', '__version': 1, '__rid': '#12:1'}))
+
+        return [OrientRecord({'__o_storage': {'text': 't0', 'out_PreviousTokenEdge': ridbag('#13:0')},
+                              '__o_class': 'Token', '__version': 1, '__rid': '#12:0'})]
+
+
+def fetch_plan_test():
+    with Session(FakeDB()) as session:
+        session.connection = FetchConnection()
+        first, = session.query(Query(Token).where(Token.text == 't0').fetchplan('*:2'))
+
+    edge, = first.get_edges(ODirection.OUT, PreviousTokenEdge)
+    second, = first.get_vertices(ODirection.OUT, PreviousTokenEdge)
+
+    assert session.connection.scripts == [('SELECT \nFROM Token\nWHERE text = ?', '*:2')]
+    assert second.text == 't1'
+    assert edge.get_from() is first and edge.get_to() is second
+    assert second.get_vertices(ODirection.IN, PreviousTokenEdge) == [first]
+
+
+if __name__ == '__main__':
+    chunked_batch_test()
+    parallel_batch_test()
+    save_many_test()
+    save_edges_test()
+    dirty_update_test()
+    unit_of_work_test()
+    unit_of_work_failure_test()
+    upsert_test()
+    unit_of_work_upsert_test()
+    sync_schema_test()
+    load_many_test()
+    navigation_test()
+    fetch_plan_test()
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from pyorient import OrientRecord
+
+from orientus.core.columns import Columns
+from orientus.core.pool import ConnectionPool
+from orientus.core.query import Query
+from orientus.core.session import Session
+from orientus.tests.batch_session import FakeConnection, FakeDB
+from orientus.tests.data import Reading
+
+START = datetime(2020, 1, 2, 3, 4, 5)
+
+
+def reading(position):
+    data = {'sensor': position % 4, 'value': position * 0.5, 'valid': position % 2 == 0,
+            'taken_at': datetime.fromtimestamp(START.timestamp() + position), 'unit': 'C'}
+    if position == 1:
+        data['value'] = None
+
+    return OrientRecord({'__o_storage': data, '__o_class': 'Reading', '__version': 1,
+                         '__rid': '#20:%s' % position})
+
+
+class ReadingConnection(FakeConnection):
+    """Sends `count` Reading records to the async query callback"""
+
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+
+    def query_async(self, statement, limit, fetch_plan, callback, params=None):
+        self.scripts.append((statement, params))
+
+        for position in range(self.count):
+            callback(reading(position))
+
+
+def columns_test():
+    columns = Columns(Reading)
+    columns.extend([reading(position) for position in range(3)])
+
+    assert len(columns) == 3 and list(columns) == ['sensor', 'value', 'valid', 'taken_at', 'unit']
+    assert columns['sensor'].typecode == 'i' and columns['sensor'].tolist() == [0, 1, 2]
+    assert columns['value'].tolist() == [0.0, 0.0, 1.0] and columns.nulls('value').tolist() == [1]
+    assert columns['valid'].tolist() == [1, 0, 1]
+    assert columns['taken_at'][1] - columns['taken_at'][0] == 1000
+    assert columns['unit'] == ['C', 'C', 'C']
+
+    # a value the array can't hold turns the column into a list, nulls included
+    columns.append(OrientRecord({'__o_storage': {'value': 'n/a'}, '__o_class': 'Reading', '__version': 1,
+                                 '__rid': '#20:3'}))
+
+    assert columns['value'] == [0.0, None, 1.0, 'n/a']
+    assert columns['sensor'].tolist() == [0, 1, 2, 0] and columns.nulls('sensor').tolist() == [3]
+
+    only = Columns(Reading, [Reading.sensor, Reading.unit])
+    assert list(only) == ['sensor', 'unit']
+
+    try:
+        import numpy
+    except ImportError:
+        return
+
+    arrays = Columns(Reading)
+    arrays.extend([reading(position) for position in range(3)])
+    arrays = arrays.to_numpy()
+
+    assert arrays['sensor'].dtype == numpy.int32 and arrays['value'].mask.tolist() == [False, True, False]
+    assert arrays['taken_at'][0] == numpy.datetime64(int(START.timestamp() * 1000), 'ms')
+
+
+class ReadingDB(FakeDB):
+
+    def __init__(self, count):
+        super().__init__()
+        self.connection_pool = ConnectionPool(lambda: ReadingConnection(count), min_size=0, max_size=4)
+
+
+def query_columns_test():
+    with Session(ReadingDB(2500)) as session:
+
+        columns = session.query_columns(Query(Reading), Reading.value, Reading.valid)
+
+        assert len(columns) == 2500 and list(columns) == ['value', 'valid']
+        assert columns['value'][2499] == 1249.5
+
+        pages = list(session.iter_query_columns(Query(Reading).where(Reading.sensor == 1), page_size=1000))
+
+        assert [len(page) for page in pages] == [1000, 1000, 500]
+        assert pages[2]['sensor'][-1] == 2499 % 4
+
+        # read on a pooled connection
+        reader = session.db.acquire_connection()
+        assert reader.scripts == [('SELECT \nFROM Reading\nWHERE sensor = ?', [1])]
+        session.db.release_connection(reader)
+
+
+if __name__ == '__main__':
+    columns_test()
+    query_columns_test()
@@ -0,0 +1,110 @@
+import time
+from threading import Thread
+
+from pyorient import PyOrientConnectionException, PyOrientConnectionPoolException
+
+from orientus.core.db import OrientUsDB
+from orientus.core.pool import ConnectionPool
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def bounded_pool_test():
+    pool = ConnectionPool(FakeConnection, min_size=1, max_size=2, timeout=0.1)
+    pool.fill()
+
+    first = pool.acquire()
+    second = pool.acquire()
+
+    try:
+        pool.acquire()
+        assert False, 'pool should not grow beyond max_size'
+    except PyOrientConnectionPoolException:
+        pass
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+    stats = pool.stats()
+    assert stats['size'] == 2
+    assert stats['in_use'] == 2
+    assert stats['created'] == 2
+    assert stats['timeouts'] == 1
+
+    pool.release(first)
+    pool.release(second)
+    pool.close()
+
+    assert first.closed and second.closed
+
+
+def fifo_waiters_test():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, timeout=5)
+    connection = pool.acquire()
+
+    served = []
+
+    def worker(name):
+        conn = pool.acquire()
+        served.append(name)
+        pool.release(conn)
+
+    threads = []
+    for name in range(5):
+        thread = Thread(target=worker, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # make sure the threads queue up in order
+        while pool.stats()['waiting'] != name + 1:
+            time.sleep(0.001)
+
+    pool.release(connection)
+
+    for thread in threads:
+        thread.join()
+
+    assert served == [0, 1, 2, 3, 4]
+    assert pool.stats()['waits'] == 5
+
+
+def idle_eviction_test():
+    pool = ConnectionPool(FakeConnection, min_size=1, max_size=3, idle_timeout=0)
+
+    connections = [pool.acquire() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+
+    time.sleep(0.01)
+
+    assert pool.evict_idle() == 2
+    assert pool.stats()['idle'] == 1
+    assert [c.closed for c in connections] == [True, True, False]
+
+
+def failed_connection_test():
+    # nothing listens on port 1, opening the connections fails
+    db = OrientUsDB({'host': '127.0.0.1', 'port': 1, 'db_name': 'test', 'username': 'u', 'password': 'p'})
+
+    try:
+        db.acquire_connection()
+        assert False, 'the connection can not be opened'
+    except PyOrientConnectionException:
+        pass
+
+    # the idle eviction loop keeps running, a later acquire may succeed
+    assert db.keep_running and db.pool_stats()['size'] == 0
+    db.stop()
+
+
+if __name__ == '__main__':
+    bounded_pool_test()
+    fifo_waiters_test()
+    idle_eviction_test()
+    failed_connection_test()
@@ -1,4 +1,4 @@
-from orientus.core.datatypes import OString
+from orientus.core.datatypes import OBoolean, ODatetime, ODouble, OInteger, OString
 from orientus.core.domain import OVertex, OEdge
 
 
@@ -11,3 +11,12 @@ class Token(OVertex):
 class PreviousTokenEdge(OEdge):
     __edge_name__ = 'PreviousTokenEdge'
     pass
+
+
+class Reading(OVertex):
+    ___vertex_name__ = 'Reading'
+    sensor = OInteger(name='sensor')
+    value = ODouble(name='value')
+    valid = OBoolean(name='valid')
+    taken_at = ODatetime(name='taken_at')
+    unit = OString(name='unit')
@@ -0,0 +1,103 @@
+import warnings
+
+from pyorient import OrientRecord
+
+from orientus.core.datatypes import OInteger, OString
+from orientus.core.domain import ORecord, OVertex
+from orientus.core.identity import IdentityMap
+from orientus.core.records import new_record, record_data
+from orientus.core.utils import to_datatype_obj
+from orientus.tests.data import Token, PreviousTokenEdge
+
+
+class SlottedToken(OVertex):
+    ___vertex_name__ = 'SlottedToken'
+    __slots__ = ('text', 'count')
+
+    text = OString(name='text')
+    count = OInteger(name='cnt')
+
+    def __init__(self, text, count):
+        super().__init__()
+        self.text = text
+        self.count = count
+
+
+def make_record(data, rid='#12:0', version=3):
+    return OrientRecord(dict(__o_storage=data, __o_class='Token', __version=version, __rid=rid))
+
+
+def hydrate_test():
+    token, = to_datatype_obj(Token, [make_record({'text': 'to', 'other': 1})])
+
+    assert (token._rid, token._version, token._batch_id) == ('#12:0', 3, None)
+    assert token.text == 'to'
+    # missing columns are left to the class attribute
+    assert token.new_text is Token.new_text
+    assert 'other' not in token.__dict__
+
+
+def hydrate_edge_test():
+    edge, = to_datatype_obj(PreviousTokenEdge, [make_record({})])
+
+    assert edge._from_vertex is None and edge._to_vertex is None
+
+
+def hydrate_slots_test():
+    assert str(SlottedToken.text == 'to') == "text = 'to'"
+    assert {field.column for field in SlottedToken.schema().fields} == {'cnt', 'text'}
+
+    token, = to_datatype_obj(SlottedToken, [make_record({'text': 'to', 'cnt': 2})])
+
+    assert not hasattr(token, '__dict__')
+    assert (token.text, token.count, token._rid) == ('to', 2, '#12:0')
+
+
+def identity_map_test():
+    identity_map = IdentityMap()
+
+    first, same = identity_map.hydrate(Token, [make_record({'text': 'to'}), make_record({'text': 'to'})])
+    assert first is same
+
+    kept = identity_map.hydrate(Token, [make_record({'text': 'ignored'})])[0]
+    assert kept is first and first.text == 'to'
+
+    # a newer version is copied onto the object already loaded
+    changed = identity_map.hydrate(Token, [make_record({'new_text': 'TO'}, version=4)])[0]
+    assert changed is first
+    assert (first._version, first.new_text) == (4, 'TO')
+    assert first.text is Token.text
+
+    identity_map.remove(first)
+    assert identity_map.hydrate(Token, [make_record({'text': 'to'})])[0] is not first
+
+
+def registry_test():
+    # another class mapping the database class of Token doesn't take it over
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+
+        class OtherToken(OVertex):
+            ___vertex_name__ = 'Token'
+
+    assert len(caught) == 1 and 'database class Token is mapped by' in str(caught[0].message)
+    assert ORecord.registry['Token'] is not OtherToken
+
+def record_access_test():
+    data = {'text': 'to'}
+    record = new_record('Token', data, 2, '#12:4')
+
+    assert record_data(record) is data and record.oRecordData is data
+    assert (record._class, record._rid, record._version) == ('Token', '#12:4', 2)
+
+    token, = to_datatype_obj(Token, [record])
+    assert (token.text, token._rid, token._version) == ('to', '#12:4', 2)
+
+
+if __name__ == '__main__':
+    hydrate_test()
+    hydrate_edge_test()
+    hydrate_slots_test()
+    identity_map_test()
+    registry_test()
+    record_access_test()
@@ -0,0 +1,138 @@
+import re
+import time
+from threading import Lock
+
+from pyorient import OrientRecord, PyOrientCommandException
+
+from orientus.core.pool import ConnectionPool
+from orientus.core.query import Query
+from orientus.core.session import Session
+from orientus.tests.batch_session import FakeConnection, FakeDB
+from orientus.tests.data import Token
+
+# Token has the clusters 12 and 13 (empty), its subclass SubToken the cluster 14
+SIZES = {12: 10, 13: 0, 14: 5, 15: 3}
+
+SCHEMA = [{'name': 'V', 'clusterIds': [9]},
+          {'name': 'Token', 'superClass': 'V', 'clusterIds': [12, 13]},
+          {'name': 'SubToken', 'superClasses': ['Token'], 'clusterIds': [14]},
+          {'name': 'Other', 'superClasses': ['V'], 'clusterIds': [15]}]
+
+
+def record(class_name, data, rid='#-1:-1'):
+    return OrientRecord({'__o_storage': data, '__o_class': class_name, '__version': 1, '__rid': rid})
+
+
+class ScanConnection(FakeConnection):
+    """Answers the schema and cluster queries, streams the records of a cluster range with a delay"""
+
+    lock = Lock()
+    active = 0
+    most_active = 0
+    failing = None
+    started = []
+    sent = 0
+
+    def command(self, statement, params=None):
+        self.scripts.append(statement)
+
+        if 'metadata:schema' in statement:
+            return [record('', dict(data)) for data in SCHEMA]
+
+        cluster = int(re.search(r'cluster:(\d+)', statement).group(1))
+        last = SIZES[cluster] - 1
+
+        return [record('Token', {}, '#%s:%s' % (cluster, last))] if last >= 0 else []
+
+    def query_async(self, statement, limit, fetch_plan, callback, params=None):
+        cluster = int(re.search(r'cluster:(\d+)', statement).group(1))
+
+        bounds = [int(link.get_hash().split(':')[1]) for link in params or [] if not isinstance(link, str)]
+        start = bounds.pop(0) if '@rid >=' in statement else 0
+        end = bounds.pop(0) if '@rid <' in statement else SIZES[cluster]
+
+        ScanConnection.started.append(cluster)
+        if cluster == ScanConnection.failing:
+            raise PyOrientCommandException('OCommandExecutionException', [])
+
+        with ScanConnection.lock:
+            ScanConnection.active += 1
+            ScanConnection.most_active = max(ScanConnection.most_active, ScanConnection.active)
+
+        for position in range(start, end):
+            time.sleep(0.002)
+            ScanConnection.sent += 1
+            callback(record('Token', {'text': 't%s.%s' % (cluster, position)}, '#%s:%s' % (cluster, position)))
+
+        with ScanConnection.lock:
+            ScanConnection.active -= 1
+
+
+class ScanDB(FakeDB):
+
+    def __init__(self):
+        super().__init__()
+        self.connection_pool = ConnectionPool(ScanConnection, min_size=0, max_size=5)
+
+
+def partition_statement_test():
+    qry = Query(Token).where(Token.text > 't')
+
+    assert qry._partition(12) == ('SELECT \nFROM cluster:12\nWHERE (text > ?)', ['t'])
+
+    statement, params = qry._partition(12, 5, 10)
+    assert statement == 'SELECT \nFROM cluster:12\nWHERE @rid >= ? AND @rid < ? AND (text > ?)'
+    assert [str(p) for p in params[:2]] == ['#12:5', '#12:10'] and params[2] == 't'
+
+    try:
+        Query(Token).order_by(Token.text)._partition(12)
+        assert False, 'ordered queries are not split'
+    except ValueError:
+        pass
+
+
+def parallel_scan_test():
+    db = ScanDB()
+
+    with Session(db) as session:
+        assert session._clusters(Token) == [12, 13, 14]
+
+        # fewer clusters than workers: the clusters with records are split in two ranges
+        assert session._partitions(Token, 4) == [(12, None, 5), (12, 5, None), (14, None, 3), (14, 3, None)]
+        assert session._partitions(Token, 2) == [(12, None, None), (13, None, None), (14, None, None)]
+
+        scanned = list(session.parallel_scan(Token, workers=4, page_size=2))
+
+        assert sorted(t._rid for t in scanned) == sorted(['#12:%s' % p for p in range(10)] +
+                                                         ['#14:%s' % p for p in range(5)])
+        assert all(isinstance(t, Token) and t._session is session for t in scanned)
+        assert ScanConnection.most_active > 1
+        assert db.connection_pool.stats()['in_use'] == 1
+
+        # stopping early stops the partitions being read (15 records) and discards their connections
+        ScanConnection.sent = 0
+
+        stream = session.parallel_scan(Token, Query(Token).where(Token.text > 't'), workers=2, page_size=1)
+        assert next(stream)._rid
+        stream.close()
+
+        assert ScanConnection.sent < 10
+        assert db.connection_pool.stats()['in_use'] == 1 and db.connection_pool.stats()['closed'] >= 1
+
+        # the partitions queued after a failing one don't start
+        ScanConnection.failing, ScanConnection.started = 12, []
+        try:
+            list(session.parallel_scan(Token, workers=1))
+            assert False, 'a failing partition fails the scan'
+        except PyOrientCommandException:
+            pass
+        finally:
+            ScanConnection.failing = None
+
+        assert ScanConnection.started == [12]
+        assert db.connection_pool.stats()['in_use'] == 1
+
+
+if __name__ == '__main__':
+    partition_statement_test()
+    parallel_scan_test()
@@ -0,0 +1,81 @@
+from pyorient import PyOrientConnectionException, PyOrientSQLParsingException
+
+from orientus.core.db import OrientUs, OrientUsSocket
+from orientus.core.session import Session
+from orientus.tests.async_session import SESSION_ID, error_response, list_response
+from orientus.tests.batch_session import FakeDB
+
+
+class FakeSocket(OrientUsSocket):
+    """Opened connection answering with `responses`, all requests must be written before a response is read"""
+
+    def __init__(self, responses: bytes, session_id=SESSION_ID):
+        super().__init__('localhost', 2424)
+        self.connected = True
+        self.protocol = 26
+        self.session_id = session_id
+        self.db_opened = 'test'
+
+        self.responses = responses
+        self.position = 0
+        self.writes = []
+
+    def write(self, buff):
+        assert self.position == 0, 'requests are written before reading responses'
+        self.writes.append(buff)
+
+    def read(self, size):
+        data = self.responses[self.position:self.position + size]
+        self.position += size
+        return data
+
+
+def pipelined_test():
+    socket = FakeSocket(list_response([b'Token@text:"t0"']) +
+                        error_response(b'OCommandSQLParsingException', b'bad') +
+                        list_response([b'Token@text:"t1"', b'Token@text:"t2"']))
+    connection = OrientUs(socket)
+
+    results = connection.command_many(['select from Token', 'selec from Token',
+                                       ('select from Token where text > ?', ['t0'])], return_exceptions=True)
+
+    # the three requests go out in one write
+    assert len(socket.writes) == 1 and socket.writes[0].count(b'from Token') == 3
+    assert b'parameters' in socket.writes[0]
+
+    assert [r.text for r in results[0]] == ['t0']
+    assert isinstance(results[1], PyOrientSQLParsingException)
+    assert [r.text for r in results[2]] == ['t1', 't2']
+
+    try:
+        OrientUs(FakeSocket(list_response([]), session_id=3)).command_many(['select from Token'])
+        assert False, 'responses of another session are rejected'
+    except PyOrientConnectionException:
+        pass
+
+
+def window_test():
+    socket = FakeSocket(b''.join(list_response([b'Token@text:"t%d"' % i]) for i in range(5)))
+
+    # each window of requests goes out in one write
+    socket.write = socket.writes.append
+    results = OrientUs(socket).command_many(['select from Token'] * 5, window=2)
+
+    assert [w.count(b'select from Token') for w in socket.writes] == [2, 2, 1]
+    assert [r[0].text for r in results] == ['t0', 't1', 't2', 't3', 't4']
+
+
+def session_command_many_test():
+    with Session(FakeDB()) as session:
+        session.connection = OrientUs(FakeSocket(list_response([b'Token@text:"t0"']) +
+                                                 list_response([b'Token@text:"t1"'])))
+
+        first, second = session.command_many(['select from Token', 'select from Token'])
+
+        assert (first[0].text, second[0].text) == ('t0', 't1')
+
+
+if __name__ == '__main__':
+    pipelined_test()
+    window_test()
+    session_command_many_test()
@@ -0,0 +1,119 @@
+import time
+
+from pyorient import OrientRecord
+
+from orientus.core.cache import QueryCache
+from orientus.core.datatypes import inline_params
+from orientus.core.query import Query
+from orientus.core.session import BatchSession, Session
+from orientus.tests.batch_session import FakeDB, tokens
+from orientus.tests.data import PreviousTokenEdge, Token
+
+
+def expiry_test():
+    cache = QueryCache(max_size=2, ttl=0.05)
+
+    cache.put('a', 1, ['Token'])
+    cache.put('b', 2, ['Token'])
+    assert cache.get('a') == 1
+
+    # 'b' is the least recently used
+    cache.put('c', 3, ['PreviousTokenEdge'])
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+
+def invalidation_test():
+    cache = QueryCache()
+
+    cache.put('a', 1, ['Token'])
+    cache.put('b', 2, ['Token', 'PreviousTokenEdge'])
+    cache.put('c', 3, ['Other'])
+
+    assert cache.invalidate(['PreviousTokenEdge']) == 1
+    assert cache.invalidate(['Token']) == 1
+    assert cache.get('c') == 3
+
+    # a result read before a write isn't cached after it
+    stamp = cache.stamp(['Token'])
+    cache.invalidate(['Token'])
+    cache.put('d', 4, ['Token'], stamp)
+    assert cache.get('d') is None
+
+    cache.put('d', 4, ['Token'], cache.stamp(['Token']))
+    assert cache.get('d') == 4
+
+
+def session_cache_test():
+    db = FakeDB()
+    query = Query(Token).where(Token.text == 'to')
+
+    with Session(db) as session:
+        session.query(query, cache=True)
+        session.query(query, cache=True)
+        session.query(Query(Token).where(Token.text == 'TO'), cache=True)
+        session.query(query)
+
+        assert len(session.connection.scripts) == 3
+        assert db.query_cache.hits == 1
+
+        # saving an edge touches the classes of its endpoints too
+        saved = tokens(2)
+        for i, token in enumerate(saved):
+            token._rid = '#12:%s' % i
+        session.save(PreviousTokenEdge(saved[0], saved[1]))
+
+        assert len(db.query_cache) == 0
+
+
+def cached_copies_test():
+    db = FakeDB()
+    query = Query(Token).where(Token.text == 'to')
+
+    db.query_cache.put(inline_params(query._done(), query.params), [OrientRecord({
+        '__o_storage': {'text': 'to', 'new_text': ['t', 'o']}, '__o_class': 'Token', '__version': 1,
+        '__rid': '#12:0'})], ['Token'])
+
+    with Session(db) as session:
+        token, = session.query(query, cache=True)
+        token.new_text.append('!')
+
+        # sessions don't see each other's changes through the cache
+        with Session(db) as other:
+            assert other.query(query, cache=True)[0].new_text == ['t', 'o']
+
+        # and a change in place is a change
+        session.update(token)
+        assert session.connection.scripts == ['update Token set new_text = ? where @rid = ?']
+
+        token.new_text.append('?')
+        session.update(token)
+        assert len(session.connection.scripts) == 2
+
+
+def batch_cache_test():
+    db = FakeDB()
+    query = Query(Token).where(Token.text == 'to')
+
+    with Session(db) as session:
+        session.query(query, cache=True)
+
+    # the save fills the chunk, it's sent before the written class is noted
+    with BatchSession(db, max_statements=1) as session:
+        session.start_batch()
+        session.save(tokens(1)[0])
+        session.end_batch()
+
+    assert len(db.query_cache) == 0
+
+
+if __name__ == '__main__':
+    expiry_test()
+    invalidation_test()
+    session_cache_test()
+    cached_copies_test()
+    batch_cache_test()
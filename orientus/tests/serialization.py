@@ -0,0 +1,109 @@
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+from pyorient import OrientRecordLink, OrientSerialization
+
+from orientus.core.db import OrientUs
+from orientus.core.messages import decode_ridbag, encode_params
+from orientus.core.serialization import BinaryRecordSerializer, LINKBAG, STRING, encode_record, global_properties
+from orientus.core.utils import to_datatype_obj
+from orientus.tests.async_session import list_response
+from orientus.tests.data import Token
+from orientus.tests.pipelining import FakeSocket
+
+
+def roundtrip_test():
+    data = {'text': 'héllo', 'count': -300, 'big': 2 ** 40, 'ratio': 1.5, 'valid': True, 'missing': None,
+            'at': datetime(2020, 1, 2, 3, 4, 5, 6000), 'day': date(2021, 5, 6), 'price': Decimal('-12.345'),
+            'list': [1, 'a', None, [2]], 'map': {'x': 1, 'y': None, 'z': {'q': 'w'}}, 'raw': b'\x00\x01'}
+
+    class_name, decoded = BinaryRecordSerializer().decode(encode_record(dict(data, link=OrientRecordLink('12:3')),
+                                                                        'Token'))
+
+    assert class_name == 'Token'
+    assert str(decoded.pop('link')) == '#12:3'
+    assert decoded == data
+
+
+def property_record() -> bytes:
+    """Token record with new_text stored as the global property 0 and text by name"""
+    # fields of schema properties are stored by global property id: -(id + 1) instead of the name length
+    content = bytearray(b'\x00\x0aToken')
+    content += b'\x01' + struct.pack('>i', 0)
+    content += b'\x08text' + struct.pack('>i', 0) + bytes([STRING]) + b'\x00'
+
+    struct.pack_into('>i', content, 8, len(content))
+    content += b'\x04to'
+    struct.pack_into('>i', content, 17, len(content))
+    content += b'\x04TO'
+
+    return bytes(content)
+
+
+def global_property_test():
+    props = global_properties([{'id': 0, 'name': 'new_text', 'type': 'STRING'}])
+
+    assert BinaryRecordSerializer(props).decode(property_record()) == ['Token', {'new_text': 'to', 'text': 'TO'}]
+
+
+def ridbag_test():
+    bag = b'\x01' + struct.pack('>i', 2) + struct.pack('>hq', 13, 0) + struct.pack('>hq', 13, 5)
+
+    content = bytearray(b'\x00\x00\x2aout_PreviousTokenEdge') + struct.pack('>i', 0) + bytes([LINKBAG]) + b'\x00'
+    struct.pack_into('>i', content, 24, len(content))
+    content += bag
+
+    _, data = BinaryRecordSerializer().decode(bytes(content))
+
+    assert decode_ridbag(data['out_PreviousTokenEdge']) == ['#13:0', '#13:5']
+
+
+def binary_connection_test():
+    contents = [encode_record({'text': 't%s' % i, 'new_text': 'T%s' % i}, 'Token') for i in range(3)]
+
+    socket = FakeSocket(list_response(contents))
+    socket.serialization_type = OrientSerialization.Binary
+    socket._props = {}
+
+    records = OrientUs(socket).query('select from Token where text > ?', params=['t'])
+    tokens = to_datatype_obj(Token, records)
+
+    assert [(t._rid, t.text, t.new_text) for t in tokens] == [('#12:0', 't0', 'T0'), ('#12:1', 't1', 'T1'),
+                                                               ('#12:2', 't2', 'T2')]
+
+    # bound parameters are serialized as the records
+    assert encode_params('params', ['t'], binary=True) in socket.writes[0]
+
+
+class SequentialSocket(FakeSocket):
+    """FakeSocket answering one request after the other"""
+
+    def write(self, buff):
+        self.writes.append(buff)
+
+
+def schema_change_test():
+    schema = encode_record({'globalProperties': [{'id': 0, 'name': 'new_text', 'type': 'STRING'}]})
+
+    socket = SequentialSocket(list_response([]) + list_response([schema]) + list_response([property_record()]))
+    socket.serialization_type = OrientSerialization.Binary
+
+    # the properties of the database's connections
+    shared = {}
+    socket._props = shared
+
+    connection = OrientUs(socket)
+    connection.command('create property Token.new_text STRING')
+
+    assert b'select from #0:1' in socket.writes[1]
+    assert shared == {0: ('new_text', STRING)}
+    assert connection.query('select from Token')[0].new_text == 'to'
+
+
+if __name__ == '__main__':
+    roundtrip_test()
+    global_property_test()
+    ridbag_test()
+    binary_connection_test()
+    schema_change_test()
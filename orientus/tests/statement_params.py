@@ -0,0 +1,68 @@
+from orientus.core.datatypes import OString, inline_params
+from orientus.core.domain import OVertex
+from orientus.core.messages import encode_params
+from orientus.core.query import Query
+from orientus.core.schema import Index, IndexType
+from orientus.tests.data import Token
+
+
+def clause_params_test():
+    clause = (Token.text == "don't") | (Token.new_text != None) & (Token.text > Token.new_text)
+
+    assert clause.expression == "(text = ? OR (new_text IS NOT NULL AND text > new_text))"
+    assert clause.params == ["don't"]
+    assert str(clause) == "(text = 'don\\'t' OR (new_text IS NOT NULL AND text > new_text))"
+
+
+def query_params_test():
+    query = Query(Token).where((Token.text == 'to') & (Token.new_text == 'TO')).limit(10)
+
+    assert query._done() == "SELECT \nFROM Token\nWHERE (text = ? AND new_text = ?)\nLIMIT 10"
+    assert query.params == ['to', 'TO']
+
+
+def keyset_page_test():
+    query = Query(Token).where((Token.text == 'to') | (Token.text == 'TO')).skip(5).limit(100)
+
+    statement, params = query._page('#12:7', 10)
+
+    assert statement == "SELECT \nFROM Token\nWHERE @rid > ? AND ((text = ? OR text = ?))\nLIMIT 10"
+    assert [str(params[0]), params[1], params[2]] == ['#12:7', 'to', 'TO']
+    assert query._limit() == 100
+    assert "SKIP 5" in query._page('#-1:-1', 10, first=True)[0]
+
+
+def inline_params_test():
+    assert inline_params("a = ? AND b = '?' AND c = ?", ['x', 3]) == "a = 'x' AND b = '?' AND c = 3"
+
+
+def encode_params_test():
+    assert encode_params('params', ['a"b', 5, True, None]) == b'params:{"0":"a\\"b","1":5,"2":true,"3":}'
+    assert encode_params('parameters', {'name': 2.5}) == b'parameters:{"name":2.5d}'
+
+
+class Word(OVertex):
+    ___vertex_name__ = 'Word'
+
+    text = OString(name='text')
+    lang = OString(name='lang')
+
+    __indexes__ = (Index(text, lang, type=IndexType.UNIQUE_HASH_INDEX),
+                   Index(text, type=IndexType.FULLTEXT_LUCENE, name='Word_search'))
+
+
+def index_statement_test():
+    unique, search = Word.schema().indexes
+
+    assert unique.statement('Word') == "CREATE INDEX Word_text_lang ON Word (text, lang) UNIQUE_HASH_INDEX"
+    assert search.statement('Word') == "CREATE INDEX Word_search ON Word (text) FULLTEXT ENGINE LUCENE"
+    assert [field.attr for field in Word.schema().unique_fields] == ['text', 'lang']
+
+
+if __name__ == '__main__':
+    clause_params_test()
+    query_params_test()
+    keyset_page_test()
+    inline_params_test()
+    encode_params_test()
+    index_statement_test()
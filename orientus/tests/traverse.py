@@ -0,0 +1,89 @@
+from pyorient import OrientRecord
+
+from orientus.core.domain import OVertex
+from orientus.core.pool import ConnectionPool
+from orientus.core.session import Session
+from orientus.core.traverse import Strategy, Traverse
+from orientus.tests.batch_session import FakeConnection, FakeDB, tokens
+from orientus.tests.data import PreviousTokenEdge, Token
+
+
+class StreamConnection(FakeConnection):
+    """Sends `count` Token records to the async query callback"""
+
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+        self.sent = 0
+
+    def query_async(self, statement, limit, fetch_plan, callback, params=None):
+        self.scripts.append((statement, params))
+
+        for position in range(self.count):
+            self.sent += 1
+            callback(OrientRecord({'__o_storage': {'text': 't%s' % position}, '__o_class': 'Token',
+                                   '__version': 1, '__rid': '#12:%s' % position}))
+
+
+def traverse_statement_test():
+    start = tokens(2)
+    start[0]._rid, start[1]._rid = '#12:0', '#12:1'
+
+    traverse = Traverse(start).out(PreviousTokenEdge).inE().while_(OVertex.depth < 3) \
+        .strategy(Strategy.BREADTH_FIRST)
+
+    assert traverse._done() == "TRAVERSE out('PreviousTokenEdge'), inE()\nFROM [#12:0, #12:1]\n" \
+                               "WHILE $depth < ?\nSTRATEGY BREADTH_FIRST"
+    assert traverse.params == [3]
+
+    assert Traverse(Token).both().max_depth(2).limit(10)._done() == \
+        "TRAVERSE both()\nFROM Token\nMAXDEPTH 2\nLIMIT 10"
+
+    try:
+        Traverse(Token).max_depth(2).while_(OVertex.depth < 3)._done()
+        assert False, 'MAXDEPTH and WHILE exclude each other'
+    except ValueError:
+        pass
+
+
+class StreamDB(FakeDB):
+
+    def __init__(self, count):
+        super().__init__()
+        self.connections = []
+        self.connection_pool = ConnectionPool(lambda: self._connect(count), min_size=0, max_size=4)
+
+    def _connect(self, count):
+        self.connections.append(StreamConnection(count))
+        return self.connections[-1]
+
+
+def stream_test():
+    db = StreamDB(2500)
+
+    with Session(db) as session:
+        visited = list(session.iter_traverse(Traverse(Token).out(), page_size=1000))
+
+        assert len(visited) == 2500
+        assert visited[-1].text == 't2499' and isinstance(visited[0], Token)
+
+        # the records are read on a pooled connection, the session's own one stays free
+        assert session.connection.scripts == []
+        assert db.connection_pool.stats()['idle'] == 1
+
+        stream = session.iter_traverse(Traverse(Token).out(), page_size=10)
+        assert next(stream).text == 't0'
+        session.command('select from Token')
+        assert session.connection.scripts == ['select from Token']
+
+        # stopping early stops reading, the connection left in the middle of the response is discarded
+        stream.close()
+
+        _, reader = db.connections
+        assert reader.sent < 2500 + 100
+        assert db.connection_pool.stats()['closed'] == 1 and db.connection_pool.stats()['in_use'] == 1
+
+
+if __name__ == '__main__':
+    traverse_statement_test()
+    stream_test()